@@ -0,0 +1,225 @@
+"""
+Benchmarks of the build pipeline on a generated corpus.
+
+Each benchmark runs in its own process, so the peak memory (max RSS) is not
+mixed up with the other benchmarks. The corpus is generated once per size and
+seed (see `corpus.py`) and reused.
+
+    python bench/bench_build.py [--sizes 1000,10000,100000] [--repeat 3] [--jobs 1]
+                                [--json result.json] [--compare previous.json]
+                                [--max-rss 448]
+
+With --max-rss, the run fails if the peak memory of a benchmark exceeds the
+budget (in MB). A build keeps a small record per article and caches bounded
+by size, so a 100k-article archive is expected to fit in 448 MB.
+
+Benchmarks:
+  parse         Article.read of every source (metadata and body blocks)
+  decorate      Decorate.decorate of every paragraph
+  paragraphize  Article._paragraphize of the blocks of every section (includes decorate)
+  render        read + render (excerpt and see-more HTML) of every article
+  build         full build into an empty output and cache directory
+  noop          build again with nothing changed (incremental)
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess  # nosec B404
+import sys
+import time
+from typing import Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'nemulow'))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate  # noqa: E402
+
+BENCHMARKS = ['parse', 'decorate', 'paragraphize', 'render', 'build', 'noop']
+
+
+def _best(func: Callable[[], None], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _read_all(paths: List[str]):
+    from article import Article
+
+    articles = []
+    for path in paths:
+        article = Article(path)
+        article.read()
+        articles.append(article)
+    return articles
+
+
+def _build(work_dir: str, corpus_dir: str, jobs: int):
+    from main import Nemulow
+
+    os.environ.update({
+        'ARTICLE_DIR': corpus_dir,
+        'TEMPLATE_DIR': os.path.join(ROOT_DIR, 'example', 'templates'),
+        'OUTPUT_DIR': os.path.join(work_dir, 'www'),
+        'CACHE_DIR': os.path.join(work_dir, '.nemulow'),
+    })
+    Nemulow(os.devnull).build(jobs=jobs)
+
+
+def run_one(name: str, corpus_dir: str, work_dir: str, count: int, seed: int,
+            repeat: int, jobs: int) -> Dict[str, float]:
+    """
+    Run one benchmark in this process and return its numbers.
+    """
+    paths = generate(corpus_dir, count, seed)
+    size = sum(os.path.getsize(path) for path in paths)
+
+    if name == 'parse':
+        seconds = _best(lambda: _read_all(paths), repeat)
+    elif name == 'decorate':
+        from article import _decorator
+
+        paragraphs = [
+            text
+            for article in _read_all(paths)
+            for _, text in article.article + article.see_more
+        ]
+        seconds = _best(lambda: [_decorator.decorate(p) for p in paragraphs], repeat)
+    elif name == 'paragraphize':
+        articles = _read_all(paths)
+        seconds = _best(
+            lambda: [(a._paragraphize(a.article), a._paragraphize(a.see_more)) for a in articles],
+            repeat,
+        )
+    elif name == 'render':
+        seconds = _best(lambda: [article.render() for article in _read_all(paths)], repeat)
+    elif name == 'build':
+        def cold_build():
+            shutil.rmtree(work_dir, ignore_errors=True)
+            _build(work_dir, corpus_dir, jobs)
+        seconds = _best(cold_build, repeat)
+    elif name == 'noop':
+        if not os.path.isdir(os.path.join(work_dir, '.nemulow')):
+            raise SystemExit('noop needs the output of the build benchmark')
+        seconds = _best(lambda: _build(work_dir, corpus_dir, jobs), repeat)
+    else:
+        raise SystemExit(f'unknown benchmark: {name}')
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    return {
+        'benchmark': name,
+        'articles': count,
+        'seconds': round(seconds, 6),
+        'articles_per_s': round(count / seconds, 1) if seconds else 0.0,
+        'mb_per_s': round(size / seconds / 1e6, 2) if seconds else 0.0,
+        'peak_rss_mb': round(max_rss / 1e6, 1),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(  # nosec B603 B607
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _print_result(result: Dict[str, float], previous: Dict[tuple, float]):
+    line = (
+        f'{result["benchmark"]:<14}{result["articles"]:>9}{result["seconds"]:>11.3f}'
+        f'{result["articles_per_s"]:>11.0f}{result["mb_per_s"]:>9.2f}'
+        f'{result["peak_rss_mb"]:>9.1f}'
+    )
+    before = previous.get((result['benchmark'], result['articles']))
+    if before:
+        # > 1 means faster than the previous run
+        line += f'  {before / result["seconds"]:.2f}x'
+    print(line, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000',
+                        help='comma-separated corpus sizes (default: 1000)')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=1, help='processes of the build benchmarks')
+    parser.add_argument('--work-dir', default=os.path.join(BENCH_DIR, '.work'))
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results of a previous run (--json) to compare with')
+    parser.add_argument('--max-rss', type=float,
+                        help='fail if a benchmark peaks above this many MB')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--count', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        corpus_dir = os.path.join(args.work_dir, f'corpus-{args.count}-{args.seed}')
+        work_dir = os.path.join(args.work_dir, f'site-{args.count}-{args.seed}')
+        result = run_one(args.run_one, corpus_dir, work_dir, args.count, args.seed,
+                         args.repeat, args.jobs)
+        print(json.dumps(result))
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = {
+                (r['benchmark'], r['articles']): r['seconds'] for r in json.load(file)['results']
+            }
+
+    print(f'{"benchmark":<14}{"articles":>9}{"seconds":>11}{"art/s":>11}'
+          f'{"MB/s":>9}{"peak MB":>9}  speedup')
+    results = []
+    for count in [int(size) for size in args.sizes.split(',')]:
+        generate(os.path.join(args.work_dir, f'corpus-{count}-{args.seed}'), count, args.seed)
+        for name in args.benchmarks.split(','):
+            output = subprocess.run(  # nosec B603
+                [sys.executable, __file__, '--run-one', name, '--count', str(count),
+                 '--seed', str(args.seed), '--repeat', str(args.repeat),
+                 '--jobs', str(args.jobs), '--work-dir', args.work_dir],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+            _print_result(results[-1], previous)
+
+    over = [
+        result for result in results
+        if args.max_rss is not None and result['peak_rss_mb'] > args.max_rss
+    ]
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'jobs': args.jobs,
+                'results': results,
+            }, file, indent=2)
+
+    for result in over:
+        print(f'{result["benchmark"]} ({result["articles"]} articles) peaked at '
+              f'{result["peak_rss_mb"]} MB, over the budget of {args.max_rss} MB', file=sys.stderr)
+    if over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
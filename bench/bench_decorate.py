@@ -0,0 +1,88 @@
+"""
+Micro-benchmark for the inline decorator.
+
+Compares the single-pass engine in `nemulow/decorate.py` with the former chain of
+`re.sub` calls and reports the throughput per MB of source.
+
+    python bench/bench_decorate.py [--size-mb 4] [--repeat 5]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from decorate import Decorate  # noqa: E402
+
+SAMPLE = (
+    '　リモコンを手に取るたびに思うことがある。**ボタンの数**が多すぎるのだ。\n'
+    '　電源、音量、チャンネル、入力切替。このあたりは*確実に*使う。\n'
+    '　`power` と ~~色ボタン~~ の[格差](https://example.com/remote)は広がるばかりだ。\n'
+    '\n'
+    '### ボタンたちの世界\n'
+    '　押されることで存在意義を果たす。押されないボタンは、ただ静かに時を過ごすのだ。\n'
+    '\n'
+)
+
+
+def legacy_decorate(content: str) -> str:
+    """
+    The former implementation: one `re.sub` pass per rule.
+    """
+    content = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content)
+    content = re.sub(r'\*(.*?)\*', r'<em>\1</em>', content)
+    content = re.sub(r'`(.*?)`', r'<code>\1</code>', content)
+    content = re.sub(r'~~(.*?)~~', r'<del>\1</del>', content)
+    content = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', content)
+    content = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', r'<img src="\2" alt="\1">', content)
+    content = re.sub(r'^#### +(.*?)$', r'<h4>\1</h4>', content, flags=re.MULTILINE)
+    content = re.sub(r'^### +(.*?)$', r'<h3>\1</h3>', content, flags=re.MULTILINE)
+    return content
+
+
+def make_paragraphs(size_mb: float):
+    """
+    Build a list of paragraphs of roughly `size_mb` MB (UTF-8).
+    """
+    chunk = len(SAMPLE.encode('utf-8'))
+    count = max(1, int(size_mb * 1024 * 1024 / chunk))
+    return [paragraph for _ in range(count) for paragraph in SAMPLE.split('\n\n') if paragraph]
+
+
+def measure(func, paragraphs, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for paragraph in paragraphs:
+            func(paragraph)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=4.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paragraphs = make_paragraphs(args.size_mb)
+    size_mb = sum(len(p.encode('utf-8')) for p in paragraphs) / (1024 * 1024)
+    decorator = Decorate()
+
+    for paragraph in paragraphs[:3]:
+        assert decorator.decorate(paragraph) == legacy_decorate(paragraph)
+
+    legacy = measure(legacy_decorate, paragraphs, args.repeat)
+    single = measure(decorator.decorate, paragraphs, args.repeat)
+
+    print(f'source: {size_mb:.2f} MB in {len(paragraphs)} paragraphs (best of {args.repeat})')
+    print(f'legacy chain : {legacy / size_mb * 1000:8.1f} ms/MB')
+    print(f'single pass  : {single / size_mb * 1000:8.1f} ms/MB')
+    print(f'speedup      : {legacy / single:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Seeded generator of Nemulow v1 sources for benchmarks.
+
+The same seed always gives the same corpus, so numbers measured on different
+commits are comparable. The sources use every construct of the language:
+metadata, "## article" / "## see more", quotes, alignment, headings,
+horizontal rules, inline decorations, colors, marks, comments (also spanning
+lines), html paragraphs and Japanese text.
+
+    python bench/corpus.py DIRECTORY [--count 1000] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+SENTENCES = [
+    'リモコンを手に取るたびに思うことがある。',
+    'ボタンの数が多すぎるのだ。',
+    'パンの厚みについて考えると、夜が明けてしまう。',
+    '朝の光がカーテンの隙間から差し込んでくる。',
+    '猫は今日も窓辺で丸くなっている。',
+    'コーヒーを淹れる手順には、それぞれの流儀がある。',
+    '駅までの道のりは、思ったよりも長かった。',
+    'The quick brown fox jumps over the lazy dog.',
+    '結局のところ、答えは最初から決まっていたのかもしれない。',
+    '雨の日には、古い本を読み返したくなる。',
+    '電源、音量、チャンネル、入力切替。このあたりは確実に使う。',
+    '押されないボタンは、ただ静かに時を過ごすのだ。',
+]
+WORDS = ['ボタン', '厚切り', '八枚切り', 'トースト', '猫', '珈琲', 'power', '格差', '夕暮れ', '本棚']
+LABELS = ['雑記', '食べ物', '家電', '猫', '読書', '旅行', '日記', 'プログラミング']
+COLORS = ['green', 'red', 'blue', '#FF8800', '#336699']
+MARKS = ['yellow', 'green', 'pink', 'red', 'blue', 'orange']
+
+
+def _inline(rng: random.Random) -> str:
+    word = rng.choice(WORDS)
+    return rng.choice([
+        f'**{word}**',
+        f'*{word}*',
+        f'***{word}***',
+        f'`{word}`',
+        f'~~{word}~~',
+        f'[{word}](https://example.com/{rng.randrange(1000)})',
+        f'![{word}](/images/{rng.randrange(1000)}.jpg)',
+        f'<color {rng.choice(COLORS)}>{word}</color>',
+        f'<mark {rng.choice(MARKS)}>{word}</mark>',
+        f'<!-- {word} -->',
+    ])
+
+
+def _sentence(rng: random.Random) -> str:
+    sentence = rng.choice(SENTENCES)
+    if rng.random() < 0.5:
+        cut = rng.randrange(len(sentence))
+        sentence = sentence[:cut] + _inline(rng) + sentence[cut:]
+    return sentence
+
+
+def _paragraph(rng: random.Random) -> List[str]:
+    kind = rng.random()
+    if kind < 0.55:
+        return ['　' + ''.join(_sentence(rng) for _ in range(rng.randint(1, 3)))
+                for _ in range(rng.randint(1, 4))]
+    if kind < 0.62:
+        return [f'### {rng.choice(WORDS)}について']
+    if kind < 0.66:
+        return [f'#### {rng.choice(WORDS)}']
+    if kind < 0.72:
+        return ['"""', _sentence(rng), _sentence(rng), '"""']
+    if kind < 0.77:
+        return ['>><<' + _sentence(rng)]
+    if kind < 0.82:
+        return ['>>>>' + _sentence(rng)]
+    if kind < 0.85:
+        return ['---']
+    if kind < 0.90:
+        return ['<!--', _sentence(rng), _sentence(rng), '-->']
+    if kind < 0.95:
+        return [f'<div class="embed">{_sentence(rng)}</div>']
+    return [' <span>' + _sentence(rng) + '</span>']
+
+
+def _section(rng: random.Random, paragraphs: int) -> List[str]:
+    lines: List[str] = []
+    for _ in range(paragraphs):
+        lines += _paragraph(rng)
+        lines.append('')
+    return lines
+
+
+def article_source(rng: random.Random, number: int) -> Tuple[str, str]:
+    """
+    Return (filename, text) of one random Nemulow v1 source.
+    """
+    year = rng.randint(2000, 2025)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    title = rng.choice(WORDS) + rng.choice(['の話', 'について', 'をめぐる思索', '日和'])
+    filename = f'{year}{month:02d}{day:02d}_{title}{number}.md'
+
+    lines = ['# nemulow v1', '', f'* filename: article-{number}']
+    lines.append('* labels: ' + ', '.join(rng.sample(LABELS, rng.randint(1, 3))))
+    lines.append(f'* summary: {_sentence(rng)}')
+    if rng.random() < 0.5:
+        lines.append(f'* card_image: /images/card-{number}.jpg')
+    if rng.random() < 0.3:
+        lines.append(f'* updated_at: {year}-{month:02d}-{day:02d}T12:00:00+09:00')
+    lines += ['', '## article', '']
+    lines += _section(rng, rng.randint(2, 6))
+    if rng.random() < 0.7:
+        lines += ['## see more', '']
+        lines += _section(rng, rng.randint(3, 15))
+    return filename, '\n'.join(lines)
+
+
+def generate(directory: str, count: int, seed: int = 0) -> List[str]:
+    """
+    Write `count` sources to `directory` and return their paths.
+    A corpus already generated there with the same count and seed is reused.
+    """
+    marker = os.path.join(directory, '.corpus')
+    stamp = f'{count} {seed}'
+    paths_file = os.path.join(directory, '.paths')
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as file:
+            if file.read() == stamp:
+                with open(paths_file, encoding='utf-8') as names:
+                    return [os.path.join(directory, name) for name in names.read().splitlines()]
+
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.md'):
+            os.remove(entry.path)
+    rng = random.Random(seed)
+    paths = []
+    for number in range(count):
+        filename, text = article_source(rng, number)
+        path = os.path.join(directory, filename)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        paths.append(path)
+    with open(paths_file, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(os.path.basename(path) for path in paths))
+    with open(marker, 'w', encoding='utf-8') as file:
+        file.write(stamp)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = generate(args.directory, args.count, args.seed)
+    print(f'{len(paths)} articles in {args.directory}')
+
+
+if __name__ == '__main__':
+    main()
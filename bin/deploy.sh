@@ -17,12 +17,19 @@ cat ./.env | perl -lne 'print "export $1=\"$2\"" if ( /^([^=\s]+)\s*=\s*(.*)$/ )
 # 環境変数を読み込む
 source $temp_dir/.env
 
-# index.html より新しいファイルの tar ball を作る
-# 新しい記事を追加すれば、かならず index.html も更新される
-# (ただし、CSSやJavaScript を買えたときは動作しない……)
+# 前回のデプロイ (.deployed の時刻) より新しいファイルの tar ball を作る (初回はすべて)
+# 内容が変わらないファイルは書き直されないので、変更したファイルだけが入る
+# ASSET_DIR の CSS・JavaScript・画像は内容が変わると名前も変わるので、それも含まれる
+# (キャッシュさせるヘッダーはサーバ側で設定すること。README を参照)
+touch $temp_dir/.deployed
 timestamp=$(date +%Y%m%d%H%M%S)
 tarball=$temp_dir/html.${timestamp}.tar.gz
-tar zcvf --newer-file $WWW_ROOT/index.html $tarball -C $WWW_ROOT .
+if [ -f ./.deployed ]; then
+    (cd $WWW_ROOT && find . -type f -newer "$OLDPWD/.deployed") > $temp_dir/files
+else
+    (cd $WWW_ROOT && find . -type f) > $temp_dir/files
+fi
+tar zcvf $tarball -C $WWW_ROOT -T $temp_dir/files
 
 # 変更したファイルの tar ball とサーバ側デプロイ用スクリプトを転送
 # .env ファイルも転送する
@@ -31,6 +38,9 @@ scp -r $tarball ./bin/$server_side_deploy_script $temp_dir/.env $SERVER_NAME:/tm
 # サーバ側デプロイ用スクリプトの実行と削除
 ssh $SERVER_NAME "bash -eu /tmp/$server_side_deploy_script; rm -rf /tmp/$server_side_deploy_script"
 
+# 次回は今回のデプロイより新しいファイルだけを送る
+mv $temp_dir/.deployed ./.deployed
+
 # ローカル側の一時ディレクトリを削除
 # trap で正常終了時と異常終了時の両方で削除するようにする
 trap "rm -rf $temp_dir" EXIT ERR
@@ -6,11 +6,101 @@ Specifications for this module are defined in the SPEC.md file.
 
 """
 
+import io
 import os
 import re
-from typing import List
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
+import stats
+from blocks import CENTER, HEADING, HR, HTML, QUOTE, RIGHT, Block, BodyParser
 from decorate import Decorate
+from manifest import BuildManifest
+
+# the inline rules are compiled once and shared by all articles
+_decorator = Decorate()
+
+
+class ArticleSummary:
+    """
+    Small per-article record used to assemble index, list and feed pages
+    without parsing the article again.
+
+    Large archives keep one per article in memory, so the record is slotted:
+    the date is stored as an integer (YYYYMMDD), the strings which repeat
+    between articles are interned, and the rendered fragments (the text
+    summary included) stay in the fragment cache under `key`.
+    """
+
+    __slots__ = ('day', 'title', 'path', 'labels', 'card_image', 'updated_at', 'key', 'has_more')
+
+    # order of the items of a record (see __iter__)
+    FIELDS = ('date', 'title', 'path', 'labels', 'card_image', 'updated_at', 'key', 'has_more')
+
+    def __init__(
+        self,
+        date: Union[str, int],
+        title: str,
+        path: str,
+        labels: str = '',
+        card_image: str = '',
+        updated_at: str = '',
+        key: str = '',
+        has_more: bool = False,
+    ):
+        self.day = int(date) if date else 0
+        self.title = title
+        self.path = path
+        self.labels = sys.intern(labels)
+        self.card_image = sys.intern(card_image)
+        self.updated_at = sys.intern(updated_at)
+        # content key of the rendered fragments (see fragments.py)
+        self.key = key
+        self.has_more = bool(has_more)
+
+    @property
+    def date(self) -> str:
+        """
+        The date as in the source filename, e.g. "20250824".
+        """
+        return f'{self.day:08d}' if self.day else ''
+
+    @classmethod
+    def from_record(cls, record: Union['ArticleSummary', Iterable[Any]]) -> 'ArticleSummary':
+        """
+        Return the summary of a saved record (the list of its items).
+        """
+        if isinstance(record, cls):
+            return record
+        return cls(*record)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Return the items by name, e.g. for a template context.
+        """
+        return dict(zip(self.FIELDS, self))
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter((
+            self.date, self.title, self.path, self.labels, self.card_image,
+            self.updated_at, self.key, self.has_more,
+        ))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ArticleSummary):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        items = ', '.join(f'{name}={value!r}' for name, value in zip(self.FIELDS, self))
+        return f'ArticleSummary({items})'
+
+    def __reduce__(self):
+        # rebuilt with __init__, so the strings are interned in the receiving process
+        return ArticleSummary, tuple(self)
 
 
 class Article:
@@ -18,11 +108,21 @@ class Article:
     Article class representing a blog article.
     """
 
-    def __init__(self, src_filename: str):
+    # bump this when the output of `read` or `render` changes (used for cache keys)
+    VERSION = '2'
+
+    __slots__ = (
+        'src_filename', 'title', 'date', 'metadata', 'article', 'see_more',
+        'dest_path', 'dst_path', 'dst_filename', 'html', '_body_offset',
+    )
+
+    def __init__(self, src_filename: str, dest_path: str = '.'):
         """
         Initialize the Article instance with a filename.
+        `dest_path` is the directory of the pages (DEST_PATH), see `dst_filename`.
         """
         self.src_filename: str = src_filename
+        self.dest_path: str = dest_path or '.'
         self.title: str = ''
         self.date: str = ''
         self.metadata: dict = {
@@ -32,121 +132,201 @@ class Article:
             'card_image': None,
             'labels': '',
         }
-        self.article: List[str] = []
-        self.see_more: List[str] = []
+        # blocks of the article and see-more sections (see blocks.py)
+        self.article: List[Block] = []
+        self.see_more: List[Block] = []
+        self.dst_path: str = ''
+        self.dst_filename: str = ''
+        self.html: Optional[Tuple[str, str]] = None
+        # position of the body in the source while it is not read yet
+        self._body_offset: Optional[int] = None
 
-    def read(self) -> bool:
+    def read(self, lazy: bool = False, text: Optional[str] = None) -> bool:
         """
         Read the article file and store its raw content.
+        Returns False if the file is not a Nemulow language source.
+
+        With `lazy`, reading stops at the "## article" line; only the metadata
+        is available until the body is needed (see `read_body`). This is for
+        callers which only need the metadata; the others read in one pass.
+        With `text`, the content already read from the file is parsed instead.
         """
+        if not self._read_filename():
+            return False
 
-        # get date and title from the source filename
-        # e.g. 20230101-sample-article.md -> date: 20230101, title: sample-article
-        match = re.match(r'^(\d{8})-(.*?)\.md$', os.path.basename(self.src_filename))
-        if match:
-            self.date, self.title = match.groups()
-            match = re.match(r'^(\d{4})(\d{2})(\d{2})$', self.date)
-            if match:
-                # used for destination filename
-                year, month, day = match.groups()
-            else:
-                return False
+        if text is not None:
+            source: TextIO = io.StringIO(text, newline=None)
         else:
+            source = open(self.src_filename, 'r', encoding='utf-8')
+        with source as file:
+            # the first line must be the signature (e.g. "# nemulow v1")
+            if not file.readline().startswith('# nemulow'):
+                return False
+            self._read_metadata(file)
+            if not lazy:
+                self._read_body(file)
+        self._set_destination()
+        return True
+
+    def _read_filename(self) -> bool:
+        """
+        Get the date and title from the source filename.
+        Returns False if the filename does not have them.
+        """
+        # e.g. 20230101_sample-article.md -> date: 20230101, title: sample-article
+        match = re.match(r'^(\d{8})[-_](.*?)\.md$', os.path.basename(self.src_filename))
+        if not match:
             return False
+        self.date, self.title = match.groups()
+        return True
 
-        mode = ''
-        with open(self.src_filename, 'r', encoding='utf-8') as file:
-            for line in file.readlines():
-                line = line.rstrip('\n')
-                if line.startswith('# '):
-                    mode = 'metadata'
-                    continue
-                elif line.startswith('## article'):
-                    mode = 'article'
-                    continue
-                elif line.startswith('## see more'):
-                    mode = 'see more'
-                    continue
-
-                if mode == 'metadata':
-                    match = re.match(r'^\* (\w+): (.*)$', line)
-                    if match:
-                        key, value = match.groups()
-                        self.metadata[key] = value
-                elif mode == 'article':
-                    self.article.append(line)
-                elif mode == 'see more':
-                    self.see_more.append(line)
-
-        # set destination filename
-        # for example, if date is 20230101 and title is output-sample-article
+    def _set_destination(self):
+        """
+        Set the destination path from the date, the title and the metadata.
+        """
+        # for example, if date is 20230101 and filename is output-sample-article
         # then the destination filename will be 2023/0101-output-sample-article.html
         # if filename metadata is not set, use the title from the source filename.
         # HIGHLY recommended to set "filename" metadata.
-        self.title = self.metadata.get('filename', self.title)
-        self.dst_filename = (
-            os.environ.get('DEST_PATH', '.') +
-            f'/{year}/{month}{day}-{self.title}.html'
-        )
-        return True
+        year, month, day = self.date[:4], self.date[4:6], self.date[6:]
+        name = self.metadata.get('filename') or self.title
+        self.dst_path = f'{year}/{month}{day}-{name}.html'
+        self.dst_filename = self.dest_path + '/' + self.dst_path
+
+    def _read_metadata(self, file: TextIO):
+        """
+        Read the metadata lines, up to the "## article" line.
+        """
+        for line in iter(file.readline, ''):
+            if line.startswith('## article'):
+                self._body_offset = file.tell()
+                return
+            match = re.match(r'^\* (\w+): (.*)$', line.rstrip('\n'))
+            if match:
+                key, value = match.groups()
+                self.metadata[key] = value
+        self._body_offset = file.tell()
+
+    def _read_body(self, file: TextIO):
+        """
+        Parse the article and see-more sections into blocks, line by line.
+        """
+        self.article, self.see_more = BodyParser(self.metadata).parse(file)
+        self._body_offset = None
+
+    def read_body(self):
+        """
+        Read the body of an article read with `lazy`.
+        Does nothing if the body is already read.
+        """
+        if self._body_offset is None:
+            return
+        with open(self.src_filename, 'r', encoding='utf-8') as file:
+            file.seek(self._body_offset)
+            self._read_body(file)
+
+    def render(self) -> Tuple[str, str]:
+        """
+        Convert the article and see-more sections to HTML fragments.
+        The body is read first if the article was read with `lazy`.
+        The result is kept, so the sections are decorated only once.
+        """
+        if self.html is None:
+            with stats.current.stage('read'):
+                self.read_body()
+            self.html = (self._to_html(self.article), self._to_html(self.see_more))
+        return self.html
 
-    def check_modified(self) -> bool:
+    def to_cache(self) -> dict:
         """
-        Check if the article has been modified.
+        Return the parsed and rendered article as a cache entry.
         """
-        if os.path.exists(self.dst_filename):
-            if os.path.getmtime(self.dst_filename) < os.path.getmtime(self.src_filename):
-                return True
-        return False
+        excerpt, see_more = self.render()
+        return {
+            'metadata': self.metadata,
+            'title': self.title,
+            'date': self.date,
+            'dst_path': self.dst_path,
+            'blocks': [self.article, self.see_more],
+            'html': [excerpt, see_more],
+        }
 
-    def _paragraphize(self, lines: List[str]) -> List[str]:
+    @classmethod
+    def from_cache(cls, src_filename: str, data: dict, dest_path: str = '.') -> 'Article':
         """
-        lines to paragraphs.
-        blank lines are treated as paragraph breaks.
+        Restore an article from a cache entry, without reading the source.
         """
+        article = cls(src_filename, dest_path)
+        article.metadata = data['metadata']
+        # the entry is keyed by the content: a renamed source gets the
+        # title, date and destination of its new filename
+        if not article._read_filename():
+            article.title = data['title']
+            article.date = data['date']
+        article._set_destination()
+        article.article, article.see_more = (
+            [tuple(block) for block in blocks] for blocks in data['blocks']
+        )
+        article.html = tuple(data['html'])
+        return article
 
-        paragraphs = []
-        tmp_paragraph = []
+    def summary(self, key: str = '') -> ArticleSummary:
+        """
+        Return the summary record used to build index and list pages.
+        `key` is the content key under which the rendered fragments are cached.
+        """
+        _, see_more = self.render()
+        return ArticleSummary(
+            date=self.date,
+            title=self.title,
+            path=self.dst_path,
+            labels=self.metadata.get('labels') or '',
+            card_image=self.metadata.get('card_image') or '',
+            updated_at=self.metadata.get('updated_at') or '',
+            key=key,
+            has_more=bool(see_more),
+        )
 
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if tmp_paragraph:
-                    paragraphs.append('\n'.join(tmp_paragraph))
-                    tmp_paragraph = []
-            else:
-                tmp_paragraph.append(line)
+    def check_modified(self, manifest: BuildManifest, dependencies: Iterable[str] = ()) -> bool:
+        """
+        Check if the article has to be rebuilt.
+        Compares the content hashes of the source and `dependencies` (templates,
+        configuration) with the ones recorded in the build manifest.
+        """
+        return manifest.is_stale(self.dst_filename, [self.src_filename, *dependencies])
 
-        if tmp_paragraph:
-            paragraphs.append('\n'.join(tmp_paragraph))
+    def _to_html(self, blocks: List[Block]) -> str:
+        """
+        Convert the blocks of a section to HTML.
+        """
+        with stats.current.stage('paragraphize'):
+            return '\n'.join(self._paragraphize(blocks))
 
-        for paragraph in paragraphs:
-            if not paragraph:
+    def _paragraphize(self, blocks: List[Block]) -> List[str]:
+        """
+        blocks to paragraphs.
+        the text of each paragraph is decorated (see SPEC.md).
+        """
+        html_paragraphs = []
+        for kind, text in blocks:
+            if kind == HR:
+                html_paragraphs.append('<hr>')
                 continue
-            if paragraph.startswith('>><<'):
-                paragraph = paragraph[4:].strip()
+            paragraph = self._decorate(text)
+            if kind == CENTER:
                 paragraph = f'<p style="text-align: center;">{paragraph}</p>'
-            elif paragraph.startswith('>>>>'):
-                paragraph = paragraph[4:].strip()
+            elif kind == RIGHT:
                 paragraph = f'<p style="text-align: right;">{paragraph}</p>'
-            elif paragraph == '---':
-                paragraph = '<hr>'
-            elif paragraph.startswith('"""') and paragraph.endswith('"""'):
-                paragraph = paragraph[3:-3].strip()
+            elif kind == QUOTE:
                 paragraph = f'<blockquote>{paragraph}</blockquote>'
-            else:
+            elif kind not in (HEADING, HTML):
                 paragraph = f'<p>{paragraph}</p>'
             paragraph = re.sub(r'\n+', '<br>\n', paragraph)
+            html_paragraphs.append(paragraph)
+        return html_paragraphs
 
-        return paragraphs
-
-    def _remove_comments(self, content: str) -> str:
-        """
-        Remove comments from the string.
-        """
-        return re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
-
-    def _remove_tags(self, content: str) -> str:
+    @staticmethod
+    def _remove_tags(content: str) -> str:
         """
         Remove HTML tags from the string.
         """
@@ -157,4 +337,5 @@ class Article:
         Decorate markdown-like syntax in the string.
         see SPEC.md for details.
         """
-        return Decorate().decorate(content)
+        with stats.current.stage('decorate'):
+            return _decorator.decorate(content)
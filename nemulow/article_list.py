@@ -1,21 +1,131 @@
-# class ArticleList:
-#     """
-#     Class representing a list of articles.
-#     """
-#     def __init__(self):
-#         """
-#         Initialize the article list.
-#         """
-#         self.articles = []
-
-#     def add(self, article):
-#         """
-#         Add an article to the list.
-#         """
-#         self.articles.append(article)
-
-#     def get(self):
-#         """
-#         Get the list of articles.
-#         """
-#         return self.articles
+"""
+Index of all articles.
+
+Holds the article summary records and splits them into the list pages of the
+blog: the paginated top page, per-label archives and per-year/month archives.
+"""
+
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from article import ArticleSummary
+
+
+class Page(NamedTuple):
+    """
+    One list page: its output path (relative to the output directory),
+    the slice of articles on it, and its place in the pagination.
+    """
+    path: str
+    title: str
+    articles: List[ArticleSummary]
+    number: int
+    total: int
+    prev_path: Optional[str]
+    next_path: Optional[str]
+
+    @property
+    def root(self) -> str:
+        """
+        Relative path from this page to the output directory, e.g. '../../'.
+        """
+        return '../' * self.path.count('/')
+
+
+def split_labels(labels: str) -> List[str]:
+    """
+    Split the labels metadata ("雑記, 食べ物") into label names.
+    """
+    return [label.strip() for label in re.split(r'[,、]', labels) if label.strip()]
+
+
+def _safe_path(name: str) -> str:
+    name = re.sub(r'[/\\?#%\s]+', '-', name)
+    # "." and ".." would point to the label directory or its parent
+    return name.replace('.', '-') if not name.strip('.') else name
+
+
+class ArticleList:
+    """
+    Class representing a list of articles.
+    Articles are kept newest first; label and date views are bucketed in one pass.
+    """
+
+    def __init__(self, articles: Iterable[ArticleSummary] = ()):
+        """
+        Initialize the article list.
+        """
+        self.articles: List[ArticleSummary] = []
+        self._sorted = True
+        for article in articles:
+            self.add(article)
+
+    def add(self, article: ArticleSummary):
+        """
+        Add an article to the list.
+        """
+        self.articles.append(article)
+        self._sorted = False
+
+    def get(self) -> List[ArticleSummary]:
+        """
+        Get the list of articles, newest first.
+        """
+        if not self._sorted:
+            self.articles.sort(key=lambda a: (a.day, a.path), reverse=True)
+            self._sorted = True
+        return self.articles
+
+    def buckets(self) -> Dict[str, Dict[str, List[ArticleSummary]]]:
+        """
+        Return the articles grouped by label, by year and by month ('YYYY/MM').
+        Each group keeps the newest-first order.
+        """
+        labels: Dict[str, List[ArticleSummary]] = {}
+        years: Dict[str, List[ArticleSummary]] = {}
+        months: Dict[str, List[ArticleSummary]] = {}
+        for article in self.get():
+            for label in split_labels(article.labels):
+                labels.setdefault(label, []).append(article)
+            year, month = divmod(article.day // 100, 100)
+            years.setdefault(f'{year:04d}', []).append(article)
+            months.setdefault(f'{year:04d}/{month:02d}', []).append(article)
+        return {'label': labels, 'year': years, 'month': months}
+
+    def pages(self, per_page: int = 10) -> List[Page]:
+        """
+        Return all list pages:
+        index.html, page/N.html, label/<label>/index.html (and page/N.html),
+        archive/YYYY/index.html and archive/YYYY/MM/index.html (likewise).
+        """
+        pages = paginate(self.get(), per_page, '', '')
+        buckets = self.buckets()
+        for label, articles in sorted(buckets['label'].items()):
+            pages += paginate(articles, per_page, f'label/{_safe_path(label)}/', label)
+        for year, articles in sorted(buckets['year'].items()):
+            pages += paginate(articles, per_page, f'archive/{year}/', f'{year}年')
+        for month, articles in sorted(buckets['month'].items()):
+            year, mon = month.split('/')
+            pages += paginate(articles, per_page, f'archive/{month}/', f'{year}年{int(mon)}月')
+        return pages
+
+
+def paginate(articles: List[ArticleSummary], per_page: int, base: str, title: str) -> List[Page]:
+    """
+    Split `articles` into pages under `base`: base/index.html, base/page/2.html, ...
+    """
+    per_page = max(1, per_page)
+    total = max(1, (len(articles) + per_page - 1) // per_page)
+    paths = [f'{base}index.html'] + [f'{base}page/{n}.html' for n in range(2, total + 1)]
+    return [
+        Page(
+            path=paths[n],
+            title=title,
+            articles=articles[n * per_page:(n + 1) * per_page],
+            number=n + 1,
+            total=total,
+            prev_path=paths[n - 1] if n > 0 else None,
+            next_path=paths[n + 1] if n + 1 < total else None,
+        )
+        for n in range(total)
+    ]
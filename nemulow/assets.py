@@ -0,0 +1,431 @@
+"""
+Static assets.
+
+The stylesheets, scripts and images of the site are kept in ASSET_DIR (css/,
+js/, image/, ...) and written to the same place in the output directory with
+a fingerprint of their content in the name: `css/main.css` becomes
+`css/main.1a2b3c4d5e.css`. A file with a new content gets a new name, so the
+assets can be cached by browsers and CDNs for good (see `cache_control`).
+
+CSS and JavaScript are minified: comments and redundant whitespace are
+removed. The minifiers are conservative (line breaks in scripts are kept, so
+automatic semicolon insertion works as before, and template literals must
+not nest); the other files are copied as they are. The url() and @import
+references of stylesheets to other assets are rewritten to their fingerprinted
+names, so stylesheets are built after the assets they refer to, and a changed
+image also gives the stylesheets using it a new name.
+
+Templates refer to the assets with `asset()`, which looks the name up in the
+asset manifest: `{{ asset('/css/main.css') }}` -> `/css/main.1a2b3c4d5e.css`.
+Names which are not assets are returned as they are, so the templates also
+work without ASSET_DIR.
+
+Processed assets are cached in the cache directory by the hash of their
+source and the version of the minifiers, so assets whose source did not change
+are not processed again, and the outputs of changed and removed assets are
+deleted.
+"""
+
+import json
+import os
+import posixpath
+import re
+from typing import Callable, Dict, List, Mapping, Optional, Set
+
+import stats
+from compress import ENCODINGS
+from manifest import BuildManifest, hash_bytes
+from output import OutputWriter, open_if_changed, write_if_changed
+
+# bump this when the output of `process` changes (used for cache keys)
+MINIFY_VERSION = '1'
+
+# hex digits of the content hash in the names of the assets
+FINGERPRINT = 10
+
+# Cache-Control of fingerprinted assets
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_FINGERPRINTED = re.compile(r'\.[0-9a-f]{%d}\.\w+$' % FINGERPRINT)
+
+_CSS_REFERENCE = re.compile(
+    r'''(url\(\s*)(["']?)([^"')\s]+)(\2\s*\))|(@import\s*)(["'])([^"']+)(\6)''',
+)
+# references with a scheme ("data:", "https:") or a host are not assets
+_EXTERNAL = re.compile(r'^(?:[a-zA-Z][\w+.-]*:|//)')
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/|\s+''', re.S)
+
+# no whitespace is needed before or after these characters in CSS
+# (but before ":" of a pseudo-class, and around "+" and "-" in calc())
+_CSS_BEFORE = set('{};,>)')
+_CSS_AFTER = set('{};:,>(')
+
+_JS_TOKENS = re.compile(
+    r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(/\*.*?\*/|//[^\n]*|\s+)|/''',
+    re.S,
+)
+_JS_REGEXP = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+_JS_WORD = re.compile(r'[\w$]+$')
+
+# a "/" after these starts a regular expression literal, not a division
+_JS_REGEXP_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEXP_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await',
+}
+
+
+def minify_css(text: str) -> str:
+    """
+    Remove the comments and redundant whitespace of a stylesheet.
+    """
+    # code, then a string or a space (for whitespace and comments), and so on
+    tokens: List[str] = []
+    position = 0
+    for match in _CSS_TOKENS.finditer(text):
+        tokens.append(text[position:match.start()])
+        tokens.append(match.group(1) or ' ')
+        position = match.end()
+    tokens.append(text[position:])
+
+    output: List[str] = []
+    for i, token in enumerate(tokens):
+        if token == ' ':
+            before = output[-1][-1] if output else ''
+            after = next((token for token in tokens[i + 1:] if token), ' ')[0]
+            if before and before not in _CSS_AFTER and after not in _CSS_BEFORE | {' '}:
+                output.append(' ')
+        elif token:
+            if i % 2 == 0:
+                # the last declaration of a block needs no semicolon
+                token = token.replace(';}', '}')
+                if token.startswith('}') and output and output[-1].endswith(';'):
+                    output[-1] = output[-1][:-1]
+            output.append(token)
+    return ''.join(output)
+
+
+def minify_js(text: str) -> str:
+    """
+    Remove the comments and redundant whitespace of a script.
+    Line breaks are kept, so the statements are the same without semicolons.
+    """
+    output: List[str] = []
+    space = ''
+    position = 0
+    while position < len(text):
+        match = _JS_TOKENS.search(text, position)
+        end = match.start() if match is not None else len(text)
+        if end > position:
+            _append(output, space, text[position:end])
+            space = ''
+        if match is None:
+            break
+        position = match.end()
+        if match.group(1):
+            _append(output, space, match.group(1))
+            space = ''
+        elif match.group(2):
+            # whitespace and comments: one line break or one space
+            space = '\n' if space == '\n' or '\n' in match.group(2) else ' '
+        else:
+            regexp = _JS_REGEXP.match(text, match.start()) if _regexp_allowed(output) else None
+            token = regexp.group() if regexp is not None else '/'
+            _append(output, space, token)
+            space = ''
+            position = match.start() + len(token)
+    return ''.join(output) + '\n' if output else ''
+
+
+def _append(output: List[str], space: str, token: str):
+    if space and output:
+        last, first = output[-1][-1], token[0]
+        if space == '\n':
+            output.append('\n')
+        elif (
+            (last.isalnum() or last in '_$\\' or ord(last) > 127)
+            and (first.isalnum() or first in '_$\\' or ord(first) > 127)
+            or last in '+-/' and first in '+-/'
+        ):
+            output.append(' ')
+    output.append(token)
+
+
+def _regexp_allowed(output: List[str]) -> bool:
+    """
+    Check if a "/" after the script in `output` starts a regular expression.
+    """
+    for token in reversed(output):
+        token = token.rstrip()
+        if not token:
+            continue
+        if token[-1] in _JS_REGEXP_AFTER:
+            return True
+        word = _JS_WORD.search(token)
+        return word is not None and word.group() in _JS_REGEXP_KEYWORDS
+    return True
+
+
+# file extension -> minifier
+MINIFIERS: Dict[str, Callable[[str], str]] = {'.css': minify_css, '.js': minify_js}
+
+
+def process(path: str, data: bytes) -> bytes:
+    """
+    Return the output content of the asset `path` with the source `data`.
+    """
+    minify = MINIFIERS.get(os.path.splitext(path)[1].lower())
+    if minify is None:
+        return data
+    return minify(data.decode('utf-8')).encode('utf-8')
+
+
+def _css_target(name: str, reference: str) -> Optional[str]:
+    """
+    Return the asset name a reference in the stylesheet `name` points to,
+    or None if it is outside of the assets.
+    """
+    path = re.split(r'[?#]', reference, 1)[0]
+    if not path or _EXTERNAL.match(reference):
+        return None
+    if path.startswith('/'):
+        target = posixpath.normpath(path.lstrip('/'))
+    else:
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+    return None if target.startswith('..') else target
+
+
+def css_references(name: str, text: str) -> List[str]:
+    """
+    Return the asset names the stylesheet `name` refers to with url() and @import.
+    """
+    targets = []
+    for match in _CSS_REFERENCE.finditer(text):
+        target = _css_target(name, match.group(3) or match.group(7))
+        if target is not None:
+            targets.append(target)
+    return targets
+
+
+def rewrite_css(name: str, text: str, urls: Mapping[str, str]) -> str:
+    """
+    Point the references of the stylesheet `name` to the fingerprinted names
+    of the assets in `urls` ({name: fingerprinted name}); relative references
+    stay relative. The other references are kept as they are.
+    """
+    def replace(match: 're.Match[str]') -> str:
+        groups = match.group(1, 2, 3, 4) if match.group(1) else match.group(5, 6, 7, 8)
+        prefix, quote, reference, suffix = groups
+        output = urls.get(_css_target(name, reference) or '')
+        if output is not None:
+            path, rest = re.match(r'([^?#]*)(.*)$', reference, re.S).groups()
+            reference = posixpath.join(posixpath.dirname(path), posixpath.basename(output)) + rest
+        return prefix + quote + reference + suffix
+
+    return _CSS_REFERENCE.sub(replace, text)
+
+
+def _is_stylesheet(name: str) -> bool:
+    return name.lower().endswith('.css')
+
+
+def cache_key(digest: str) -> str:
+    """
+    Return the cache key of an asset whose source has the content hash `digest`.
+    """
+    return hash_bytes(f'{MINIFY_VERSION}:{digest}'.encode('utf-8'))
+
+
+def fingerprinted(name: str, data: bytes) -> str:
+    """
+    Return the name of an asset with the fingerprint of its content `data`.
+    """
+    base, suffix = os.path.splitext(name)
+    return f'{base}.{hash_bytes(data)[:FINGERPRINT]}{suffix}'
+
+
+def cache_control(path: str) -> Optional[str]:
+    """
+    Return the Cache-Control of an output file, or None for the default.
+    Fingerprinted assets (and their compressed sidecars) never change.
+    """
+    base, suffix = os.path.splitext(path)
+    if suffix in ENCODINGS:
+        path = base
+    return IMMUTABLE if _FINGERPRINTED.search(path) else None
+
+
+class AssetPipeline:
+    """
+    The assets of ASSET_DIR and their fingerprinted outputs.
+    """
+
+    VERSION = 2
+
+    def __init__(self, asset_dir: str, output_dir: str, cache_dir: str):
+        """
+        Initialize the pipeline from `asset_dir` to `output_dir`; the processed
+        assets and the asset manifest are kept in `cache_dir`.
+        Raises ValueError if the asset directory is in the output directory.
+        """
+        if os.path.commonpath([os.path.abspath(asset_dir), os.path.abspath(output_dir)]) in (
+            os.path.abspath(asset_dir), os.path.abspath(output_dir),
+        ):
+            raise ValueError('ASSET_DIR must not be in OUTPUT_DIR (or contain it)')
+        self.asset_dir = asset_dir
+        self.output_dir = output_dir
+        self.cache_dir = os.path.join(cache_dir, 'assets')
+        self.state_path = os.path.join(cache_dir, 'assets.json')
+        # asset name -> [cache key (see `cache_key`), output name]
+        self.assets: Dict[str, List[str]] = {}
+        self._dirty = True
+
+    def load(self) -> bool:
+        """
+        Load the asset manifest of the last build. Returns False if there is none.
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION:
+            return False
+        self.assets = data['assets']
+        self._dirty = False
+        return True
+
+    def urls(self) -> Dict[str, str]:
+        """
+        Return the asset manifest for the templates: {name: fingerprinted name}.
+        """
+        return {name: output for name, (_, output) in self.assets.items()}
+
+    def build(self, manifest: BuildManifest, writer: Optional[OutputWriter] = None):
+        """
+        Write the outputs of new and changed assets, and delete the outputs of
+        the changed and removed ones. The fingerprinted name of each asset is
+        registered in the build manifest as the input "asset:<name>", on which
+        the pages of the templates using it depend ("asset:*" is the whole
+        asset manifest, see template.asset_inputs).
+        """
+        assets: Dict[str, List[str]] = {}
+        sources = self._sources()
+        names = set(sources)
+        # the stylesheets after the other assets, which they may refer to
+        for name in sorted(sources, key=_is_stylesheet):
+            if name not in assets:
+                self._build_asset(name, manifest, writer, assets, names, set())
+
+        outputs = {output for _, output in assets.values()}
+        if writer is None:
+            writer = OutputWriter()
+        for _, output in self.assets.values():
+            if output not in outputs:
+                writer.remove(os.path.join(self.output_dir, output))
+        if assets != self.assets:
+            self.assets = assets
+            self._dirty = True
+        self._evict()
+        urls = self.urls()
+        for name, output in urls.items():
+            manifest.set_digest(f'asset:{name}', output.encode('utf-8'))
+        manifest.set_digest('asset:*', json.dumps(urls, sort_keys=True).encode('utf-8'))
+
+    def _build_asset(
+        self,
+        name: str,
+        manifest: BuildManifest,
+        writer: Optional[OutputWriter],
+        assets: Dict[str, List[str]],
+        names: Set[str],
+        pending: Set[str],
+    ):
+        """
+        Write the output of the asset `name` if it changed, and add its entry to
+        `assets`. The assets (of `names`) which a stylesheet refers to are built
+        first; `pending` are the stylesheets waiting for them.
+        """
+        path = os.path.join(self.asset_dir, name)
+        key = cache_key(manifest.digest(path))
+        entry = self.assets.get(name)
+        data: Optional[bytes] = None
+        if _is_stylesheet(name):
+            # the output also depends on the names of the assets it refers to
+            pending.add(name)
+            text = self._processed(path, key).decode('utf-8')
+            for target in css_references(name, text):
+                if target in names and target not in assets and target not in pending:
+                    self._build_asset(target, manifest, writer, assets, names, pending)
+            urls = {asset: output for asset, (_, output) in assets.items()}
+            data = rewrite_css(name, text, urls).encode('utf-8')
+            output = fingerprinted(name, data)
+        elif entry is not None and entry[0] == key:
+            output = entry[1]
+        else:
+            data = self._processed(path, key)
+            output = fingerprinted(name, data)
+        assets[name] = [key, output]
+
+        out_path = os.path.join(self.output_dir, output)
+        if entry == [key, output] and os.path.exists(out_path):
+            if writer is not None:
+                writer.record(out_path, False)
+            return
+        if data is None:
+            data = self._processed(path, key)
+        changed = write_if_changed(out_path, data)
+        if writer is not None:
+            writer.record(out_path, changed)
+        stats.current.count('assets.processed')
+
+    def _sources(self) -> List[str]:
+        names = []
+        for dirpath, dirnames, filenames in os.walk(self.asset_dir):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+            for name in sorted(filenames):
+                if name.startswith('.') or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                names.append(os.path.relpath(path, self.asset_dir).replace(os.sep, '/'))
+        return names
+
+    def _processed(self, path: str, key: str) -> bytes:
+        """
+        Return the processed content of an asset, from the cache if it is there.
+        """
+        cached = os.path.join(self.cache_dir, key + os.path.splitext(path)[1].lower())
+        try:
+            with open(cached, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            pass
+        with open(path, 'rb') as file:
+            data = process(path, file.read())
+        write_if_changed(cached, data)
+        return data
+
+    def _evict(self):
+        """
+        Remove the processed assets whose source is gone.
+        """
+        keep = {key + os.path.splitext(name)[1].lower() for name, (key, _) in self.assets.items()}
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def save(self):
+        """
+        Write the asset manifest, if it changed.
+        """
+        if not self._dirty:
+            return
+        with open_if_changed(self.state_path, []) as file:
+            json.dump({'version': self.VERSION, 'assets': self.assets}, file,
+                      ensure_ascii=False, sort_keys=True, indent=0)
+        self._dirty = False
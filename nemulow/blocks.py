@@ -0,0 +1,152 @@
+"""
+Streaming parser of the article body.
+
+The body of a Nemulow source is read line by line and turned into a list of
+blocks in one pass: comments (also spanning lines) are removed as the lines
+come in, lines are grouped into paragraphs at blank lines, and each paragraph
+is classified. The "## see more" line splits the blocks into the excerpt and
+the rest of the article.
+
+A block is a `(kind, text)` tuple, so the parsed body can be stored as JSON
+(see `Article.to_cache`). `text` is the source of the paragraph with the
+markers of its kind already removed; inline decorations are left to the renderer.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Block = Tuple[str, str]
+
+# block kinds
+PARAGRAPH = 'p'         # wrapped in <p>
+CENTER = 'center'       # ">><<" paragraph, centered
+RIGHT = 'right'         # ">>>>" paragraph, right aligned
+QUOTE = 'quote'         # paragraph enclosed in '"""', <blockquote>
+HR = 'hr'               # "---" paragraph
+HEADING = 'heading'     # paragraph starting with "### " or "#### ", not wrapped
+HTML = 'html'           # paragraph starting with a tag, not wrapped
+
+_METADATA = re.compile(r'^\* (\w+): (.*)$')
+
+
+def classify(paragraph: str) -> Block:
+    """
+    Return the block of one paragraph (lines joined with newlines).
+    """
+    if paragraph.startswith('>><<'):
+        return CENTER, paragraph[4:].strip()
+    if paragraph.startswith('>>>>'):
+        return RIGHT, paragraph[4:].strip()
+    if paragraph == '---':
+        return HR, ''
+    if paragraph.startswith('"""') and paragraph.endswith('"""'):
+        return QUOTE, paragraph[3:-3].strip()
+    if paragraph.startswith(('### ', '#### ')):
+        return HEADING, paragraph
+    if paragraph.startswith('<'):
+        return HTML, paragraph
+    # leading half-width spaces are removed (see SPEC.md)
+    return PARAGRAPH, paragraph.lstrip(' ')
+
+
+class _Section:
+    """
+    Paragraph and comment state of one section ("## article" or "## see more").
+    """
+
+    def __init__(self):
+        self.blocks: List[Block] = []
+        self._lines: List[str] = []
+        # lines read since an unclosed "<!--", and the text before it
+        self._comment: Optional[List[str]] = None
+        self._before = ''
+
+    def feed(self, line: str):
+        start = 0
+        if self._comment is not None:
+            end = line.find('-->')
+            if end < 0:
+                self._comment.append(line)
+                return
+            # the text around the comment is joined into one line
+            start = len(self._before)
+            line = self._before + line[end + 3:]
+            self._comment = None
+
+        start = line.find('<!--', start)
+        while start >= 0:
+            end = line.find('-->', start + 4)
+            if end < 0:
+                self._before = line[:start]
+                self._comment = [line]
+                return
+            line = line[:start] + line[end + 3:]
+            start = line.find('<!--', start)
+        self._add(line)
+
+    def _add(self, line: str):
+        line = line.rstrip()
+        if line:
+            self._lines.append(line)
+        elif self._lines:
+            self.blocks.append(classify('\n'.join(self._lines)))
+            self._lines = []
+
+    def close(self) -> List[Block]:
+        if self._comment is not None:
+            # a comment which is never closed is not a comment
+            lines, self._comment = self._comment, None
+            for line in lines:
+                self._add(line)
+        if self._lines:
+            self.blocks.append(classify('\n'.join(self._lines)))
+            self._lines = []
+        return self.blocks
+
+
+class BodyParser:
+    """
+    Parses the body of an article (the lines after "## article").
+    Lines in a later "# " section are read as metadata into `metadata`.
+    """
+
+    def __init__(self, metadata: Dict[str, str]):
+        """
+        Initialize the parser. `metadata` is updated in place.
+        """
+        self.metadata = metadata
+        self._sections = {'article': _Section(), 'see more': _Section()}
+        self._mode = 'article'
+
+    def feed(self, line: str):
+        """
+        Parse one line of the source.
+        """
+        line = line.rstrip('\n')
+        if line.startswith('# '):
+            self._mode = 'metadata'
+        elif line.startswith('## article'):
+            self._mode = 'article'
+        elif line.startswith('## see more'):
+            self._mode = 'see more'
+        elif self._mode == 'metadata':
+            match = _METADATA.match(line)
+            if match:
+                key, value = match.groups()
+                self.metadata[key] = value
+        else:
+            self._sections[self._mode].feed(line)
+
+    def parse(self, lines: Iterable[str]) -> Tuple[List[Block], List[Block]]:
+        """
+        Parse all `lines` and return the blocks of the article and see-more sections.
+        """
+        for line in lines:
+            self.feed(line)
+        return self.close()
+
+    def close(self) -> Tuple[List[Block], List[Block]]:
+        """
+        Finish parsing and return the blocks of the article and see-more sections.
+        """
+        return self._sections['article'].close(), self._sections['see more'].close()
@@ -0,0 +1,361 @@
+"""
+Bluesky threads.
+
+Nemulow has no comments of its own: an article can name a Bluesky post about
+it (`* bluesky: https://bsky.app/profile/<handle>/post/<id>`), and the
+replies to the post are shown under the article, with its like, repost and
+reply counts.
+
+The threads are fetched during the build from BLUESKY_API (the public AppView
+by default, which needs no login) with `app.bsky.feed.getPostThread`. The
+requests run concurrently: asyncio hands them to a pool of BLUESKY_JOBS
+persistent HTTP connections, so the build waits for the slowest post, not for
+the sum of them.
+
+Threads are cached in the cache directory. For BLUESKY_TTL seconds they are
+used without a request; after that they are revalidated with a conditional
+request (ETag / Last-Modified). When the API cannot be reached or fails, the
+cached thread is used as it is and fetched again by the next build.
+
+Only the metadata of new and changed articles is read for their post. The
+pages whose thread changed are rendered again.
+"""
+
+import asyncio
+import http.client
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote, urlsplit
+
+import stats
+from article import Article
+from output import open_if_changed
+
+DEFAULT_API = 'https://public.api.bsky.app'
+DEFAULT_TTL = 3600
+DEFAULT_JOBS = 8
+
+# seconds to wait for a response
+TIMEOUT = 10
+
+_POST_URL = re.compile(r'^https://bsky\.app/profile/([^/?#]+)/post/([^/?#]+)/?$')
+_POST_URI = re.compile(r'^at://([^/]+)/app\.bsky\.feed\.post/([^/?#]+)$')
+
+
+def post_uri(url: str) -> Optional[str]:
+    """
+    Return the AT URI of a post given by its bsky.app URL (or AT URI),
+    or None if it is not a post.
+    """
+    url = url.strip()
+    match = _POST_URL.match(url) or _POST_URI.match(url)
+    if not match:
+        return None
+    return f'at://{match.group(1)}/app.bsky.feed.post/{match.group(2)}'
+
+
+def post_url(uri: str, handle: str = '') -> str:
+    """
+    Return the bsky.app URL of the post with the AT URI `uri`.
+    """
+    match = _POST_URI.match(uri)
+    if not match:
+        return ''
+    return f'https://bsky.app/profile/{handle or match.group(1)}/post/{match.group(2)}'
+
+
+def thread_view(data: dict) -> Optional[dict]:
+    """
+    Reduce a getPostThread response to what the templates show:
+    {'url', 'likes', 'reposts', 'replies', 'quotes', 'comments': [...]}, where
+    each comment (direct reply, oldest first) is
+    {'author', 'handle', 'text', 'date', 'url', 'likes'}.
+    Returns None if the post is not in the response.
+    """
+    thread = data.get('thread') or {}
+    post = thread.get('post')
+    if not post:
+        return None
+    comments = []
+    for reply in thread.get('replies') or []:
+        reply_post = reply.get('post')
+        if not reply_post:
+            # deleted or blocked
+            continue
+        author = reply_post.get('author') or {}
+        record = reply_post.get('record') or {}
+        comments.append({
+            'author': author.get('displayName') or author.get('handle', ''),
+            'handle': author.get('handle', ''),
+            'text': record.get('text', ''),
+            'date': record.get('createdAt', '')[:10],
+            'url': post_url(reply_post.get('uri', ''), author.get('handle', '')),
+            'likes': reply_post.get('likeCount', 0),
+        })
+    comments.sort(key=lambda comment: comment['date'])
+    return {
+        'url': post_url(post.get('uri', ''), (post.get('author') or {}).get('handle', '')),
+        'likes': post.get('likeCount', 0),
+        'reposts': post.get('repostCount', 0),
+        'replies': post.get('replyCount', 0),
+        'quotes': post.get('quoteCount', 0),
+        'comments': comments,
+    }
+
+
+class ConnectionPool:
+    """
+    Persistent HTTP connections to one server, for asyncio.
+    At most `size` requests run at once, each on a connection of its own;
+    connections are kept open and used again by the next requests.
+    """
+
+    def __init__(self, endpoint: str, size: int = DEFAULT_JOBS, timeout: float = TIMEOUT):
+        """
+        Initialize an empty pool for the server of `endpoint` (http or https URL).
+        """
+        parts = urlsplit(endpoint)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'not an HTTP URL: {endpoint}')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle: List[http.client.HTTPConnection] = []
+        self._executor = ThreadPoolExecutor(max_workers=self.size)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    async def get(self, path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Send a GET request for `path` (under the path of the endpoint).
+        Returns the status, the headers (lower case names) and the body.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        async with self._semaphore:
+            connection = self._idle.pop() if self._idle else self._connect()
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, self._request, connection, self.base_path + path, headers,
+                )
+            except BaseException:
+                connection.close()
+                raise
+            self._idle.append(connection)
+            return result
+
+    @staticmethod
+    def _request(
+        connection: http.client.HTTPConnection, path: str, headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        # a kept connection may have been closed by the server in the meantime
+        retry = connection.sock is not None
+        while True:
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if not retry:
+                    raise
+                retry = False
+                continue
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, body
+
+    def close(self):
+        """
+        Close the connections.
+        """
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
+        self._executor.shutdown()
+
+
+class BlueskyThreads:
+    """
+    The threads of the posts named by the articles, cached between builds.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        state_path: str,
+        endpoint: str = DEFAULT_API,
+        ttl: int = DEFAULT_TTL,
+        jobs: int = DEFAULT_JOBS,
+    ):
+        """
+        Initialize the threads fetched from `endpoint`, whose cache is kept in
+        `state_path`. Threads are revalidated after `ttl` seconds, with at
+        most `jobs` requests at once.
+        """
+        self.state_path = state_path
+        self.endpoint = endpoint
+        self.ttl = ttl
+        self.jobs = jobs
+        # source -> [content key, post URI ('' if none)], for every article read
+        self.sources: Dict[str, List[str]] = {}
+        # post URI -> {'fetched': time, 'etag': ..., 'modified': ..., 'view': thread or None}
+        self.threads: Dict[str, dict] = {}
+        # sources whose page has to be rendered again
+        self.changed: Set[str] = set()
+        # post URIs which could not be fetched in the last refresh
+        self.failed: List[str] = []
+        self._dirty = True
+
+    def load(self) -> bool:
+        """
+        Load the cache of the last build. Returns False if there is none.
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION or data.get('endpoint') != self.endpoint:
+            return False
+        self.sources = data['sources']
+        self.threads = data['threads']
+        self._dirty = False
+        return True
+
+    def get(self, source: str) -> Optional[dict]:
+        """
+        Return the thread of the post of an article for the template, or None.
+        """
+        entry = self.sources.get(source)
+        if entry is None or not entry[1]:
+            return None
+        thread = self.threads.get(entry[1])
+        return thread['view'] if thread is not None else None
+
+    def refresh(self, sources: Iterable[Tuple[str, Optional[str]]], now: Optional[float] = None):
+        """
+        Bring the threads up to date for all articles, given as (source, content key):
+        the posts of new and changed articles are read from their metadata,
+        and the threads older than the TTL are fetched (or revalidated).
+        A key of None stands for a source known not to have changed since the
+        last refresh of the instance.
+        """
+        now = time.time() if now is None else now
+        sources = dict(sources)
+        before = {source: self.get(source) for source in self.sources}
+        for source in [source for source in self.sources if source not in sources]:
+            del self.sources[source]
+            self._dirty = True
+        for source, key in sources.items():
+            entry = self.sources.get(source)
+            if entry is None or (key is not None and entry[0] != key):
+                self.sources[source] = [key, self._read_post(source)]
+                self._dirty = True
+
+        posts = {uri for _, uri in self.sources.values() if uri}
+        for uri in [uri for uri in self.threads if uri not in posts]:
+            del self.threads[uri]
+            self._dirty = True
+        stale = sorted(
+            uri for uri in posts
+            if uri not in self.threads or now - self.threads[uri]['fetched'] >= self.ttl
+        )
+        self.failed = []
+        if stale:
+            results = asyncio.run(self._fetch_all(stale))
+            for uri, result in zip(stale, results):
+                self._store(uri, result, now)
+
+        self.changed = {
+            source for source in set(before) | set(self.sources)
+            if self.get(source) != before.get(source)
+        }
+
+    @staticmethod
+    def _read_post(source: str) -> str:
+        article = Article(source)
+        try:
+            if not article.read(lazy=True):
+                return ''
+        except (OSError, UnicodeDecodeError):
+            return ''
+        return post_uri(article.metadata.get('bluesky', '')) or ''
+
+    async def _fetch_all(self, uris: List[str]) -> list:
+        pool = ConnectionPool(self.endpoint, self.jobs)
+        try:
+            return await asyncio.gather(
+                *(self._fetch(pool, uri) for uri in uris), return_exceptions=True,
+            )
+        finally:
+            pool.close()
+
+    async def _fetch(self, pool: ConnectionPool, uri: str) -> Tuple[int, Dict[str, str], bytes]:
+        headers = {'Accept': 'application/json'}
+        cached = self.threads.get(uri)
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('modified'):
+                headers['If-Modified-Since'] = cached['modified']
+        query = f'uri={quote(uri, safe="")}&depth=1&parentHeight=0'
+        return await pool.get(f'/xrpc/app.bsky.feed.getPostThread?{query}', headers)
+
+    def _store(self, uri: str, result, now: float):
+        """
+        Update the cache entry of a post from the result of its request.
+        """
+        cached = self.threads.get(uri)
+        if isinstance(result, BaseException) or result[0] == 429 or result[0] >= 500:
+            # the cached thread is used until the next build
+            stats.current.count('bluesky.stale')
+            self.failed.append(uri)
+            return
+        status, headers, body = result
+        entry = {
+            'fetched': now,
+            'etag': headers.get('etag', ''),
+            'modified': headers.get('last-modified', ''),
+            'view': None,
+        }
+        if status == 304 and cached is not None:
+            stats.current.count('bluesky.revalidated')
+            entry['view'] = cached['view']
+            # a 304 may leave out the validators, which still hold
+            entry['etag'] = entry['etag'] or cached['etag']
+            entry['modified'] = entry['modified'] or cached['modified']
+        elif status == 200:
+            stats.current.count('bluesky.fetched')
+            try:
+                entry['view'] = thread_view(json.loads(body))
+            except (ValueError, AttributeError, TypeError):
+                stats.current.count('bluesky.stale')
+                self.failed.append(uri)
+                return
+        # other client errors: the post was deleted or is not visible
+        self.threads[uri] = entry
+        self._dirty = True
+
+    def save(self):
+        """
+        Write the cache, if it changed.
+        """
+        if not self._dirty:
+            return
+        with open_if_changed(self.state_path, []) as file:
+            json.dump({
+                'version': self.VERSION, 'endpoint': self.endpoint,
+                'sources': self.sources, 'threads': self.threads,
+            }, file, ensure_ascii=False, separators=(',', ':'))
+        self._dirty = False
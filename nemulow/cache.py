@@ -0,0 +1,151 @@
+"""
+Persistent cache of parsed articles.
+
+Each entry holds the result of `Article.read` and `Article.render` for one
+source, so unchanged sources skip parsing and decoration on later builds.
+Entries are stored as zlib-compressed JSON, one file per entry, and the least
+recently used entries are evicted when the cache grows over its size cap.
+
+The total size of the entries is kept in the cache directory: `evict` saves
+it in SIZE_FILE, and `put` (from any process) appends the size of each new
+entry to ADDED_FILE, so the entries are only listed when the total is
+unknown or over the cap.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from typing import Iterator, Optional, Tuple
+
+from article import Article
+from decorate import Decorate
+from output import write_if_changed
+
+# default size cap of the cache directory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# the total size as of the last eviction, and the sizes of the entries put since
+SIZE_FILE = 'size'
+ADDED_FILE = 'added'
+
+
+class ArticleCache:
+    """
+    On-disk LRU cache of parsed articles, keyed by source content hash
+    and the parser/decorator versions.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache stored in `directory`.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(digest: str) -> str:
+        """
+        Return the cache key of a source with content hash `digest`.
+        """
+        versions = f'{Article.VERSION}:{Decorate.VERSION}:{digest}'
+        return hashlib.sha256(versions.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Return the cached entry, or None.
+        A hit refreshes the mtime of the entry, which is used as its last access time.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = json.loads(zlib.decompress(file.read()))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            return None
+        return data
+
+    def put(self, key: str, data: dict):
+        """
+        Store an entry. Safe to call from several processes at once.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = zlib.compress(
+            json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        )
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(payload)
+        os.replace(tmp_path, path)
+        # one short appended line is written at once, also by several processes
+        fd = os.open(os.path.join(self.directory, ADDED_FILE),
+                     os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b'%d\n' % len(payload))
+        finally:
+            os.close(fd)
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+        Called when no entry is being put. Returns the number of removed entries.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        total = self._size()
+        removed = 0
+        # the entries are only listed when the total is unknown or too large
+        if total is None or total > self.max_bytes:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        write_if_changed(os.path.join(self.directory, SIZE_FILE), str(total))
+        try:
+            os.remove(os.path.join(self.directory, ADDED_FILE))
+        except FileNotFoundError:
+            pass
+        return removed
+
+    def _size(self) -> Optional[int]:
+        """
+        Return the total size of the entries (an overestimate when an entry was
+        put again), or None when it is not known.
+        """
+        try:
+            with open(os.path.join(self.directory, SIZE_FILE), encoding='utf-8') as file:
+                total = int(file.read())
+        except (OSError, ValueError):
+            return None
+        try:
+            with open(os.path.join(self.directory, ADDED_FILE), 'rb') as file:
+                total += sum(int(line) for line in file.read().split())
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            return None
+        return total
+
+    def _entries(self) -> Iterator[Tuple[int, int, str]]:
+        for dirpath, _, filenames in os.walk(self.directory):
+            if dirpath == self.directory:
+                # SIZE_FILE and ADDED_FILE
+                continue
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime_ns, stat.st_size, path
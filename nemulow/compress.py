@@ -0,0 +1,249 @@
+"""
+Precompressed sidecar files.
+
+For each text file of the output (HTML, CSS, JavaScript, feeds, ...), the
+build writes compressed copies next to it: `index.html.gz`, `index.html.br`
+and `index.html.zst`. Web servers serve them as they are (nginx `gzip_static`
+and `brotli_static`), and the deploy sets the matching Content-Encoding.
+
+Sidecars are recorded in the build manifest with the hash of their source,
+so files which did not change are not compressed again. Compression runs in
+a process pool.
+
+gzip is always available; brotli needs the `brotli` module and zstd the
+`zstandard` module.
+"""
+
+import gzip
+import mimetypes
+import os
+from contextlib import ExitStack
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from manifest import BuildManifest
+from output import OutputWriter, write_if_changed
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+# file extension -> Content-Encoding
+ENCODINGS: Dict[str, str] = {'.gz': 'gzip', '.br': 'br', '.zst': 'zstd'}
+
+# files which are compressed
+COMPRESSIBLE = ('.html', '.css', '.js', '.xml', '.rss', '.atom', '.json', '.svg', '.txt')
+
+# files smaller than this are not worth compressing
+MIN_SIZE = 256
+
+# sidecars are only made again when their source changes, so the levels are high
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ZSTD_LEVEL = 19
+
+
+def _compress_gz(data: bytes) -> bytes:
+    # mtime=0 makes the output depend only on the content
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compress_br(data: bytes) -> bytes:
+    import brotli
+
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _compress_zst(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+_COMPRESSORS = {'.gz': _compress_gz, '.br': _compress_br, '.zst': _compress_zst}
+_MODULES = {'.br': 'brotli', '.zst': 'zstandard'}
+
+
+def available_encodings(names: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Split the requested sidecar types ("gz", "br", "zst") into the ones which
+    can be generated and the ones whose module is not installed.
+    """
+    available, missing = [], []
+    for name in names:
+        suffix = '.' + name.strip().lstrip('.')
+        if suffix not in _COMPRESSORS:
+            raise ValueError(f'unknown compression: {name}')
+        module = _MODULES.get(suffix)
+        if module is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                missing.append(module)
+                continue
+        available.append(suffix)
+    return available, missing
+
+
+def content_headers(path: str) -> Tuple[str, Optional[str]]:
+    """
+    Return the Content-Type and Content-Encoding of an output file.
+    A sidecar has the type of its source and the encoding of its extension.
+    """
+    base, suffix = os.path.splitext(path)
+    encoding = ENCODINGS.get(suffix)
+    if encoding is None or not base.endswith(COMPRESSIBLE):
+        base, encoding = path, None
+    return mimetypes.guess_type(base)[0] or 'application/octet-stream', encoding
+
+
+def _compress_file(task: Tuple[str, List[str]]) -> Tuple[str, List[Tuple[str, bool]]]:
+    """
+    Write the sidecars of one file. Runs in worker processes.
+    """
+    path, suffixes = task
+    with open(path, 'rb') as file:
+        data = file.read()
+    return path, [
+        (path + suffix, write_if_changed(path + suffix, _COMPRESSORS[suffix](data)))
+        for suffix in suffixes
+    ]
+
+
+def compress_tree(
+    root: str,
+    suffixes: List[str],
+    manifest: Optional[BuildManifest] = None,
+    jobs: int = 1,
+    writer: Optional[OutputWriter] = None,
+    paths: Optional[Iterable[str]] = None,
+    executor: Optional['Executor'] = None,
+) -> List[str]:
+    """
+    Write the sidecars of the compressible files under `root`.
+    With a build manifest, sidecars whose source did not change are skipped.
+    Sidecars left over from removed files (or disabled encodings) are deleted.
+    With `paths` (e.g. the files a build wrote, left unchanged or removed),
+    only those files are checked instead of walking the tree.
+    With `executor`, its processes are used instead of a new pool.
+    Returns the list of compressed sources.
+    """
+    if paths is None:
+        tasks = _tasks(root, suffixes, manifest)
+    else:
+        tasks = _listed_tasks(paths, suffixes, manifest)
+    # the files are compressed as they are found
+    with ExitStack() as stack:
+        if executor is None and jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+        if executor is not None:
+            results = executor.map(_compress_file, tasks, chunksize=16)
+        else:
+            results = map(_compress_file, tasks)
+        return _record(results, manifest, writer)
+
+
+class PendingSidecars:
+    """
+    Sidecars compressed in a process pool while the build goes on
+    (e.g. those of the article pages while the lists are rendered).
+    `collect` records them; `close` shuts the pool down.
+    """
+
+    def __init__(self, paths: Iterable[str], suffixes: List[str], manifest: BuildManifest,
+                 jobs: int):
+        from concurrent.futures import ProcessPoolExecutor
+
+        tasks = list(_listed_tasks(paths, suffixes, manifest))
+        self.executor: Optional['Executor'] = None
+        self._results: Iterable[Tuple[str, List[Tuple[str, bool]]]] = ()
+        if tasks:
+            self.executor = ProcessPoolExecutor(max_workers=jobs)
+            # map submits all the tasks at once
+            self._results = self.executor.map(_compress_file, tasks, chunksize=16)
+
+    def collect(
+        self, manifest: Optional[BuildManifest] = None, writer: Optional[OutputWriter] = None
+    ) -> List[str]:
+        """
+        Wait for the sidecars and record them. Returns the list of compressed sources.
+        """
+        results, self._results = self._results, ()
+        return _record(results, manifest, writer)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def _record(
+    results: Iterable[Tuple[str, List[Tuple[str, bool]]]],
+    manifest: Optional[BuildManifest],
+    writer: Optional[OutputWriter],
+) -> List[str]:
+    compressed = []
+    for path, sidecars in results:
+        compressed.append(path)
+        for sidecar, changed in sidecars:
+            if writer is not None:
+                writer.record(sidecar, changed)
+            if manifest is not None:
+                manifest.record(sidecar, [path])
+    return compressed
+
+
+def _tasks(
+    root: str, suffixes: List[str], manifest: Optional[BuildManifest]
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yield the files under `root` with their stale sidecars, and remove orphaned sidecars.
+    """
+    for dirpath, _, filenames in os.walk(root):
+        names = set(filenames)
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            base, suffix = os.path.splitext(name)
+            if suffix in ENCODINGS and base.endswith(COMPRESSIBLE):
+                if (
+                    base not in names
+                    or suffix not in suffixes
+                    or os.path.getsize(os.path.join(dirpath, base)) < MIN_SIZE
+                ):
+                    os.remove(path)
+                continue
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < MIN_SIZE:
+                continue
+            stale = _stale(path, suffixes, manifest)
+            if stale:
+                yield path, stale
+
+
+def _listed_tasks(
+    paths: Iterable[str], suffixes: List[str], manifest: Optional[BuildManifest]
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yield the listed files with their stale sidecars, and remove the sidecars
+    of those which were removed or became too small.
+    """
+    for path in sorted(set(paths)):
+        if not path.endswith(COMPRESSIBLE):
+            continue
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = -1
+        if size < MIN_SIZE:
+            for suffix in ENCODINGS:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            continue
+        stale = _stale(path, suffixes, manifest)
+        if stale:
+            yield path, stale
+
+
+def _stale(path: str, suffixes: List[str], manifest: Optional[BuildManifest]) -> List[str]:
+    return [
+        suffix for suffix in suffixes
+        if manifest is None or manifest.is_stale(path + suffix, [path])
+    ]
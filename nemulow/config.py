@@ -0,0 +1,120 @@
+"""
+Configuration.
+
+The settings are read once from the environment and the `.env` file into a
+`Config`, an immutable record with typed values. It is validated when it is
+loaded, so a bad value is reported before anything is built, and it is a
+plain tuple, cheap to copy to worker processes.
+"""
+
+import os
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+
+class Config(NamedTuple):
+    """
+    Settings of a blog. Each field is read from the environment variable of
+    the same name in upper case (OUTPUT_DIR -> output_dir).
+    """
+
+    article_dir: str = './article'
+    template_dir: str = './templates'
+    output_dir: str = './www'
+    cache_dir: str = './.nemulow'
+    asset_dir: str = ''
+    server_name: str = ''
+    dest_path: str = ''
+    blog_name: str = ''
+    blog_url: str = ''
+    blog_description: str = ''
+    blog_image: str = ''
+    blog_email: str = ''
+    cache_max_mb: int = 256
+    fragment_cache_mb: int = 64
+    compress: Tuple[str, ...] = ('gz',)
+    feed_size: int = 20
+    search_shards: int = 64
+    related_size: int = 5
+    shard_key: str = 'year'
+    bluesky_api: str = ''
+    bluesky_ttl: int = 3600
+    bluesky_jobs: int = 8
+    articles_per_page: int = 10
+    deploy_target: str = ''
+    deploy_jobs: int = 8
+
+    @classmethod
+    def load(cls, config_file: str = '.env', override: bool = False) -> 'Config':
+        """
+        Read the configuration from the environment and `config_file`.
+        Values in the environment win over the file, unless `override` is set
+        (used when the file is edited in watch mode).
+        Raises ValueError if a value is not valid.
+        """
+        values: Dict[str, Optional[str]] = {}
+        if os.path.isfile(config_file):
+            from dotenv import dotenv_values
+
+            values.update(dotenv_values(config_file))
+        for name in cls._fields:
+            key = name.upper()
+            if key in os.environ and not (override and values.get(key) is not None):
+                values[key] = os.environ[key]
+        return cls.parse(values)
+
+    @classmethod
+    def parse(cls, values: Mapping[str, Optional[str]]) -> 'Config':
+        """
+        Make a configuration from environment style values ({'OUTPUT_DIR': './www', ...}).
+        Missing values take their default.
+        Raises ValueError if a value is not valid.
+        """
+        fields = {}
+        for name, default in cls._field_defaults.items():
+            value = values.get(name.upper())
+            if value is None:
+                continue
+            if isinstance(default, int):
+                fields[name] = _integer(name.upper(), value, minimum=1 if name in _POSITIVE else 0)
+            elif isinstance(default, tuple):
+                fields[name] = tuple(item.strip() for item in value.split(',') if item.strip())
+            else:
+                choices = _CHOICES.get(name)
+                if choices is not None and value not in choices:
+                    raise ValueError(
+                        f'{name.upper()} must be one of {", ".join(choices)}: {value!r}'
+                    )
+                fields[name] = value
+        return cls(**fields)
+
+    def environ(self) -> Dict[str, str]:
+        """
+        Return the values as environment variables (for the build manifest).
+        """
+        return {
+            name.upper(): ','.join(value) if isinstance(value, tuple) else str(value)
+            for name, value in zip(self._fields, self)
+        }
+
+    def site(self) -> Dict[str, str]:
+        """
+        Return the global template variables: BLOG_NAME -> blog_name, etc.
+        """
+        return {name: value for name, value in zip(self._fields, self) if name.startswith('blog_')}
+
+
+# settings which must be at least 1
+_POSITIVE = ('articles_per_page', 'bluesky_jobs', 'deploy_jobs')
+
+# settings which take one of a few values
+_CHOICES = {'shard_key': ('year', 'hash')}
+
+
+def _integer(key: str, value: str, minimum: int = 0) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{key} must be an integer: {value!r}') from None
+    if number < minimum:
+        raise ValueError(f'{key} must be at least {minimum}: {number}')
+    return number
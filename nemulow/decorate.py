@@ -3,31 +3,83 @@ A module to decorate article content with HTML structure.
 """
 
 import re
+from typing import Callable, Dict
+
+# All inline rules are merged into a single pattern and compiled once at import time.
+# Each alternative ends with a uniquely named group, so `match.lastgroup` tells which
+# rule matched. The alternatives are ordered like the rules of the former chain of
+# `re.sub` calls, so well-formed markup is converted exactly as before.
+_INLINE_RULES = r'''
+      \*\*\*(?P<boten>.+?)\*\*\*
+    | \*\*(?P<strong>.*?)\*\*
+    | \*(?!\*)(?P<em>.*?)(?<!\*)\*(?!\*)
+    | `(?P<code>.*?)`
+    | ~~(?P<del>.*?)~~
+    | !\[(?P<alt>[^\]]*)\]\((?P<src>[^)]+)\)
+    | \[(?P<text>[^\]]+)\]\((?P<href>[^)]+)\)
+    | <color\ +(?P<color>\#[0-9A-Fa-f]{3,8}|[A-Za-z]+)>(?P<colored>.*?)</color>
+    | <mark\ +(?P<mark>yellow|green|pink|red|blue|orange)>(?P<marked>.*?)</mark>
+'''
+
+# the inner text of a rule is decorated with the inline rules only:
+# headings are only found at the start of the lines of the content itself
+_INLINE = re.compile(_INLINE_RULES, re.VERBOSE)
+_CONTENT = re.compile(
+    r'''
+      ^\#{4}\ +(?P<h4>.*?)$
+    | ^\#{3}\ +(?P<h3>.*?)$
+    | ''' + _INLINE_RULES,
+    re.MULTILINE | re.VERBOSE,
+)
+
+# characters that can start one of the rules above
+_TRIGGERS = re.compile(r'[#*`~!\[<]')
 
 
 class Decorate:
+    """
+    Inline decorator for the Nemulow language.
+    The rules are compiled once, so a single instance can be shared by all articles.
+    """
+
+    # bump this when the output of `decorate` changes (used for cache keys)
+    VERSION = '3'
+
     def __init__(self):
-        pass
+        self._rules: Dict[str, Callable[[re.Match], str]] = {
+            'h4': lambda m: f'<h4>{self._inner(m["h4"])}</h4>',
+            'h3': lambda m: f'<h3>{self._inner(m["h3"])}</h3>',
+            'boten': lambda m: f'<span class="boten">{self._inner(m["boten"])}</span>',
+            'strong': lambda m: f'<strong>{self._inner(m["strong"])}</strong>',
+            'em': lambda m: f'<em>{self._inner(m["em"])}</em>',
+            'code': lambda m: f'<code>{self._inner(m["code"])}</code>',
+            'del': lambda m: f'<del>{self._inner(m["del"])}</del>',
+            'src': lambda m: f'<img src="{m["src"]}" alt="{m["alt"]}">',
+            'href': lambda m: f'<a href="{m["href"]}">{self._inner(m["text"])}</a>',
+            'colored': lambda m: (
+                f'<span style="color: {m["color"]};">{self._inner(m["colored"])}</span>'
+            ),
+            'marked': lambda m: f'<mark class="{m["mark"]}">{self._inner(m["marked"])}</mark>',
+        }
 
-    def decorate(self, content: str) -> str:
+    def decorate(self, content: str, inline: bool = False) -> str:
         """
         Decorate the article content with HTML structure.
         Supports markdown-like syntax and some original syntax.
         See SPEC.md for details.
+
+        The content is scanned once from left to right; the inner text of each
+        matched rule is decorated recursively, with the `inline` rules only
+        (a "### " in a code span or a heading is not a heading).
+        Note: H1 (# ) is reserved for signature.
+        H2 (## ) is used for "article" and "See more" section, so not processed here.
         """
+        if not _TRIGGERS.search(content):
+            return content
+        return (_INLINE if inline else _CONTENT).sub(self._replace, content)
+
+    def _inner(self, text: str) -> str:
+        return self.decorate(text, inline=True)
 
-        # markdown-like syntax
-        content = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content)
-        content = re.sub(r'\*(.*?)\*', r'<em>\1</em>', content)
-        content = re.sub(r'`(.*?)`', r'<code>\1</code>', content)
-        content = re.sub(r'~~(.*?)~~', r'<del>\1</del>', content)
-        content = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', content)
-        content = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', r'<img src="\2" alt="\1">', content)
-
-        # original syntax (heading levels)
-        # Note: H1 (# ) is reserved for signature.
-        # H2 (## ) is used for "article" and "See more" section, so not processed here.
-        content = re.sub(r'^#### +(.*?)$', r'<h4>\1</h4>', content, flags=re.MULTILINE)
-        content = re.sub(r'^### +(.*?)$', r'<h3>\1</h3>', content, flags=re.MULTILINE)
-
-        return content
+    def _replace(self, match: re.Match) -> str:
+        return self._rules[match.lastgroup](match)
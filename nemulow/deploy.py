@@ -0,0 +1,221 @@
+"""
+Incremental deploy.
+
+The output tree is described by a manifest of content hashes. It is compared
+with the manifest of the last deploy to get the minimal change set (files to
+upload and files to delete), which is pushed through a backend:
+
+- a local directory (`file:///path` or a plain path),
+- rsync over ssh (`rsync://host:/path`),
+- Amazon S3 (`s3://bucket/prefix`, needs boto3).
+
+Fingerprinted assets (see assets.py) are uploaded before the pages which
+refer to them, and S3 serves them with an immutable Cache-Control.
+"""
+
+import json
+import os
+import shlex
+import shutil
+import subprocess  # nosec B404
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from assets import cache_control
+from compress import content_headers
+from manifest import BuildManifest
+
+
+class ChangeSet(NamedTuple):
+    """
+    Files (relative to the output directory) to upload and to delete.
+    """
+    uploads: List[str]
+    deletions: List[str]
+
+
+def scan_tree(root: str, manifest: Optional[BuildManifest] = None) -> Dict[str, str]:
+    """
+    Return {relative path: content hash} for all files under `root`.
+    With a build manifest, hashes of unchanged files are taken from its stat cache.
+    """
+    if manifest is None:
+        manifest = BuildManifest(':memory:')
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            tree[os.path.relpath(path, root).replace(os.sep, '/')] = manifest.digest(path)
+    return tree
+
+
+def diff(deployed: Dict[str, str], current: Dict[str, str]) -> ChangeSet:
+    """
+    Return the changes needed to turn the `deployed` tree into the `current` one.
+    """
+    uploads = sorted(path for path, digest in current.items() if deployed.get(path) != digest)
+    deletions = sorted(path for path in deployed if path not in current)
+    return ChangeSet(uploads, deletions)
+
+
+class Backend:
+    """
+    Base class of deploy targets.
+    Subclasses implement `upload` and `delete`, or override `push` as a whole.
+    """
+
+    def upload(self, root: str, path: str):
+        raise NotImplementedError
+
+    def delete(self, path: str):
+        raise NotImplementedError
+
+    def push(self, root: str, changes: ChangeSet, jobs: int = 8):
+        """
+        Apply the change set, transferring files in parallel.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            for _ in executor.map(lambda path: self.upload(root, path), changes.uploads):
+                pass
+            for _ in executor.map(self.delete, changes.deletions):
+                pass
+
+
+class LocalBackend(Backend):
+    """
+    Deploy to a local directory (also used for testing).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def upload(self, root: str, path: str):
+        dst = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(os.path.join(root, path), dst + '.tmp')
+        os.replace(dst + '.tmp', dst)
+
+    def delete(self, path: str):
+        try:
+            os.remove(os.path.join(self.directory, path))
+        except FileNotFoundError:
+            pass
+
+
+class RsyncBackend(Backend):
+    """
+    Deploy with rsync over ssh. The change set is sent in one rsync run.
+    """
+
+    def __init__(self, destination: str):
+        # destination: "host:/path/to/www"
+        self.destination = destination.rstrip('/') + '/'
+
+    def push(self, root: str, changes: ChangeSet, jobs: int = 8):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt') as files_from:
+            files_from.write('\n'.join(changes.uploads))
+            files_from.flush()
+            if changes.uploads:
+                subprocess.run(  # nosec B603 B607
+                    ['rsync', '-a', '--files-from', files_from.name,
+                     root.rstrip('/') + '/', self.destination],
+                    check=True,
+                )
+        if changes.deletions:
+            host, _, directory = self.destination.partition(':')
+            command = f'cd {shlex.quote(directory)} && rm -f -- ' + ' '.join(
+                shlex.quote(path) for path in changes.deletions
+            )
+            subprocess.run(['ssh', host, command], check=True)  # nosec B603 B607
+
+
+class S3Backend(Backend):
+    """
+    Deploy to an Amazon S3 bucket. Needs boto3.
+    Precompressed sidecars (index.html.gz, ...) are uploaded with the
+    Content-Type of their source and the matching Content-Encoding.
+    Fingerprinted assets are uploaded with an immutable Cache-Control.
+    """
+
+    def __init__(self, bucket: str, prefix: str = ''):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client('s3')
+
+    def upload(self, root: str, path: str):
+        content_type, encoding = content_headers(path)
+        extra_args = {'ContentType': content_type}
+        if encoding is not None:
+            extra_args['ContentEncoding'] = encoding
+        control = cache_control(path)
+        if control is not None:
+            extra_args['CacheControl'] = control
+        self.client.upload_file(
+            os.path.join(root, path),
+            self.bucket,
+            self.prefix + path,
+            ExtraArgs=extra_args,
+        )
+
+    def delete(self, path: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + path)
+
+
+def make_backend(target: str) -> Backend:
+    """
+    Return the backend for a DEPLOY_TARGET value.
+    """
+    if target.startswith('s3://'):
+        bucket, _, prefix = target[len('s3://'):].partition('/')
+        return S3Backend(bucket, prefix)
+    if target.startswith('rsync://'):
+        return RsyncBackend(target[len('rsync://'):])
+    if target.startswith('file://'):
+        return LocalBackend(target[len('file://'):])
+    return LocalBackend(target)
+
+
+def load_deployed(state_path: str) -> Dict[str, str]:
+    """
+    Load the manifest of the last deploy.
+    """
+    try:
+        with open(state_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def deploy(
+    root: str,
+    backend: Backend,
+    state_path: str,
+    jobs: int = 8,
+    dry_run: bool = False,
+    manifest: Optional[BuildManifest] = None,
+) -> ChangeSet:
+    """
+    Deploy the changes of the output tree `root` since the last deploy.
+    The deployed manifest is stored in `state_path` once the push succeeded.
+    """
+    current = scan_tree(root, manifest)
+    changes = diff(load_deployed(state_path), current)
+    if dry_run:
+        return changes
+    # a page is never online before the assets it refers to
+    assets = [path for path in changes.uploads if cache_control(path) is not None]
+    if assets:
+        backend.push(root, ChangeSet(assets, []), jobs)
+    backend.push(root, ChangeSet(
+        [path for path in changes.uploads if cache_control(path) is None], changes.deletions,
+    ), jobs)
+
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    with open(state_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(current, file, ensure_ascii=False, sort_keys=True, indent=0)
+    os.replace(state_path + '.tmp', state_path)
+    return changes
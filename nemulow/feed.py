@@ -0,0 +1,345 @@
+"""
+Feeds and sitemaps.
+
+The RSS 2.0 feed (`rss.xml`), the Atom feed (`atom.xml`) and the sitemap
+(`sitemap.xml`) are generated from the article summary records. The XML is
+streamed element by element to the output file through `XmlWriter`, so no
+document is built in memory.
+
+Each file is registered in the build manifest with a fingerprint of the
+entries it shows: the feeds are only generated again when the newest
+FEED_SIZE articles change, and a sitemap when the URL or `updated_at` of one
+of its entries changes. Past SITEMAP_MAX_URLS URLs, the sitemap is split into
+`sitemap-N.xml` files listed by a sitemap index in `sitemap.xml`. Entries are
+put into the files oldest first, so a new article only changes the last file.
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, TextIO
+from urllib.parse import quote
+
+from article import ArticleSummary
+from article_list import split_labels
+from fragments import EXCERPT, SUMMARY, FragmentCache
+from manifest import BuildManifest
+from output import OutputWriter
+
+# default number of articles in the feeds
+DEFAULT_FEED_SIZE = 20
+
+# URLs per sitemap file (limit of the sitemap protocol)
+SITEMAP_MAX_URLS = 50000
+
+_SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+_ATOM_NS = 'http://www.w3.org/2005/Atom'
+
+# xml.sax.saxutils would do, but it imports urllib.request, which is slow to load
+_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_ESCAPE_ATTR = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+    '\n': '&#10;', '\r': '&#13;', '\t': '&#9;',
+})
+
+_DATE = re.compile(r'^(\d{4})[-/]?(\d{2})[-/]?(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?)?')
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# time zone of the dates without one, as in the og:article:publish_time of the pages
+TIMEZONE = timezone(timedelta(hours=9))
+
+
+class XmlWriter:
+    """
+    Incremental XML writer: elements are written to the file as they come.
+    """
+
+    def __init__(self, file: TextIO):
+        """
+        Initialize the writer and write the XML declaration.
+        """
+        self.file = file
+        self._open: List[str] = []
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+
+    def start(self, tag: str, attrs: Optional[Dict[str, str]] = None):
+        """
+        Open an element.
+        """
+        self.file.write(f'<{tag}{self._attrs(attrs)}>\n')
+        self._open.append(tag)
+
+    def end(self):
+        """
+        Close the last opened element.
+        """
+        self.file.write(f'</{self._open.pop()}>\n')
+
+    def element(self, tag: str, text: Optional[str] = None, attrs: Optional[Dict[str, str]] = None):
+        """
+        Write an element with text content (or an empty element).
+        """
+        if text is None:
+            self.file.write(f'<{tag}{self._attrs(attrs)}/>\n')
+        else:
+            self.file.write(f'<{tag}{self._attrs(attrs)}>{text.translate(_ESCAPE)}</{tag}>\n')
+
+    def close(self):
+        """
+        Close the elements which are still open.
+        """
+        while self._open:
+            self.end()
+
+    @staticmethod
+    def _attrs(attrs: Optional[Dict[str, str]]) -> str:
+        return ''.join(
+            f' {name}="{value.translate(_ESCAPE_ATTR)}"' for name, value in (attrs or {}).items()
+        )
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> Optional[datetime]:
+    """
+    Parse the date of an article ("20250824") or an `updated_at` value
+    ("2025-08-24", "2025/08/24 21:30", ISO 8601). Dates without a time zone are
+    in TIMEZONE (JST).
+    """
+    value = value.strip()
+    if not value:
+        return None
+    match = _DATE.match(value)
+    if not match:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('/', '-'))
+    except ValueError:
+        numbers = [int(group) for group in match.groups() if group is not None]
+        try:
+            parsed = datetime(*numbers)
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=TIMEZONE)
+    return parsed
+
+
+def _published(article: ArticleSummary) -> datetime:
+    return parse_date(article.date) or _EPOCH
+
+
+def _updated(article: ArticleSummary) -> datetime:
+    return parse_date(article.updated_at) or _published(article)
+
+
+def _rfc3339(value: datetime) -> str:
+    return value.isoformat().replace('+00:00', 'Z')
+
+
+def article_url(base_url: str, article: ArticleSummary) -> str:
+    """
+    Return the absolute URL of an article page.
+    """
+    return base_url.rstrip('/') + '/article/' + quote(article.path)
+
+
+def _fingerprint(lines: Iterable[str]) -> bytes:
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest().encode('ascii')
+
+
+def _write_rss(file: TextIO, articles: List[ArticleSummary], site: Dict[str, str],
+               fragments: FragmentCache):
+    from email.utils import format_datetime
+
+    base_url = site.get('blog_url', '')
+    xml = XmlWriter(file)
+    xml.start('rss', {'version': '2.0', 'xmlns:atom': _ATOM_NS})
+    xml.start('channel')
+    xml.element('title', site.get('blog_name', ''))
+    xml.element('link', base_url)
+    xml.element('description', site.get('blog_description', ''))
+    xml.element('language', 'ja')
+    xml.element('atom:link', attrs={
+        'href': base_url.rstrip('/') + '/rss.xml', 'rel': 'self', 'type': 'application/rss+xml',
+    })
+    if articles:
+        xml.element('lastBuildDate', format_datetime(max(map(_updated, articles))))
+    for article in articles:
+        url = article_url(base_url, article)
+        xml.start('item')
+        xml.element('title', article.title)
+        xml.element('link', url)
+        xml.element('guid', url, {'isPermaLink': 'true'})
+        xml.element('pubDate', format_datetime(_published(article)))
+        xml.element('description', fragments.get(article.key, SUMMARY))
+        for label in split_labels(article.labels):
+            xml.element('category', label)
+        xml.end()
+    xml.close()
+
+
+def _write_atom(file: TextIO, articles: List[ArticleSummary], site: Dict[str, str],
+                fragments: FragmentCache):
+    base_url = site.get('blog_url', '')
+    xml = XmlWriter(file)
+    xml.start('feed', {'xmlns': _ATOM_NS, 'xml:lang': 'ja'})
+    xml.element('title', site.get('blog_name', ''))
+    xml.element('subtitle', site.get('blog_description', ''))
+    xml.element('id', base_url)
+    xml.element('link', attrs={'href': base_url})
+    xml.element('link', attrs={'href': base_url.rstrip('/') + '/atom.xml', 'rel': 'self'})
+    xml.element('updated', _rfc3339(max(map(_updated, articles), default=_EPOCH)))
+    xml.start('author')
+    xml.element('name', site.get('blog_name', ''))
+    xml.end()
+    for article in articles:
+        url = article_url(base_url, article)
+        xml.start('entry')
+        xml.element('title', article.title)
+        xml.element('id', url)
+        xml.element('link', attrs={'href': url})
+        xml.element('published', _rfc3339(_published(article)))
+        xml.element('updated', _rfc3339(_updated(article)))
+        xml.element('summary', fragments.get(article.key, SUMMARY))
+        xml.element('content', fragments.get(article.key, EXCERPT), {'type': 'html'})
+        for label in split_labels(article.labels):
+            xml.element('category', attrs={'term': label})
+        xml.end()
+    xml.close()
+
+
+def generate_feeds(
+    html_dir: str,
+    articles: List[ArticleSummary],
+    site: Dict[str, str],
+    fragments: FragmentCache,
+    count: int = DEFAULT_FEED_SIZE,
+    manifest: Optional[BuildManifest] = None,
+    writer: Optional[OutputWriter] = None,
+) -> List[str]:
+    """
+    Write the RSS and Atom feeds of the newest `count` of `articles` (newest first).
+    With a build manifest, the feeds are skipped when those entries did not change.
+    Returns the list of generated files.
+    """
+    if writer is None:
+        writer = OutputWriter()
+    window = articles[:count]
+    inputs = ['feed:'] + (manifest.config_inputs() if manifest is not None else [])
+    if manifest is not None:
+        manifest.set_digest('feed:', _fingerprint(
+            json.dumps(list(article), ensure_ascii=False) for article in window
+        ))
+    generated = []
+    for name, write in (('rss.xml', _write_rss), ('atom.xml', _write_atom)):
+        path = os.path.join(html_dir, name)
+        if manifest is not None and not manifest.is_stale(path, inputs):
+            continue
+        with writer.open(path) as file:
+            write(file, window, site, fragments)
+        if manifest is not None:
+            manifest.record(path, inputs)
+        generated.append(path)
+    return generated
+
+
+def _write_urlset(file: TextIO, entries: List[Optional[ArticleSummary]], base_url: str):
+    xml = XmlWriter(file)
+    xml.start('urlset', {'xmlns': _SITEMAP_NS})
+    for article in entries:
+        xml.start('url')
+        if article is None:
+            xml.element('loc', base_url)
+        else:
+            xml.element('loc', article_url(base_url, article))
+            xml.element('lastmod', _rfc3339(_updated(article)))
+        xml.end()
+    xml.close()
+
+
+def _lastmod(entries: List[Optional[ArticleSummary]]) -> str:
+    dates = [_updated(article) for article in entries if article is not None]
+    return _rfc3339(max(dates)) if dates else ''
+
+
+def generate_sitemap(
+    html_dir: str,
+    articles: List[ArticleSummary],
+    base_url: str,
+    manifest: Optional[BuildManifest] = None,
+    writer: Optional[OutputWriter] = None,
+    max_urls: int = SITEMAP_MAX_URLS,
+) -> List[str]:
+    """
+    Write the sitemap of the top page and the `articles` (newest first).
+    Over `max_urls` URLs, `sitemap.xml` is an index of `sitemap-N.xml` files.
+    With a build manifest, only the files whose entries changed are written;
+    the URLs are only made for those.
+    Returns the list of generated files.
+    """
+    if writer is None:
+        writer = OutputWriter()
+    # oldest first; the top page (None) comes last as it changes with the newest article
+    entries: List[Optional[ArticleSummary]] = list(reversed(articles)) + [None]
+    chunks = [entries[i:i + max_urls] for i in range(0, len(entries), max_urls)]
+    config = manifest.config_inputs() if manifest is not None else []
+    generated = []
+
+    def write(name: str, fingerprint: bytes, render) -> bool:
+        path = os.path.join(html_dir, name)
+        inputs = [f'sitemap:{name}'] + config
+        if manifest is not None:
+            manifest.set_digest(inputs[0], fingerprint)
+            if not manifest.is_stale(path, inputs):
+                return False
+        with writer.open(path) as file:
+            render(file)
+        if manifest is not None:
+            manifest.record(path, inputs)
+        generated.append(path)
+        return True
+
+    def fingerprint(chunk: List[Optional[ArticleSummary]]) -> bytes:
+        return _fingerprint(
+            f'{article.path}\t{article.date}\t{article.updated_at}' if article is not None
+            else '' for article in chunk
+        )
+
+    names = [f'sitemap-{number}.xml' for number in range(1, len(chunks) + 1)]
+    if len(chunks) > 1:
+        fingerprints = []
+        for name, chunk in zip(names, chunks):
+            fingerprints.append(fingerprint(chunk))
+            write(name, fingerprints[-1],
+                  lambda file, chunk=chunk: _write_urlset(file, chunk, base_url))
+
+        def render_index(file: TextIO):
+            xml = XmlWriter(file)
+            xml.start('sitemapindex', {'xmlns': _SITEMAP_NS})
+            for name, chunk in zip(names, chunks):
+                xml.start('sitemap')
+                xml.element('loc', base_url.rstrip('/') + '/' + name)
+                xml.element('lastmod', _lastmod(chunk))
+                xml.end()
+            xml.close()
+
+        write('sitemap.xml', b''.join(fingerprints), render_index)
+    else:
+        names = []
+        write('sitemap.xml', fingerprint(entries),
+              lambda file: _write_urlset(file, entries, base_url))
+
+    # files of a larger sitemap
+    for name in os.listdir(html_dir):
+        if re.match(r'^sitemap-\d+\.xml$', name) and name not in names:
+            writer.remove(os.path.join(html_dir, name))
+            if manifest is not None:
+                manifest.discard(os.path.join(html_dir, name))
+    return generated
@@ -0,0 +1,155 @@
+"""
+Render-once fragment cache.
+
+An article is shown on its own page, on index pages and on label and date
+archives. Its HTML fragments are rendered once per build and kept here, keyed
+by the content key of the article (see `ArticleCache.key`) and the fragment kind:
+
+- excerpt: the part before "## see more" (list pages),
+- body: the whole article (article page, feeds),
+- summary: a short plain-text description (meta tags).
+
+The summary records of the list pages only hold the key, and the templates
+get the fragments through `FragmentView`. The cache is an LRU bounded by
+memory; evicted fragments are read back from the article cache on disk, or
+rendered again from the source if they are not there.
+"""
+
+import re
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import stats
+from article import Article, ArticleSummary
+from cache import ArticleCache
+
+EXCERPT = 'excerpt'
+BODY = 'body'
+SUMMARY = 'summary'
+KINDS = (EXCERPT, BODY, SUMMARY)
+
+# length of the summary made from the excerpt, in characters
+SUMMARY_LENGTH = 120
+
+# default memory cap of the fragments
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def render_fragments(article: Article) -> Dict[str, str]:
+    """
+    Render all fragments of an article.
+    The summary is the "summary" metadata, or the beginning of the excerpt as text.
+    """
+    excerpt, see_more = article.render()
+    summary = article.metadata.get('summary') or ''
+    if not summary:
+        text = re.sub(r'\s+', ' ', article._remove_tags(excerpt)).strip()
+        summary = text if len(text) <= SUMMARY_LENGTH else text[:SUMMARY_LENGTH - 1] + '…'
+    return {
+        EXCERPT: excerpt,
+        BODY: excerpt + '\n' + see_more if see_more else excerpt,
+        SUMMARY: summary,
+    }
+
+
+class FragmentCache:
+    """
+    In-memory LRU of rendered fragments, keyed by (content key, kind).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, store: Optional[ArticleCache] = None):
+        """
+        Initialize an empty cache holding up to about `max_bytes` of fragments.
+        Evicted fragments are loaded again from `store`.
+        """
+        self.max_bytes = max_bytes
+        self.store = store
+        self.size = 0
+        self._fragments: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+        # content key -> source file, to load fragments which are not in memory
+        self._sources: Dict[str, str] = {}
+        # returns the fragments of a content key kept elsewhere (see shard.py),
+        # instead of rendering them from the source
+        self.loader: Optional[Callable[[str], Dict[str, str]]] = None
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def add_source(self, key: str, src_filename: str):
+        """
+        Tell where the article with the content `key` comes from.
+        """
+        self._sources[key] = src_filename
+
+    def put(self, key: str, fragments: Dict[str, str], src_filename: Optional[str] = None):
+        """
+        Store fragments of the article with the content `key`.
+        """
+        if src_filename is not None:
+            self._sources[key] = src_filename
+        for kind, html in fragments.items():
+            old = self._fragments.pop((key, kind), None)
+            if old is not None:
+                self.size -= sys.getsizeof(old)
+            self._fragments[(key, kind)] = html
+            self.size += sys.getsizeof(html)
+        self._evict()
+
+    def get(self, key: str, kind: str) -> str:
+        """
+        Return a fragment, loading it if it is not in memory.
+        Raises KeyError if the source of the article (or with a loader,
+        the fragment) is not known.
+        """
+        html = self._fragments.get((key, kind))
+        if html is not None:
+            self._fragments.move_to_end((key, kind))
+            stats.current.count('fragments.hits')
+            return html
+        stats.current.count('fragments.misses')
+        if self.loader is not None:
+            fragments = self.loader(key)
+        else:
+            fragments = render_fragments(self._load(key))
+        self.put(key, fragments)
+        return fragments[kind]
+
+    def _load(self, key: str) -> Article:
+        src_filename = self._sources[key]
+        data = self.store.get(key) if self.store is not None else None
+        if data is not None:
+            return Article.from_cache(src_filename, data)
+        article = Article(src_filename)
+        article.read()
+        return article
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._fragments) > 1:
+            _, html = self._fragments.popitem(last=False)
+            self.size -= sys.getsizeof(html)
+            stats.current.count('fragments.evicted')
+
+    def view(self, record: ArticleSummary) -> 'FragmentView':
+        """
+        Return the record with its fragments, for templates.
+        """
+        return FragmentView(record, self)
+
+
+class FragmentView:
+    """
+    A summary record as seen by the templates: `excerpt`, `body` and `summary`
+    are looked up in the fragment cache, the other attributes come from the record.
+    """
+
+    __slots__ = ('record', 'fragments')
+
+    def __init__(self, record: ArticleSummary, fragments: FragmentCache):
+        self.record = record
+        self.fragments = fragments
+
+    def __getattr__(self, name: str):
+        if name in KINDS:
+            return self.fragments.get(self.record.key, name)
+        return getattr(self.record, name)
@@ -1,14 +1,42 @@
 """
 Nemulo: A simple static site generator for blogs.
+
+    nemulow [--config .env] {build,watch,deploy,stats,merge} [options]
+
+Third-party modules (Jinja2, Markdown, python-dotenv) and the modules of the
+other commands are imported when they are needed, so a build with nothing to
+do starts quickly.
 """
 
+import argparse
 import json
-from typing import List
+import os
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple
 
-import jinja2
-import dotenv
+import stats
+from article_list import ArticleList
+from cache import ArticleCache
+from compress import PendingSidecars, available_encodings, compress_tree
+from config import Config
+from feed import generate_feeds, generate_sitemap
+from fragments import FragmentCache
+from manifest import BuildManifest, hash_bytes, template_dependencies
+from output import OutputWriter
+from related import RelatedIndex
+from search import SearchIndex
+from template import TemplateRegistry
+from utils import (
+    get_article_list, get_article_sources, generate_article_html, generate_list_html,
+)
 
-from article import Article
+# state files of the indexes in CACHE_DIR
+SEARCH_STATE = 'search.json'
+RELATED_STATE = 'related.jsonl'
+
+if TYPE_CHECKING:
+    from article import Article
+    from bluesky import BlueskyThreads
+    from deploy import ChangeSet
 
 
 class Nemulow:
@@ -20,8 +48,15 @@ class Nemulow:
     """
 
     config_file: str
-    articles: List[Article]
-    templates: List[jinja2.Template] = []
+    config: Config
+    articles: List['Article']
+    templates: Optional[TemplateRegistry] = None
+    manifest: Optional[BuildManifest] = None
+    cache: Optional[ArticleCache] = None
+    fragments: Optional[FragmentCache] = None
+    search: Optional[SearchIndex] = None
+    related: Optional[RelatedIndex] = None
+    threads: Optional['BlueskyThreads'] = None
 
     def __init__(self, config_file: str = '.env'):
         """
@@ -29,15 +64,677 @@ class Nemulow:
         """
         self.config_file = config_file
         self.articles = []
-        self.config = {}
         self.reload_config(config_file)
 
-    def reload_config(self, config_file: str = '.env'):
+    def reload_config(self, config_file: str = '.env', override: bool = False):
+        """
+        Load the Nemulow configuration from the environment and `config_file`.
+        With `override`, values in the file replace the ones in the environment
+        (used when the file is edited in watch mode).
+        Raises ValueError if a value is not valid.
+        """
+        self.config = Config.load(config_file, override=override)
+
+    def site_context(self) -> Dict[str, Any]:
+        """
+        Return the global template variables: BLOG_NAME -> blog_name, etc.,
+        and `search`, true when the search index is written (SEARCH_SHARDS > 0).
+        """
+        site: Dict[str, Any] = self.config.site()
+        site['search'] = self.config.search_shards > 0
+        return site
+
+    def load_templates(
+        self, template_dir: str, cache_dir: str, site: Dict[str, Any],
+        assets: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Set up the template registry shared by all pages of the build.
+        The registry is kept while the template directory and the globals stay the same.
+        Templates are compiled on first use. `assets` is the asset manifest.
+        """
+        templates = self.templates
+        if (
+            templates is None
+            or templates.template_dir != template_dir
+            or templates.globals != site
+        ):
+            templates = TemplateRegistry(template_dir, cache_dir, globals=site)
+        templates.assets = dict(assets or {})
+        self.templates = templates
+
+    def build_assets(self, manifest: BuildManifest, writer: OutputWriter) -> Dict[str, str]:
+        """
+        Write the fingerprinted assets of ASSET_DIR (empty disables them) to
+        the output directory. Returns the asset manifest for the templates.
+        """
+        config = self.config
+        if not config.asset_dir:
+            return {}
+        from assets import AssetPipeline
+
+        pipeline = AssetPipeline(config.asset_dir, config.output_dir, config.cache_dir)
+        pipeline.load()
+        pipeline.build(manifest, writer)
+        pipeline.save()
+        return pipeline.urls()
+
+    @staticmethod
+    def manifest_path(cache_dir: str) -> str:
+        """
+        Return the path of the build manifest in `cache_dir`.
+        """
+        return os.path.join(cache_dir, 'manifest.db')
+
+    def changed_articles(
+        self, changed: Optional[Iterable[str]], sources: List[str]
+    ) -> Optional[Set[str]]:
+        """
+        Return the article `sources` among the `changed` files, or None when
+        other files (templates, assets, configuration) changed too, on which
+        every page may depend.
+        """
+        if changed is None:
+            return None
+        directory = os.path.abspath(self.config.article_dir)
+        names = set()
+        for path in changed:
+            path = os.path.abspath(path)
+            if os.path.dirname(path) != directory or not path.lower().endswith('.md'):
+                return None
+            names.add(os.path.basename(path))
+        return {source for source in sources if os.path.basename(source) in names}
+
+    def load_manifest(
+        self, cache_dir: str, changed: Optional[Iterable[str]] = None
+    ) -> BuildManifest:
+        """
+        Set up the build manifest of `cache_dir` with the current configuration.
+        The manifest is kept in the instance; when it is used again, the hashes
+        of the `changed` files (or of all files) are checked again.
+        """
+        manifest_path = self.manifest_path(cache_dir)
+        if self.manifest is None or self.manifest.path != manifest_path:
+            self.manifest = BuildManifest(manifest_path)
+            self.manifest.load()
+        else:
+            self.manifest.forget(changed)
+        self.manifest.set_config(self.config.environ())
+        return self.manifest
+
+    def build(
+        self, jobs: int = 1, changed: Optional[Iterable[str]] = None,
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> OutputWriter:
+        """
+        Build the blog incrementally.
+        Only the pages whose inputs changed since the last build are rendered,
+        and only the files whose content changed are written.
+        With `jobs` > 1, articles are rendered in that many processes.
+
+        The manifest, article cache, fragment cache and templates are kept in the instance.
+        When it is built again, `changed` lists the files known to have changed
+        (e.g. from watch mode); the other inputs are not checked again.
+        With `shard` (index, count), only the article pages of that shard are
+        built, with the records which `merge` needs (see shard.py).
+        Returns the writer, which knows the written and unchanged files.
+        """
+        config = self.config
+        article_dir = config.article_dir
+        template_dir = config.template_dir
+        output_dir = config.output_dir
+        cache_dir = config.cache_dir
+        # `changed` tells what changed since the last build of the same manifest
+        kept = self.manifest is not None and self.manifest.path == self.manifest_path(cache_dir)
+        manifest = self.load_manifest(cache_dir, changed)
+
+        cache = ArticleCache(os.path.join(cache_dir, 'articles'), config.cache_max_mb * 1024 * 1024)
+        self.cache = cache
+        if self.fragments is None:
+            self.fragments = FragmentCache(config.fragment_cache_mb * 1024 * 1024)
+        self.fragments.store = cache
+        site = self.site_context()
+        writer = OutputWriter()
+        with stats.current.stage('build.assets'):
+            assets = self.build_assets(manifest, writer)
+        self.load_templates(template_dir, os.path.join(cache_dir, 'templates'), site, assets)
+        articles = get_article_list(article_dir, output_dir)
+        sources = get_article_sources(articles, article_dir)
+        known = self.changed_articles(changed, sources) if kept else None
+        # without `changed`, the inputs of the whole build tell whether it has
+        # anything to do (not with Bluesky threads, which change with time)
+        inputs = None
+        if changed is None and shard is None and not config.bluesky_api:
+            inputs = self.build_inputs(manifest, sources)
+            if not manifest.is_stale('build:pages', inputs):
+                stats.current.count('builds.unchanged')
+                with stats.current.stage('build.compress'):
+                    self.compress(output_dir, jobs, writer)
+                with stats.current.stage('build.save'):
+                    manifest.save()
+                return writer
+        search = self.load_search_index(cache_dir, output_dir) if shard is None else None
+
+        def content_key(source: str) -> Optional[str]:
+            # the sources known not to have changed are not hashed again
+            if known is not None and source not in known:
+                return None
+            return ArticleCache.key(manifest.digest(source))
+
+        related = self.load_related_index(cache_dir)
+        if related is not None:
+            # over all articles, also in a shard
+            with stats.current.stage('build.related'):
+                related.refresh(
+                    ((source, content_key(source)) for source in sources), jobs=jobs, cache=cache,
+                )
+        if shard is not None:
+            from shard import shard_of
+
+            index, count = shard
+            selected = [
+                i for i, article in enumerate(articles)
+                if shard_of(article, count, config.shard_key) == index
+            ]
+            articles = [articles[i] for i in selected]
+            sources = [sources[i] for i in selected]
+        threads = self.load_bluesky_threads(cache_dir)
+        if threads is not None:
+            with stats.current.stage('build.bluesky'):
+                threads.refresh((source, content_key(source)) for source in sources)
+            if threads.failed:
+                print(f'{len(threads.failed)} Bluesky threads could not be fetched; '
+                      'the cached ones are used.')
+        with stats.current.stage('build.articles'):
+            _, summaries = generate_article_html(
+                articles,
+                article_dir,
+                os.path.join(output_dir, 'article'),
+                os.path.join(template_dir, 'article.j2'),
+                manifest=manifest,
+                jobs=jobs,
+                cache=cache,
+                templates=self.templates,
+                writer=writer,
+                fragments=self.fragments,
+                search=search,
+                related=related,
+                threads=threads,
+                dest_path=config.dest_path,
+                changed=known,
+            )
+        if shard is not None:
+            from shard import RECORDS, built_articles, write_records
+
+            with stats.current.stage('build.records'):
+                path = os.path.join(output_dir, RECORDS)
+                writer.record(path, write_records(
+                    path, shard, config.shard_key,
+                    built_articles(articles, article_dir, manifest), self.fragments,
+                ))
+        else:
+            # the article pages are compressed while the rest is built
+            pending = self.compress_pages(jobs, writer)
+            try:
+                if search is not None:
+                    with stats.current.stage('build.search'):
+                        search.save(writer)
+                article_list = ArticleList(summaries)
+                with stats.current.stage('build.lists'):
+                    self.generate_lists(output_dir, article_list, writer, self.fragments, known)
+                with stats.current.stage('build.feeds'):
+                    self.generate_feeds(output_dir, article_list, site, writer)
+                with stats.current.stage('build.compress'):
+                    self.compress(output_dir, jobs, writer, pending)
+            finally:
+                if pending is not None:
+                    pending.close()
+        with stats.current.stage('build.save'):
+            if related is not None:
+                related.save()
+            if threads is not None:
+                threads.save()
+            cache.evict()
+            if inputs is not None:
+                # with the state files as they are now
+                manifest.forget(self.state_paths())
+                manifest.record('build:pages', inputs)
+            manifest.save()
+        return writer
+
+    def state_paths(self) -> List[str]:
+        """
+        Return the state files of the enabled indexes in CACHE_DIR.
+        """
+        config = self.config
+        return [
+            os.path.join(config.cache_dir, name) for name, enabled in (
+                (SEARCH_STATE, config.search_shards > 0),
+                (RELATED_STATE, config.related_size > 0),
+            ) if enabled
+        ]
+
+    def build_inputs(self, manifest: BuildManifest, sources: List[str]) -> List[str]:
+        """
+        Register and return the inputs of a whole build: the article sources,
+        the configuration, the templates, the assets and the state files of
+        the indexes. When none of them changed since the last complete build,
+        no page has to be checked. (Pages removed by hand are then written
+        again by the next build in which something changed.)
+        """
+        manifest.set_digest('build:sources', '\n'.join(
+            f'{source}\t{manifest.digest(source)}' for source in sources
+        ).encode('utf-8'))
+        manifest.set_digest('build:config', json.dumps(
+            self.config.environ(), sort_keys=True
+        ).encode('utf-8'))
+        return (
+            ['build:sources', 'build:config']
+            + template_dependencies(self.config.template_dir)
+            + ['asset:*']
+            + self.state_paths()
+        )
+
+    def load_search_index(self, cache_dir: str, output_dir: str) -> Optional[SearchIndex]:
+        """
+        Set up the search index (SEARCH_SHARDS shards; 0 disables it).
+        The index is kept in the instance and updated by each build.
+        """
+        shards = self.config.search_shards
+        if shards <= 0:
+            self.search = None
+            return None
+        state_path = os.path.join(cache_dir, SEARCH_STATE)
+        search = self.search
+        if (
+            search is None
+            or search.state_path != state_path
+            or search.directory != os.path.join(output_dir, 'search')
+            or search.shards != shards
+        ):
+            search = SearchIndex(state_path, output_dir, shards)
+            search.load()
+        self.search = search
+        return search
+
+    def load_related_index(self, cache_dir: str) -> Optional[RelatedIndex]:
+        """
+        Set up the related articles (RELATED_SIZE per article; 0 disables them).
+        The index is kept in the instance and updated by each build.
+        """
+        size = self.config.related_size
+        if size <= 0:
+            self.related = None
+            return None
+        state_path = os.path.join(cache_dir, RELATED_STATE)
+        related = self.related
+        if related is None or related.state_path != state_path or related.size != size:
+            related = RelatedIndex(state_path, size)
+            related.load()
+        self.related = related
+        return related
+
+    def load_bluesky_threads(self, cache_dir: str) -> Optional['BlueskyThreads']:
+        """
+        Set up the Bluesky threads of the articles (from BLUESKY_API; empty disables them).
+        The threads are kept in the instance and refreshed by each build.
+        """
+        config = self.config
+        if not config.bluesky_api:
+            self.threads = None
+            return None
+        from bluesky import BlueskyThreads
+
+        state_path = os.path.join(cache_dir, 'bluesky.json')
+        threads = self.threads
+        if (
+            threads is None
+            or threads.state_path != state_path
+            or threads.endpoint != config.bluesky_api
+        ):
+            threads = BlueskyThreads(state_path, config.bluesky_api)
+            threads.load()
+        threads.ttl = config.bluesky_ttl
+        threads.jobs = config.bluesky_jobs
+        self.threads = threads
+        return threads
+
+    def merge(self, directories: List[str], jobs: int = 1) -> OutputWriter:
+        """
+        Assemble the outputs of a sharded build (see shard.py) in the output
+        directory: copy the article pages of the shards, and build the list
+        pages, feeds, sitemap and search index from their records.
+        Only the files whose content changed are written.
+        Raises ValueError unless `directories` are all the shards of one build.
+        """
+        from shard import ShardSet
+
+        config = self.config
+        output_dir = config.output_dir
+        cache_dir = config.cache_dir
+        if any(os.path.realpath(directory) == os.path.realpath(output_dir)
+               for directory in directories):
+            raise ValueError('the output directory cannot be one of the shards.')
+        manifest = self.load_manifest(cache_dir)
+        # the fragments of the articles are in the records, not in the article cache
+        fragments = FragmentCache(config.fragment_cache_mb * 1024 * 1024)
+        search = self.load_search_index(cache_dir, output_dir)
+        site = self.site_context()
+        writer = OutputWriter()
+        with stats.current.stage('merge.assets'):
+            assets = self.build_assets(manifest, writer)
+        self.load_templates(
+            config.template_dir, os.path.join(cache_dir, 'templates'), site, assets,
+        )
+        with ShardSet(directories) as shards:
+            fragments.loader = shards.fragments
+            with stats.current.stage('merge.pages'):
+                for path, relative in shards.pages():
+                    out_path = os.path.join(output_dir, relative)
+                    if not manifest.is_stale(out_path, [path]):
+                        writer.record(out_path, False)
+                        continue
+                    with open(path, 'rb') as file:
+                        writer.write(out_path, file.read())
+                    manifest.record(out_path, [path])
+            names = []
+            summaries = []
+            with stats.current.stage('merge.records'):
+                for record in shards.records():
+                    summary = record.summary
+                    names.append(record.name)
+                    summaries.append(summary)
+                    fragments.put(summary.key, record.fragments)
+                    # the records of the last merge tell which articles changed
+                    previous = manifest.get_record(record.name)
+                    if (
+                        previous is not None and previous['summary'] == list(summary)
+                        and (search is None or record.name in search.docs)
+                    ):
+                        continue
+                    if search is not None:
+                        search.update(record.name, summary, record.terms)
+                    manifest.set_record(
+                        record.name, os.path.join(output_dir, 'article', summary.path), summary,
+                    )
+            if search is not None:
+                with stats.current.stage('merge.search'):
+                    search.retain(names)
+                    search.save(writer)
+            del names
+            article_list = ArticleList(summaries)
+            with stats.current.stage('merge.lists'):
+                self.generate_lists(output_dir, article_list, writer, fragments)
+            with stats.current.stage('merge.feeds'):
+                self.generate_feeds(output_dir, article_list, site, writer, fragments)
+        with stats.current.stage('merge.compress'):
+            self.compress(output_dir, jobs, writer)
+        with stats.current.stage('merge.save'):
+            manifest.save()
+        return writer
+
+    def generate_lists(
+        self, output_dir: str, article_list: ArticleList, writer: OutputWriter,
+        fragments: FragmentCache, changed: Optional[Set[str]] = None,
+    ):
+        """
+        Write the list pages: the top page and the label and date archives.
+        `changed` is as in generate_article_html.
+        """
+        generate_list_html(
+            output_dir,
+            os.path.join(self.config.template_dir, 'index.j2'),
+            article_list,
+            per_page=self.config.articles_per_page,
+            manifest=self.manifest,
+            templates=self.templates,
+            writer=writer,
+            fragments=fragments,
+            changed=changed,
+        )
+
+    def generate_feeds(
+        self, output_dir: str, article_list: ArticleList, site: Dict[str, Any],
+        writer: OutputWriter, fragments: Optional[FragmentCache] = None,
+    ):
+        """
+        Write the RSS/Atom feeds (FEED_SIZE newest articles; 0 disables them)
+        and the sitemap. Both need the absolute URLs of BLOG_URL.
+        The excerpts are taken from `fragments` (by default, those of the build).
+        """
+        if not site.get('blog_url'):
+            return
+        articles = article_list.get()
+        count = self.config.feed_size
+        if count > 0:
+            generate_feeds(output_dir, articles, site, fragments or self.fragments, count,
+                           manifest=self.manifest, writer=writer)
+        generate_sitemap(output_dir, articles, site['blog_url'],
+                         manifest=self.manifest, writer=writer)
+
+    def compress_pages(self, jobs: int, writer: OutputWriter) -> Optional[PendingSidecars]:
         """
-        Load the Nemulow configuration.
+        Start compressing the files written so far (the article pages) in
+        `jobs` processes, so that the serial stages which follow run meanwhile.
+        `compress` collects them.
         """
-        dotenv.load_dotenv(config_file)
+        if jobs <= 1:
+            return None
+        suffixes = available_encodings(self.config.compress)[0]
+        self.manifest.forget(writer.written)
+        return PendingSidecars(writer.written, suffixes, self.manifest, jobs)
+
+    def compress(
+        self, output_dir: str, jobs: int, writer: OutputWriter,
+        pending: Optional[PendingSidecars] = None,
+    ):
+        """
+        Write the precompressed sidecars (COMPRESS, e.g. "gz,br,zst") of the
+        files changed in the output directory. Files put in the output
+        directory by hand are only compressed when COMPRESS changes.
+        The sidecars started by `compress_pages` are recorded first.
+        """
+        suffixes, missing = available_encodings(self.config.compress)
+        for module in missing:
+            print(f'{module} is not installed; its sidecar files are not generated.')
+        manifest = self.manifest
+        executor = None
+        if pending is not None:
+            pending.collect(manifest, writer)
+            executor = pending.executor
+        # the files written in this build have to be hashed again
+        manifest.forget(writer.written)
+        # the tree is only walked when the encodings changed (and on the first
+        # build); otherwise only the files this build went through are checked
+        manifest.set_digest('compress:encodings', ','.join(suffixes).encode('utf-8'))
+        if manifest.is_stale('build:compress', ['compress:encodings']):
+            compress_tree(output_dir, suffixes, manifest, jobs, writer, executor=executor)
+            manifest.record('build:compress', ['compress:encodings'])
+        else:
+            paths = writer.written + writer.unchanged + writer.removed
+            compress_tree(output_dir, suffixes, manifest, jobs, writer, paths, executor)
+
+    def deploy(self, dry_run: bool = False) -> 'ChangeSet':
+        """
+        Deploy the output directory to DEPLOY_TARGET.
+        Only the files changed since the last deploy are uploaded or deleted.
+        """
+        from deploy import deploy, make_backend
+
+        output_dir = self.config.output_dir
+        cache_dir = self.config.cache_dir
+        target = self.config.deploy_target
+        if not target:
+            raise ValueError('DEPLOY_TARGET is not set.')
+
+        manifest = BuildManifest(self.manifest_path(cache_dir))
+        manifest.load()
+        state_name = 'deployed-' + hash_bytes(target.encode('utf-8'))[:16] + '.json'
+        changes = deploy(
+            output_dir,
+            make_backend(target),
+            os.path.join(cache_dir, state_name),
+            jobs=self.config.deploy_jobs,
+            dry_run=dry_run,
+            manifest=manifest,
+        )
+        # keep the hashes of the output files for the next deploy
+        manifest.save()
+        return changes
+
+
+def _build(nemulow: Nemulow, args: argparse.Namespace) -> OutputWriter:
+    """
+    Run a build (profiled with --profile) and print what was written.
+    """
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    with stats.current.stage('build'):
+        writer = nemulow.build(jobs=args.jobs, shard=args.shard)
+    if profiler is not None:
+        import pstats
+
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    print(writer.report())
+    return writer
+
+
+def build_command(nemulow: Nemulow, args: argparse.Namespace):
+    """
+    Build the blog incrementally.
+    """
+    _build(nemulow, args)
+
+
+def watch_command(nemulow: Nemulow, args: argparse.Namespace):
+    """
+    Rebuild on changes and serve the output on a preview server.
+    """
+    from watch import watch
+
+    watch(nemulow, port=args.port, jobs=args.jobs)
+
+
+def deploy_command(nemulow: Nemulow, args: argparse.Namespace):
+    """
+    Build, then deploy the changed files to DEPLOY_TARGET.
+    """
+    _build(nemulow, args)
+    changes = nemulow.deploy(dry_run=args.dry_run)
+    for path in changes.uploads:
+        print(f'upload: {path}')
+    for path in changes.deletions:
+        print(f'delete: {path}')
+    print(f'{len(changes.uploads)} uploads, {len(changes.deletions)} deletions.')
+
+
+def merge_command(nemulow: Nemulow, args: argparse.Namespace):
+    """
+    Merge the outputs of the shards of a sharded build into OUTPUT_DIR.
+    """
+    with stats.current.stage('merge'):
+        writer = nemulow.merge(args.directories, jobs=args.jobs)
+    print(writer.report())
+
+
+def stats_command(nemulow: Nemulow, args: argparse.Namespace):
+    """
+    Build with the stages timed and print the report.
+    """
+    stats.current.enabled = True
+    writer = _build(nemulow, args)
+    stats.current.count('files.written', len(writer.written))
+    stats.current.count('files.unchanged', writer.skipped)
+    if args.json:
+        stats.current.write_report(args.json, args.top)
+    print(stats.current.format(args.top))
+
+
+COMMANDS = {
+    'build': build_command,
+    'watch': watch_command,
+    'deploy': deploy_command,
+    'stats': stats_command,
+    'merge': merge_command,
+}
+
+
+def _shard(value: str) -> Tuple[int, int]:
+    from shard import parse_shard
+
+    try:
+        return parse_shard(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='nemulow', description='Build the blog.')
+    parser.add_argument(
+        '--config', default='.env',
+        help='configuration file; the environment overrides it (default: .env)',
+    )
+    # without a command, the blog is built
+    parser.set_defaults(jobs=1, profile=None, shard=None)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    jobs = argparse.ArgumentParser(add_help=False)
+    jobs.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='number of processes used to render articles (default: 1)',
+    )
+    build = argparse.ArgumentParser(add_help=False, parents=[jobs])
+    build.add_argument(
+        '--profile', metavar='FILE',
+        help='profile the build with cProfile and dump the pstats data to FILE '
+             '(with --jobs, only the main process is profiled)',
+    )
+    sharded = argparse.ArgumentParser(add_help=False, parents=[build])
+    sharded.add_argument(
+        '--shard', metavar='I/N', type=_shard,
+        help='build only the articles of shard I of N (from 0, by SHARD_KEY) '
+             'into OUTPUT_DIR, for "merge"',
+    )
+
+    commands.add_parser('build', parents=[sharded], help=build_command.__doc__.strip())
+    watch = commands.add_parser('watch', parents=[jobs], help=watch_command.__doc__.strip())
+    watch.add_argument(
+        '--port', type=int, default=8000,
+        help='port of the preview server (default: 8000)',
+    )
+    deploy = commands.add_parser('deploy', parents=[build], help=deploy_command.__doc__.strip())
+    deploy.add_argument(
+        '--dry-run', action='store_true',
+        help='only show the files which would be uploaded or deleted',
+    )
+    report = commands.add_parser('stats', parents=[sharded], help=stats_command.__doc__.strip())
+    report.add_argument(
+        '--json', metavar='FILE',
+        help='also write the report to FILE as JSON',
+    )
+    report.add_argument(
+        '--top', type=int, default=10,
+        help='number of slowest articles shown (default: 10)',
+    )
+    merge = commands.add_parser('merge', parents=[jobs], help=merge_command.__doc__.strip())
+    merge.add_argument(
+        'directories', nargs='+', metavar='DIR',
+        help='output directories of all the shards',
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        nemulow = Nemulow(args.config)
+    except ValueError as error:
+        parser.error(f'{args.config}: {error}')
+    COMMANDS[args.command or 'build'](nemulow, args)
+
 
-        # Load configuration from environment variables instead of JSON
-        import os
-        self.config = dict(os.environ)
+if __name__ == '__main__':
+    main()
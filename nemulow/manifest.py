@@ -0,0 +1,321 @@
+"""
+Build manifest.
+
+The manifest records a content hash for every input of the build (article sources,
+templates and partials, configuration values) and which inputs each output was
+generated from. An output only has to be rebuilt when one of its inputs changed.
+
+It is kept in an SQLite database, so a build only reads the rows it looks up and
+the memory used does not grow with the size of the archive. An output stores one
+hash over all of its inputs and the input names; most outputs share all but their
+first input (templates and configuration values), so those lists are stored once.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+# configuration values that change the rendered pages
+CONFIG_KEYS = (
+    'SERVER_NAME',
+    'OUTPUT_DIR',
+    'DEST_PATH',
+    'BLOG_NAME',
+    'BLOG_URL',
+    'BLOG_DESCRIPTION',
+    'BLOG_IMAGE',
+    'BLOG_EMAIL',
+    'RELATED_SIZE',
+    'BLUESKY_API',
+    'SEARCH_SHARDS',
+)
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Return the content hash used by the manifest.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class BuildManifest:
+    """
+    Persistent record of input hashes and output dependencies.
+
+    Inputs are file paths, `env:KEY` for configuration values, or other
+    virtual inputs registered with `set_digest` (e.g. `asset:<name>`).
+    Outputs are file paths, or `build:<name>` for what a build only records
+    (e.g. that it went through all the pages).
+    File hashes are cached with the mtime and size of the file, so unchanged
+    files are not read again; a touched file is re-hashed but not rebuilt.
+    Changes are written as they are made and kept when `save()` commits them.
+    """
+
+    # bump this when the format of the records changes
+    VERSION = 4
+
+    # file hashes kept in memory; the others are looked up in the files table again
+    FILE_MEMO = 4096
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE IF NOT EXISTS files '
+        '(path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, hash TEXT)',
+        'CREATE TABLE IF NOT EXISTS groups (id INTEGER PRIMARY KEY, names TEXT UNIQUE)',
+        'CREATE TABLE IF NOT EXISTS outputs '
+        '(output TEXT PRIMARY KEY, hash TEXT, first TEXT, grp INTEGER)',
+        'CREATE TABLE IF NOT EXISTS records (source TEXT PRIMARY KEY, output TEXT, summary TEXT)',
+    )
+
+    def __init__(self, path: str):
+        """
+        Initialize the manifest stored in `path` (":memory:" for a temporary one).
+        Call `load()` to check that the stored records are usable.
+        """
+        self.path = path
+        self.config: Dict[str, str] = {}
+        self._digests: Dict[str, str] = {}
+        self._files: 'OrderedDict[str, str]' = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        # input name lists shared by the outputs: id -> names, names -> id
+        self._groups: Dict[int, List[str]] = {}
+        self._group_ids: Dict[str, int] = {}
+
+    def load(self) -> bool:
+        """
+        Open the manifest. Returns False if there was nothing usable
+        (no manifest, or one of another version, which is cleared).
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        try:
+            return self._open()
+        except sqlite3.DatabaseError:
+            # not a manifest database; start again
+            os.remove(self.path)
+            return self._open()
+
+    def _open(self) -> bool:
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute('PRAGMA synchronous = NORMAL')
+            for statement in self._SCHEMA:
+                db.execute(statement)
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            usable = row is not None and row[0] == str(self.VERSION)
+            if not usable:
+                for table in ('files', 'groups', 'outputs', 'records'):
+                    db.execute(f'DELETE FROM {table}')  # nosec B608
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                           (str(self.VERSION),))
+                db.commit()
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+        self._db = db
+        self._groups = {}
+        self._group_ids = {}
+        return usable
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """
+        The database connection, opened on first use.
+        """
+        if self._db is None:
+            self.load()
+        return self._db
+
+    def save(self):
+        """
+        Commit the changes to disk.
+        """
+        self.db.commit()
+
+    def close(self):
+        """
+        Close the database without committing.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def get_record(self, source: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the record of a source: {'output': path, 'summary': list or None}.
+        """
+        row = self.db.execute(
+            'SELECT output, summary FROM records WHERE source = ?', (source,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'output': row[0], 'summary': json.loads(row[1]) if row[1] else None}
+
+    def set_record(self, source: str, output: str, summary: Optional[Iterable[Any]] = None):
+        """
+        Store the output of a source and its summary record (saved as a list).
+        """
+        encoded = json.dumps(list(summary), ensure_ascii=False) if summary is not None else None
+        self.db.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                        (source, output, encoded))
+
+    def set_config(self, config: Mapping[str, str], keys: Iterable[str] = CONFIG_KEYS):
+        """
+        Register the configuration values which outputs can depend on.
+        """
+        self.config = {key: config.get(key, '') for key in keys}
+        for key, value in self.config.items():
+            self._digests[f'env:{key}'] = hash_bytes(value.encode('utf-8'))
+
+    def config_inputs(self) -> List[str]:
+        """
+        Return the input names of the registered configuration values.
+        """
+        return [f'env:{key}' for key in self.config]
+
+    def forget(self, names: Optional[Iterable[str]] = None):
+        """
+        Drop the hashes computed in this run, for `names` or for all inputs,
+        so they are checked again (used when the instance is kept between builds).
+        """
+        if names is None:
+            self._digests.clear()
+            self._files.clear()
+            return
+        targets = {os.path.normpath(name) for name in names}
+        for memo in (self._digests, self._files):
+            for name in [name for name in memo if os.path.normpath(name) in targets]:
+                del memo[name]
+
+    def set_digest(self, name: str, data: bytes) -> bool:
+        """
+        Register a virtual input (e.g. the article slice of a list page) by its content.
+        Returns False if it was registered with the same content before (and
+        not forgotten since).
+        """
+        digest = hash_bytes(data)
+        if self._digests.get(name) == digest:
+            return False
+        self._digests[name] = digest
+        return True
+
+    def digest(self, name: str) -> str:
+        """
+        Return the hash of an input. Missing inputs hash to an empty string.
+        """
+        if name in self._digests:
+            return self._digests[name]
+        if name in self._files:
+            self._files.move_to_end(name)
+            return self._files[name]
+        if name.startswith(('env:', 'asset:')):
+            return ''
+        try:
+            stat = os.stat(name)
+        except OSError:
+            return ''
+        row = self.db.execute(
+            'SELECT mtime, size, hash FROM files WHERE path = ?', (name,)
+        ).fetchone()
+        if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            digest = row[2]
+        else:
+            with open(name, 'rb') as file:
+                digest = hash_bytes(file.read())
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                            (name, stat.st_mtime_ns, stat.st_size, digest))
+        self._files[name] = digest
+        if len(self._files) > self.FILE_MEMO:
+            self._files.popitem(last=False)
+        return digest
+
+    def is_stale(self, output: str, inputs: Iterable[str]) -> bool:
+        """
+        Check if `output` has to be rebuilt from `inputs`.
+        """
+        recorded = self.recorded_inputs(output)
+        if recorded is None or not (output.startswith('build:') or os.path.exists(output)):
+            return True
+        inputs = list(inputs)
+        return recorded[1:] != inputs or recorded[0] != self._combined(inputs)
+
+    def recorded_inputs(self, output: str) -> Optional[List[str]]:
+        """
+        Return [hash of the inputs, input names...] recorded for `output`.
+        """
+        row = self.db.execute(
+            'SELECT hash, first, grp FROM outputs WHERE output = ?', (output,)
+        ).fetchone()
+        if row is None:
+            return None
+        digest, first, group = row
+        return [digest] + ([first] if first is not None else []) + self._group(group)
+
+    def record(self, output: str, inputs: Iterable[str]):
+        """
+        Record that `output` was built from the current state of `inputs`.
+        """
+        inputs = list(inputs)
+        first, rest = (inputs[0], inputs[1:]) if inputs else (None, [])
+        self.db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)',
+                        (output, self._combined(inputs), first, self._group_id(rest)))
+
+    def discard(self, output: str):
+        """
+        Forget an output which was removed.
+        """
+        self.db.execute('DELETE FROM outputs WHERE output = ?', (output,))
+
+    def _combined(self, inputs: List[str]) -> str:
+        return hash_bytes('\n'.join(self.digest(name) for name in inputs).encode('ascii'))
+
+    def _group(self, group: int) -> List[str]:
+        names = self._groups.get(group)
+        if names is None:
+            row = self.db.execute('SELECT names FROM groups WHERE id = ?', (group,)).fetchone()
+            names = [sys.intern(name) for name in json.loads(row[0])] if row else []
+            self._groups[group] = names
+        return names
+
+    def _group_id(self, names: List[str]) -> int:
+        key = json.dumps(names, ensure_ascii=False)
+        group = self._group_ids.get(key)
+        if group is None:
+            row = self.db.execute('SELECT id FROM groups WHERE names = ?', (key,)).fetchone()
+            if row is None:
+                group = self.db.execute('INSERT INTO groups (names) VALUES (?)', (key,)).lastrowid
+            else:
+                group = row[0]
+            self._group_ids[key] = group
+        return group
+
+    def dependents(self, name: str) -> List[str]:
+        """
+        Return the outputs which were built from the input `name`.
+        """
+        outputs = self.db.execute('SELECT output, first, grp FROM outputs')
+        return sorted(
+            output for output, first, group in outputs
+            if name == first or name in self._group(group)
+        )
+
+
+def template_dependencies(template_dir: str) -> List[str]:
+    """
+    Return the template files in `template_dir`, including the partials.
+    Every page depends on all of them since they include each other.
+    """
+    if not os.path.isdir(template_dir):
+        return []
+    return sorted(
+        os.path.join(template_dir, entry)
+        for entry in os.listdir(template_dir)
+        if os.path.isfile(os.path.join(template_dir, entry))
+    )
@@ -0,0 +1,138 @@
+"""
+Output writer.
+
+Pages are rendered to memory and only written when the bytes differ from the
+file already on disk. Unchanged files keep their mtime, so deploys only pick up
+files that really changed. Files are replaced atomically (temp file + rename),
+so a reader never sees a half-written page.
+
+Large files (feeds, sitemaps) can be streamed with `OutputWriter.open`: they are
+written to a temporary file, which replaces the target only if it differs.
+"""
+
+import filecmp
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, TextIO, Union
+
+import stats
+from manifest import hash_bytes
+
+
+def write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    """
+    Write `content` to `path` unless the file already has the same content.
+    Returns True if the file was written.
+    """
+    with stats.current.stage('write'):
+        return _write_if_changed(path, content)
+
+
+def _write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as file:
+                if hash_bytes(file.read()) == hash_bytes(data):
+                    return False
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+@contextmanager
+def open_if_changed(path: str, changed: List[bool]) -> Iterator[TextIO]:
+    """
+    Stream a text file to `path`, keeping the existing file if the content is
+    the same. Whether the file was written is appended to `changed`.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as file:
+            yield file
+        if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+            os.remove(tmp_path)
+            changed.append(False)
+        else:
+            os.replace(tmp_path, path)
+            changed.append(True)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputWriter:
+    """
+    Writes the generated files and keeps which were written, skipped or removed.
+    """
+
+    def __init__(self):
+        """
+        Initialize the writer with empty lists.
+        """
+        self.written: List[str] = []
+        self.unchanged: List[str] = []
+        self.removed: List[str] = []
+
+    @property
+    def skipped(self) -> int:
+        """
+        The number of files which were left unchanged.
+        """
+        return len(self.unchanged)
+
+    def write(self, path: str, content: Union[str, bytes]) -> bool:
+        """
+        Write a file if its content changed. Returns True if it was written.
+        """
+        changed = write_if_changed(path, content)
+        self.record(path, changed)
+        return changed
+
+    @contextmanager
+    def open(self, path: str) -> Iterator[TextIO]:
+        """
+        Stream a text file, which is only replaced if its content changed.
+        """
+        changed: List[bool] = []
+        with open_if_changed(path, changed) as file:
+            yield file
+        self.record(path, changed[0])
+
+    def record(self, path: str, changed: bool):
+        """
+        Count a file written elsewhere (e.g. by a worker process).
+        """
+        if changed:
+            self.written.append(path)
+        else:
+            self.unchanged.append(path)
+
+    def remove(self, path: str):
+        """
+        Remove a file which is no longer generated, if it exists.
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.removed.append(path)
+
+    def report(self) -> str:
+        """
+        Return a one-line summary of the counters.
+        """
+        return f'{len(self.written)} files written, {self.skipped} unchanged.'
@@ -0,0 +1,647 @@
+"""
+Related articles.
+
+Each article page lists the RELATED_SIZE articles most similar to it. The
+similarity of two articles is the estimated Jaccard similarity of their body
+terms plus LABEL_WEIGHT times the Jaccard similarity of their labels.
+
+The terms are the pairs of adjacent characters of the title and the text
+(normalized as in `search.tokenize`, tags removed with `Article._remove_tags`),
+without hiragana, which mostly writes particles and endings. The term set of an
+article is reduced to a MinHash signature of BINS 16-bit values (one
+permutation hashing), so every article takes the same small space.
+
+Up to EXACT_MAX articles, every pair of articles is compared: with NumPy in
+batches over the signature matrix, without it through the postings of the
+signature values, which find the same pairs. Past EXACT_MAX, the candidates
+are the articles which share a band of ROWS signature values (locality
+sensitive hashing) or a label of at most MAX_BUCKET articles, and their few
+candidates are scored without NumPy. When at most SCAN_MAX lists are
+computed again (e.g. after an edit), the bands of those articles are looked
+up in the signature matrix with NumPy instead of bucketing every article.
+
+Articles are read through the article cache, which the article pages then
+render from.
+
+The signatures and the lists are kept in a state file in the cache directory.
+When an article changes, only its own list is computed again; the other lists
+take it in or drop it as needed. NumPy is optional.
+"""
+
+import heapq
+import json
+import re
+import sys
+import unicodedata
+import zlib
+from array import array
+from contextlib import ExitStack
+from operator import eq
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from article import Article
+from article_list import split_labels
+from cache import ArticleCache
+from output import open_if_changed
+
+DEFAULT_SIZE = 5
+
+# signature values per article; EMPTY marks a bin without terms
+BINS = 64
+EMPTY = 0xffff
+
+# signature values per LSH band, and the largest bucket (or label) used for candidates
+ROWS = 2
+MAX_BUCKET = 100
+
+# archives up to this size compare every pair of articles
+EXACT_MAX = 2000
+
+# lists computed again past which the bands of all articles are bucketed
+SCAN_MAX = 200
+
+# bytes of the content keys kept to find the changed articles
+KEY_BYTES = 16
+
+LABEL_WEIGHT = 0.5
+MIN_SCORE = 0.05
+
+# two adjacent word characters other than hiragana (found at every position)
+_TERMS = re.compile(r'(?=([^\Wぁ-ゟ_]{2}))')
+
+
+class Features(NamedTuple):
+    """
+    What is shown of a related article, and its labels.
+    """
+
+    title: str
+    path: str
+    day: int
+    labels: Tuple[str, ...]
+
+
+def signature(terms: Iterable[str]) -> bytes:
+    """
+    Return the MinHash signature of a term set: for each of the BINS bins, the
+    smallest 16-bit hash of the terms which fall into it, or EMPTY.
+    """
+    values = [EMPTY] * BINS
+    for term in terms:
+        value = zlib.crc32(term.encode('utf-8'))
+        bin_ = value % BINS
+        value = (value >> 16) % EMPTY
+        if value < values[bin_]:
+            values[bin_] = value
+    return array('H', values).tobytes()
+
+
+# article cache of the current (worker) process, see _init_worker
+_cache: Optional[ArticleCache] = None
+
+
+def _init_worker(cache: Optional[ArticleCache]):
+    global _cache
+    _cache = cache
+
+
+def _read(source: str, key: str) -> Optional[Article]:
+    """
+    Return the parsed article, from the article cache if possible (a parsed
+    one is put there, so the page renders from it), or None if it is not a
+    Nemulow language source.
+    """
+    data = _cache.get(key) if _cache is not None else None
+    if data is not None:
+        return Article.from_cache(source, data)
+    article = Article(source)
+    if not article.read():
+        return None
+    if _cache is not None:
+        _cache.put(key, article.to_cache())
+    return article
+
+
+def features(task: Tuple[str, str]) -> Tuple[str, str, Optional[Features], bytes]:
+    """
+    Read one article and return (source, key, features, signature), with
+    features None if it is not a Nemulow language source. Runs in worker processes.
+    """
+    source, key = task
+    article = _read(source, key)
+    if article is None:
+        return source, key, None, b''
+    text = '\n'.join([article.title] + [text for _, text in article.article + article.see_more])
+    text = unicodedata.normalize('NFKC', Article._remove_tags(text)).lower()
+    terms = set(_TERMS.findall(text))
+    labels = tuple(sorted(set(split_labels(article.metadata.get('labels') or ''))))
+    found = Features(article.title, article.dst_path, int(article.date), labels)
+    return source, key, found, signature(terms)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class RelatedIndex:
+    """
+    The lists of related articles, updated article by article.
+    """
+
+    VERSION = 1
+
+    def __init__(self, state_path: str, size: int = DEFAULT_SIZE):
+        """
+        Initialize the index of `size` related articles per article, whose
+        state is kept in `state_path`.
+        """
+        self.state_path = state_path
+        self.size = size
+        self._clear()
+
+    def _clear(self):
+        # source file -> doc id; large archives keep one per article, so the
+        # items of the doc ids are kept in arrays and lists (None when unused)
+        self.docs: Dict[str, int] = {}
+        self._sources: List[Optional[str]] = []
+        # first KEY_BYTES bytes of the content key of the source when it was read
+        self._keys = bytearray()
+        # "title\npath" of the Nemulow articles (None for the other sources),
+        # date (YYYYMMDD) and labels ("a, b", interned)
+        self._links: List[Optional[str]] = []
+        self._days = array('i')
+        self._labels: List[str] = []
+        self._signatures = bytearray()
+        # related doc ids (-1 for none) and their scores, `size` per doc id
+        self._neighbors = array('i')
+        self._scores = array('d')
+        self._free: List[int] = []
+        # changes since the last compute()
+        self._updated: Set[int] = set()
+        self._removed: Set[int] = set()
+        self._retitled: Set[int] = set()
+        self._dirty = True
+        # sources whose related articles changed in the last compute()
+        self.changed: Set[str] = set()
+
+    def load(self) -> bool:
+        """
+        Load the state of the last build.
+        When it is missing, the index starts empty (every article is read again).
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                header = json.loads(file.readline() or '{}')
+                if (
+                    header.get('version') != self.VERSION
+                    or header.get('size') != self.size
+                    or header.get('bins') != BINS
+                ):
+                    return False
+                self._clear()
+                self._allocate(header['ids'])
+                for line in file:
+                    source, doc_id, key, entry = json.loads(line)
+                    source = sys.intern(source)
+                    self.docs[source] = doc_id
+                    self._sources[doc_id] = source
+                    self._keys[self._key_slice(doc_id)] = bytes.fromhex(key)
+                    if entry is None:
+                        continue
+                    title, path, day, labels, signature_hex, neighbors, scores = entry
+                    self._links[doc_id] = f'{title}\n{path}'
+                    self._days[doc_id] = day
+                    self._labels[doc_id] = sys.intern(labels)
+                    self._signatures[self._slice(doc_id)] = bytes.fromhex(signature_hex)
+                    start = doc_id * self.size
+                    self._neighbors[start:start + len(neighbors)] = array('i', neighbors)
+                    self._scores[start:start + len(scores)] = array('d', scores)
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            self._clear()
+            return False
+        self._free = sorted(
+            (doc_id for doc_id, source in enumerate(self._sources) if source is None),
+            reverse=True,
+        )
+        self._dirty = False
+        return True
+
+    def key(self, source: str) -> Optional[str]:
+        """
+        Return the content key (its first KEY_BYTES bytes) with which an
+        article was last read.
+        """
+        doc_id = self.docs.get(source)
+        return self._keys[self._key_slice(doc_id)].hex() if doc_id is not None else None
+
+    def update(self, source: str, key: str, found: Optional[Features], signature_: bytes):
+        """
+        Replace the features and the signature of one article (see `features`).
+        """
+        self._dirty = True
+        doc_id = self.docs.get(source)
+        if doc_id is None:
+            doc_id = self._free.pop() if self._free else self._allocate(1)
+            self.docs[source] = doc_id
+            self._sources[doc_id] = source
+        self._keys[self._key_slice(doc_id)] = bytes.fromhex(key[:KEY_BYTES * 2])
+        if found is None:
+            if self._links[doc_id] is not None:
+                self._removed.add(doc_id)
+            self._clear_doc(doc_id)
+            return
+        title, path, day, labels = found
+        link = f'{title}\n{path}'
+        if self._links[doc_id] != link or self._days[doc_id] != day:
+            self._retitled.add(doc_id)
+        self._links[doc_id] = link
+        self._days[doc_id] = day
+        self._labels[doc_id] = sys.intern(', '.join(labels))
+        self._signatures[self._slice(doc_id)] = signature_
+        self._updated.add(doc_id)
+
+    def retain(self, sources: Iterable[str]):
+        """
+        Remove the articles whose source is not in `sources`.
+        """
+        keep = set(sources)
+        for source in [source for source in self.docs if source not in keep]:
+            doc_id = self.docs.pop(source)
+            if self._links[doc_id] is not None:
+                self._removed.add(doc_id)
+            self._clear_doc(doc_id)
+            self._sources[doc_id] = None
+            self._free.append(doc_id)
+            self._dirty = True
+        self._free.sort(reverse=True)
+
+    def refresh(
+        self, sources: Iterable[Tuple[str, Optional[str]]], jobs: int = 1,
+        cache: Optional[ArticleCache] = None,
+    ):
+        """
+        Bring the index up to date with all articles, given as (source, content key):
+        removed articles are dropped, new and changed ones are read (in `jobs`
+        processes) and the lists which depend on them are computed again.
+        A key of None stands for a source known not to have changed since the
+        last refresh of the instance.
+        With `cache`, the articles are read through the article cache (keyed
+        by the content key), so an article is parsed once for its page and here.
+        """
+        sources = list(sources)
+        self.retain(source for source, _ in sources)
+        tasks = [
+            (source, key) for source, key in sources
+            if key is not None and self.key(source) != key[:KEY_BYTES * 2]
+        ]
+        with ExitStack() as stack:
+            if jobs > 1 and len(tasks) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=jobs, initializer=_init_worker, initargs=(cache,),
+                ))
+                results = executor.map(features, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+            else:
+                _init_worker(cache)
+                stack.callback(_init_worker, None)
+                results = map(features, tasks)
+            for source, key, found, signature_ in results:
+                self.update(source, key, found, signature_)
+        self.compute()
+
+    def links(self, source: str) -> List[Dict[str, str]]:
+        """
+        Return the related articles of a source for the article template:
+        [{'title': ..., 'path': ..., 'date': ...}, ...], most similar first.
+        """
+        doc_id = self.docs.get(source)
+        if doc_id is None:
+            return []
+        links = []
+        for other in self._row(doc_id):
+            title, path = self._links[other].split('\n')
+            links.append({'title': title, 'path': path, 'date': f'{self._days[other]:08d}'})
+        return links
+
+    def compute(self):
+        """
+        Compute the lists of the updated articles and of the articles which
+        listed an updated or removed article, and put the updated articles in
+        the other lists they now belong to.
+        Sets `changed` to the sources whose related articles changed.
+        """
+        updated, gone = self._updated, self._removed | self._updated
+        retitled = self._retitled
+        self._updated, self._removed, self._retitled = set(), set(), set()
+        self.changed = set()
+        if not gone:
+            return
+        live = [doc_id for doc_id, link in enumerate(self._links) if link is not None]
+        affected = set(updated)
+        for doc_id in live:
+            if any(other in gone for other in self._row(doc_id)):
+                affected.add(doc_id)
+        before = {doc_id: self._row(doc_id) for doc_id in affected}
+        with memoryview(self._signatures).cast('H') as values:
+            similarity = _Similarity(self, values, live, len(affected))
+            for doc_id in sorted(affected):
+                scored = similarity.scores(doc_id)
+                self._set_row(doc_id, heapq.nsmallest(
+                    self.size, ((-score, self._sources[other], other) for other, score in scored)
+                ))
+                if doc_id not in updated:
+                    continue
+                for other, score in scored:
+                    if other not in affected and self._offer(other, doc_id, score):
+                        before.setdefault(other, None)
+            # the signature matrix shares the buffer, which is resized by later updates
+            del similarity
+        for doc_id, row in before.items():
+            new_row = self._row(doc_id)
+            if new_row != row or any(other in retitled for other in new_row):
+                self.changed.add(self._sources[doc_id])
+
+    def save(self):
+        """
+        Write the state, if it changed.
+        """
+        if not self._dirty:
+            return
+        # written article by article: the state has a line for every article
+        with open_if_changed(self.state_path, []) as file:
+            file.write(json.dumps({
+                'version': self.VERSION, 'size': self.size, 'bins': BINS,
+                'ids': len(self._sources),
+            }) + '\n')
+            for source, doc_id in self.docs.items():
+                entry = None
+                if self._links[doc_id] is not None:
+                    title, path = self._links[doc_id].split('\n')
+                    row = self._row(doc_id)
+                    start = doc_id * self.size
+                    entry = [
+                        title, path, self._days[doc_id], self._labels[doc_id],
+                        self._signatures[self._slice(doc_id)].hex(),
+                        row, list(self._scores[start:start + len(row)]),
+                    ]
+                key = self._keys[self._key_slice(doc_id)].hex()
+                file.write(json.dumps([source, doc_id, key, entry], ensure_ascii=False) + '\n')
+        self._dirty = False
+
+    def _slice(self, doc_id: int) -> slice:
+        return slice(doc_id * BINS * 2, (doc_id + 1) * BINS * 2)
+
+    def _key_slice(self, doc_id: int) -> slice:
+        return slice(doc_id * KEY_BYTES, (doc_id + 1) * KEY_BYTES)
+
+    def _allocate(self, count: int) -> int:
+        """
+        Add `count` empty doc ids and return the first one.
+        """
+        first = len(self._sources)
+        self._sources.extend([None] * count)
+        self._keys.extend(bytes(KEY_BYTES * count))
+        self._links.extend([None] * count)
+        self._days.extend([0] * count)
+        self._labels.extend([''] * count)
+        self._signatures.extend(array('H', [EMPTY] * BINS * count).tobytes())
+        self._neighbors.extend([-1] * self.size * count)
+        self._scores.extend([0.0] * self.size * count)
+        return first
+
+    def _clear_doc(self, doc_id: int):
+        """
+        Forget the features and the related articles of a doc id.
+        """
+        self._links[doc_id] = None
+        self._days[doc_id] = 0
+        self._labels[doc_id] = ''
+        self._signatures[self._slice(doc_id)] = array('H', [EMPTY] * BINS).tobytes()
+        self._set_row(doc_id, [])
+        self._updated.discard(doc_id)
+
+    def _row(self, doc_id: int) -> List[int]:
+        start = doc_id * self.size
+        return [other for other in self._neighbors[start:start + self.size] if other >= 0]
+
+    def _set_row(self, doc_id: int, entries: List[Tuple[float, str, int]]):
+        """
+        Store the list of a doc id from (-score, source, doc id) entries, best first.
+        """
+        start = doc_id * self.size
+        for i in range(self.size):
+            if i < len(entries):
+                score, _, other = entries[i]
+                self._neighbors[start + i] = other
+                self._scores[start + i] = -score
+            else:
+                self._neighbors[start + i] = -1
+                self._scores[start + i] = 0.0
+
+    def _offer(self, doc_id: int, other: int, score: float) -> bool:
+        """
+        Put `other` in the list of `doc_id` if it is among the most similar.
+        Returns True if the list changed.
+        """
+        start = doc_id * self.size
+        entries = [
+            (-self._scores[start + i], self._sources[neighbor], neighbor)
+            for i, neighbor in enumerate(self._neighbors[start:start + self.size])
+            if neighbor >= 0
+        ]
+        entry = (-score, self._sources[other], other)
+        if len(entries) == self.size and entry >= entries[-1]:
+            return False
+        self._set_row(doc_id, sorted(entries + [entry])[:self.size])
+        return True
+
+
+class _Similarity:
+    """
+    Finds and scores the articles similar to a given one, for one compute().
+    """
+
+    def __init__(self, index: RelatedIndex, values: memoryview, live: List[int], count: int):
+        """
+        Set up the search of the candidates for `count` articles.
+        """
+        self.index = index
+        self.values = values
+        self.live = live
+        self.exact = len(live) <= EXACT_MAX
+        # NumPy pays off when every pair is compared, or to look up the bands of
+        # a few articles; otherwise the few candidates of an article are
+        # scored without the memory of the module
+        self.numpy = _numpy() if self.exact or count <= SCAN_MAX else None
+        self._masks: Dict[int, int] = {}
+        self._matrix = None
+        self._bands = None
+        # with NumPy, every article is a candidate of the exact comparison
+        self._all = self.exact and self.numpy is not None
+        self._scan = not self.exact and self.numpy is not None
+        self._buckets = {} if self._all or self._scan else self._band_buckets()
+        # label sets by labels string, shared by the articles with the same labels
+        self._label_sets: Dict[str, FrozenSet[str]] = {}
+        self._labels = self._label_postings()
+
+    def scores(self, doc_id: int) -> List[Tuple[int, float]]:
+        """
+        Return [(other doc id, score)] of the articles similar to `doc_id`
+        (score at least MIN_SCORE).
+        """
+        labels = self._label_set(doc_id)
+        if self._all:
+            candidates = [other for other in self.live if other != doc_id]
+        else:
+            found: Set[int] = set()
+            if self._scan:
+                found.update(self._band_matches(doc_id))
+            else:
+                for key in self._keys(doc_id):
+                    found.update(self._buckets.get(key, ()))
+            for label in labels:
+                found.update(self._labels.get(label, ()))
+            found.discard(doc_id)
+            candidates = list(found)
+        terms = self._term_scores(doc_id, candidates)
+        scored = []
+        for other, score in zip(candidates, terms):
+            if labels:
+                other_labels = self._label_set(other)
+                if other_labels:
+                    shared = len(labels & other_labels)
+                    score += LABEL_WEIGHT * shared / (len(labels) + len(other_labels) - shared)
+            if score >= MIN_SCORE:
+                scored.append((other, score))
+        return scored
+
+    def _label_set(self, doc_id: int) -> FrozenSet[str]:
+        labels = self.index._labels[doc_id]
+        found = self._label_sets.get(labels)
+        if found is None:
+            found = self._label_sets[labels] = frozenset(split_labels(labels))
+        return found
+
+    def _signature(self, doc_id: int) -> memoryview:
+        return self.values[doc_id * BINS:(doc_id + 1) * BINS]
+
+    def _keys(self, doc_id: int) -> List[int]:
+        """
+        Return the bucket keys of an article (see _band_key) for its bands of
+        ROWS values (each value on its own when every pair is compared).
+        """
+        rows = 1 if self.exact else ROWS
+        keys = []
+        for start in range(0, BINS, rows):
+            key = self._band_key(doc_id, start, rows)
+            if key is not None:
+                keys.append(key)
+        return keys
+
+    def _band_key(self, doc_id: int, start: int, rows: int) -> Optional[int]:
+        """
+        Return the key of the band of `rows` values from bin `start`: the bin
+        and the values packed in one integer, or None if a bin is empty.
+        """
+        key = start
+        offset = doc_id * BINS + start
+        for value in self.values[offset:offset + rows]:
+            if value == EMPTY:
+                return None
+            key = key << 16 | value
+        return key
+
+    def _band_buckets(self) -> Dict[int, List[int]]:
+        """
+        Return the doc ids by bucket key, for the buckets of several articles
+        (and at most MAX_BUCKET when past EXACT_MAX).
+        """
+        rows = 1 if self.exact else ROWS
+        limit = len(self.live) if self.exact else MAX_BUCKET
+        buckets: Dict[int, List[int]] = {}
+        # band by band, so that only the keys of one band are held at a time
+        for start in range(0, BINS, rows):
+            band: Dict[int, List[int]] = {}
+            for doc_id in self.live:
+                key = self._band_key(doc_id, start, rows)
+                if key is None:
+                    continue
+                ids = band.get(key)
+                if ids is None:
+                    band[key] = [doc_id]
+                else:
+                    ids.append(doc_id)
+            buckets.update((key, ids) for key, ids in band.items() if 1 < len(ids) <= limit)
+        return buckets
+
+    def _band_matches(self, doc_id: int) -> List[int]:
+        """
+        Return the doc ids in the buckets of an article, as `_band_buckets`
+        would find them, from the signature matrix.
+        """
+        np = self.numpy
+        if self._bands is None:
+            # a band of ROWS 16-bit values as one integer
+            self._bands = self._signature_matrix().view(f'u{2 * ROWS}')
+        own = self._signature_matrix()[doc_id].reshape(-1, ROWS)
+        # the unused doc ids have EMPTY signatures, which match no band
+        matches = self._bands == self._bands[doc_id]
+        counts = matches.sum(axis=0)
+        bands = (counts > 1) & (counts <= MAX_BUCKET) & (own != EMPTY).all(axis=1)
+        return np.flatnonzero(matches[:, bands].any(axis=1)).tolist()
+
+    def _signature_matrix(self):
+        if self._matrix is None:
+            np = self.numpy
+            self._matrix = np.frombuffer(self.values, dtype=np.uint16).reshape(-1, BINS)
+        return self._matrix
+
+    def _label_postings(self) -> Dict[str, List[int]]:
+        postings: Dict[str, List[int]] = {}
+        for doc_id in self.live:
+            for label in self._label_set(doc_id):
+                postings.setdefault(label, []).append(doc_id)
+        limit = len(self.live) if self.exact else MAX_BUCKET
+        return {label: ids for label, ids in postings.items() if 1 < len(ids) <= limit}
+
+    def _term_scores(self, doc_id: int, candidates: List[int]) -> List[float]:
+        """
+        Return the estimated Jaccard similarity of the terms of `doc_id` and
+        of each candidate: the matching signature values over the bins which
+        are not empty in both.
+        """
+        if self.numpy is not None and candidates:
+            np = self.numpy
+            matrix = self._signature_matrix()
+            own = matrix[doc_id]
+            rows = matrix[candidates]
+            filled = own != EMPTY
+            union = ((rows != EMPTY) | filled).sum(axis=1)
+            matches = ((rows == own) & filled).sum(axis=1)
+            scores = np.zeros(len(candidates))
+            np.divide(matches, union, out=scores, where=union > 0)
+            return scores.tolist()
+        own = self._signature(doc_id)
+        own_mask = self._mask(doc_id)
+        scores = []
+        for other in candidates:
+            union = (own_mask | self._mask(other)).bit_count()
+            # bins empty in both compare equal too
+            matches = sum(map(eq, own, self._signature(other))) - (BINS - union)
+            scores.append(matches / union if union else 0.0)
+        return scores
+
+    def _mask(self, doc_id: int) -> int:
+        mask = self._masks.get(doc_id)
+        if mask is None:
+            mask = 0
+            for bin_, value in enumerate(self._signature(doc_id)):
+                if value != EMPTY:
+                    mask |= 1 << bin_
+            self._masks[doc_id] = mask
+        return mask
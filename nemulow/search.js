@@ -0,0 +1,117 @@
+// Nemulow search runtime (see nemulow/search.py)
+//
+//   <form id="search-form"><input type="search" name="q"></form>
+//   <ol id="search-results"></ol>
+//   <script src="/search/search.js" defer></script>
+//
+// nemulowSearch(query) returns a promise of [{title, path, date}], newest first.
+(function () {
+    var base = new URL('.', document.currentScript.src);
+    var cache = {};
+
+    function load(name) {
+        if (!cache[name]) {
+            cache[name] = fetch(new URL(name, base)).then(function (r) { return r.json(); });
+        }
+        return cache[name];
+    }
+
+    // same terms as tokenize() in search.py, with the same word characters
+    function tokenize(text) {
+        var words = text.normalize('NFKC').toLowerCase().match(/[\p{L}\p{M}\p{N}_]+/gu) || [];
+        var terms = [];
+        words.forEach(function (word) {
+            var chars = Array.from(word);
+            if (chars.length === 1) terms.push(chars[0]);
+            for (var i = 0; i + 1 < chars.length; i++) terms.push(chars[i] + chars[i + 1]);
+        });
+        return terms.filter(function (t, i) { return terms.indexOf(t) === i; });
+    }
+
+    // FNV-1a over the UTF-16 code units, the same as shard_of() in search.py
+    function shardOf(term) {
+        var h = 0x811c9dc5;
+        for (var i = 0; i < term.length; i++) {
+            h = Math.imul(h ^ term.charCodeAt(i), 0x01000193) >>> 0;
+        }
+        return h % NEMULOW_SEARCH_SHARDS;
+    }
+
+    function decode(deltas) {
+        var ids = [], last = 0;
+        (deltas || []).forEach(function (delta) { ids.push(last += delta); });
+        return ids;
+    }
+
+    // the deltas and, for each of them, the ids removed by the later ones
+    var segments;
+    function deltas() {
+        if (!segments) {
+            segments = Promise.all(NEMULOW_SEARCH_DELTAS.map(function (delta) {
+                return load('delta-' + delta + '.json');
+            })).then(function (deltas) {
+                var removed = new Set(), later = [];
+                for (var i = deltas.length - 1; i >= 0; i--) {
+                    later[i] = new Set(removed);
+                    deltas[i].removed.forEach(function (id) { removed.add(id); });
+                }
+                return { deltas: deltas, later: later, removed: removed };
+            });
+        }
+        return segments;
+    }
+
+    function postings(term) {
+        return Promise.all([load('shard-' + shardOf(term) + '.json'), deltas()]).then(function (parts) {
+            var segments = parts[1];
+            var ids = decode(parts[0][term]).filter(function (id) { return !segments.removed.has(id); });
+            segments.deltas.forEach(function (delta, i) {
+                decode(delta.postings[term]).forEach(function (id) {
+                    if (!segments.later[i].has(id)) ids.push(id);
+                });
+            });
+            return ids;
+        });
+    }
+
+    window.nemulowSearch = function (query, limit) {
+        var terms = tokenize(query);
+        if (!terms.length) return Promise.resolve([]);
+        return Promise.all(terms.map(postings)).then(function (lists) {
+            lists.sort(function (a, b) { return a.length - b.length; });
+            var ids = lists.reduce(function (found, list) {
+                var set = new Set(list);
+                return found.filter(function (id) { return set.has(id); });
+            });
+            return Promise.all(ids.map(function (id) {
+                return load('docs-' + Math.floor(id / NEMULOW_SEARCH_CHUNK) + '.json').then(function (docs) {
+                    var doc = docs[id % NEMULOW_SEARCH_CHUNK];
+                    return doc && { title: doc[0], path: doc[1], date: doc[2] };
+                });
+            }));
+        }).then(function (docs) {
+            docs = docs.filter(Boolean).sort(function (a, b) { return a.date < b.date ? 1 : -1; });
+            return docs.slice(0, limit || 50);
+        });
+    };
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var form = document.getElementById('search-form');
+        var results = document.getElementById('search-results');
+        if (!form || !results) return;
+        form.addEventListener('submit', function (event) {
+            event.preventDefault();
+            nemulowSearch(form.elements.q.value).then(function (docs) {
+                results.textContent = '';
+                docs.forEach(function (doc) {
+                    var item = document.createElement('li');
+                    var link = document.createElement('a');
+                    link.href = new URL('../article/' + doc.path, base);
+                    link.textContent = doc.title;
+                    item.appendChild(link);
+                    results.appendChild(item);
+                });
+            });
+        });
+    });
+})();
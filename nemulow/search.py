@@ -0,0 +1,425 @@
+"""
+Client-side full-text search.
+
+The build writes a static inverted index under `search/` in the output
+directory, which `search.js` queries in the browser:
+
+- `shard-N.json`: postings of the terms whose hash falls into shard N,
+  {term: [doc id deltas]}. A query only fetches the shards of its terms.
+- `delta-K.json`: the changes of the builds since the shards were written,
+  {"removed": [doc ids], "postings": {term: [doc id deltas]}}. The ids
+  removed by a delta are dropped from the shards and the earlier deltas.
+- `docs-N.json`: [title, path, date] of the documents N*DOCS_PER_CHUNK..., fetched
+  for the documents in the results.
+
+Terms are character unigrams and bigrams of the normalized text (NFKC, lower
+case), which works for Japanese without a dictionary. Titles, labels and
+the body text (tags removed with `Article._remove_tags`) are indexed.
+
+The terms of one article fall into nearly every shard, so a build which
+changed a few articles only writes one new delta (and the document chunks
+of those articles) instead of rewriting the shards. When there are more
+than MAX_DELTAS deltas they are merged into one, and when their postings
+reach DELTA_RATIO of the postings in the shards they are folded into the
+shards. The document ids and the deltas are kept in a state file in the
+cache directory.
+
+Memory is bounded: when more than SPILL_POSTINGS new postings are pending
+(e.g. on the first build of a large archive), they are appended to run files
+next to the state file and merged shard by shard when the index is saved.
+"""
+
+import itertools
+import json
+import os
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from article import Article, ArticleSummary
+from output import OutputWriter, open_if_changed
+
+DEFAULT_SHARDS = 64
+DOCS_PER_CHUNK = 1000
+
+# pending postings kept in memory before they are spilled to run files
+SPILL_POSTINGS = 250_000
+
+# deltas kept before they are merged into one
+MAX_DELTAS = 8
+# share of the postings in the shards from which the deltas are folded into them
+DELTA_RATIO = 0.1
+
+_RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search.js')
+
+
+# the planes in which Unicode assigns marks (the basic and supplementary
+# multilingual planes, and the variation selectors of plane 14)
+_MARK_PLANES = (range(0x20000), range(0xe0000, 0xe1000))
+
+
+@lru_cache(maxsize=None)
+def _words() -> 're.Pattern[str]':
+    """
+    Return the pattern of a run of word characters: letters, marks, numbers
+    and "_", the class [\\p{L}\\p{M}\\p{N}_] of search.js. \\w of re holds
+    the letters, numbers and "_"; the marks are listed from unicodedata.
+    """
+    ranges: List[List[int]] = []
+    for plane in _MARK_PLANES:
+        for code in plane:
+            if unicodedata.category(chr(code)).startswith('M'):
+                if ranges and ranges[-1][1] == code - 1:
+                    ranges[-1][1] = code
+                else:
+                    ranges.append([code, code])
+    marks = ''.join(f'\\U{first:08x}-\\U{last:08x}' for first, last in ranges)
+    return re.compile(f'[\\w{marks}]+')
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    Return the terms of `text`: every character and every pair of adjacent
+    characters in each run of word characters. See also tokenize() in search.js.
+    """
+    terms: Set[str] = set()
+    for word in _words().findall(unicodedata.normalize('NFKC', text).lower()):
+        terms.update(word)
+        terms.update(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def document_terms(summary: ArticleSummary, body_html: str) -> List[str]:
+    """
+    Return the sorted terms of an article.
+    """
+    text = '\n'.join([summary.title, summary.labels, Article._remove_tags(body_html)])
+    return sorted(tokenize(text))
+
+
+@lru_cache(maxsize=1 << 16)
+def shard_of(term: str, shards: int) -> int:
+    """
+    Return the shard of a term: FNV-1a over its UTF-16 code units, the same
+    hash as in search.js.
+    """
+    data = term.encode('utf-16-le')
+    value = 0x811c9dc5
+    for i in range(0, len(data), 2):
+        value ^= data[i] | data[i + 1] << 8
+        value = (value * 0x01000193) & 0xffffffff
+    return value % shards
+
+
+def _encode(ids: Iterable[int]) -> List[int]:
+    ids = sorted(set(ids))
+    return ids[:1] + [b - a for a, b in zip(ids, ids[1:])]
+
+
+def _decode(deltas: Iterable[int]) -> Iterator[int]:
+    return itertools.accumulate(deltas)
+
+
+def _combine(segments: List[tuple]) -> tuple:
+    """
+    Combine (removed ids, {term: [doc ids]}) segments, oldest first, into one:
+    the postings of a segment are dropped for the ids removed by a later one.
+    """
+    removed: Set[int] = set()
+    postings: Dict[str, List[int]] = {}
+    for segment_removed, segment_postings in reversed(segments):
+        for term, ids in segment_postings.items():
+            kept = [doc_id for doc_id in ids if doc_id not in removed]
+            if kept:
+                postings.setdefault(term, []).extend(kept)
+        removed |= segment_removed
+    return removed, postings
+
+
+class SearchIndex:
+    """
+    The search index of the output directory, updated article by article.
+    """
+
+    VERSION = 5
+
+    def __init__(self, state_path: str, output_dir: str, shards: int = DEFAULT_SHARDS):
+        """
+        Initialize the index written to `output_dir`/search, whose state
+        (document ids and deltas) is kept in `state_path`.
+        """
+        self.state_path = state_path
+        self.directory = os.path.join(output_dir, 'search')
+        self.shards = shards
+        # source file -> doc id
+        self.docs: Dict[str, int] = {}
+        self._free: List[int] = []
+        # postings in the shards, and [number, postings] of the live deltas
+        self.postings = 0
+        self.deltas: List[List[int]] = []
+        self._next_delta = 0
+        # changes not written yet
+        self._removed: Set[int] = set()
+        self._added: Dict[int, Dict[str, List[int]]] = {}
+        self._pending = 0
+        self._spilled: Set[int] = set()
+        self._entries: Dict[int, Optional[list]] = {}
+        # write every index file from scratch
+        self._rebuild = True
+
+    def load(self) -> bool:
+        """
+        Load the state of the last build.
+        When the state or the index files are missing, the index starts empty
+        (every article is then indexed again).
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if (
+            data.get('version') != self.VERSION
+            or data.get('shards') != self.shards
+            or not os.path.exists(self._shard_path(0))
+            or not all(os.path.exists(self._delta_path(delta)) for delta, _ in data['deltas'])
+        ):
+            return False
+        self.docs = data['docs']
+        self.postings = data['postings']
+        self.deltas = data['deltas']
+        self._next_delta = data['next']
+        used = set(self.docs.values())
+        self._free = sorted(set(range(max(used, default=-1) + 1)) - used, reverse=True)
+        self._rebuild = False
+        return True
+
+    def update(self, source: str, summary: ArticleSummary, terms: Iterable[str]):
+        """
+        Replace the postings and the entry of one article.
+        """
+        doc_id = self.docs.get(source)
+        if doc_id is not None:
+            self._removed.add(doc_id)
+        else:
+            doc_id = self._free.pop() if self._free else self._next_id()
+        count = 0
+        for term in terms:
+            shard = shard_of(term, self.shards)
+            postings = self._added.get(shard)
+            if postings is None:
+                postings = self._added[shard] = {}
+            ids = postings.get(term)
+            if ids is None:
+                postings[sys.intern(term)] = [doc_id]
+            else:
+                ids.append(doc_id)
+            count += 1
+        self.docs[source] = doc_id
+        self._entries[doc_id] = [summary.title, summary.path, summary.date]
+        self._pending += count
+        if self._pending > SPILL_POSTINGS:
+            self._spill()
+
+    def retain(self, sources: Iterable[str]):
+        """
+        Remove the articles whose source is not in `sources`.
+        """
+        keep = set(sources)
+        for source in [source for source in self.docs if source not in keep]:
+            doc_id = self.docs.pop(source)
+            self._removed.add(doc_id)
+            self._entries[doc_id] = None
+            self._free.append(doc_id)
+        self._free.sort(reverse=True)
+
+    def _next_id(self) -> int:
+        return len(self.docs) + len(self._free)
+
+    def _run_path(self, shard: int) -> str:
+        return os.path.splitext(self.state_path)[0] + f'-runs/shard-{shard}.jsonl'
+
+    def _spill(self):
+        """
+        Append the pending postings to the run files of their shards.
+        """
+        for shard, postings in self._added.items():
+            path = self._run_path(shard)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # run files left by an interrupted build are started again
+            with open(path, 'a' if shard in self._spilled else 'w', encoding='utf-8') as file:
+                file.write(json.dumps(postings, ensure_ascii=False, separators=(',', ':')))
+                file.write('\n')
+            self._spilled.add(shard)
+        self._added = {}
+        self._pending = 0
+
+    def _runs(self, shard: int) -> Iterator[Dict[str, List[int]]]:
+        if shard not in self._spilled:
+            return
+        with open(self._run_path(shard), 'r', encoding='utf-8') as file:
+            for line in file:
+                yield json.loads(line)
+        os.remove(self._run_path(shard))
+        try:
+            os.rmdir(os.path.dirname(self._run_path(shard)))
+        except OSError:
+            pass
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f'shard-{shard}.json')
+
+    def _delta_path(self, delta: int) -> str:
+        return os.path.join(self.directory, f'delta-{delta}.json')
+
+    def _docs_path(self, chunk: int) -> str:
+        return os.path.join(self.directory, f'docs-{chunk}.json')
+
+    @staticmethod
+    def _read(path: str, default):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return default
+
+    @staticmethod
+    def _dump(data) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+    def _read_delta(self, delta: int) -> tuple:
+        data = self._read(self._delta_path(delta), {})
+        postings = {
+            term: list(_decode(deltas)) for term, deltas in data.get('postings', {}).items()
+        }
+        return set(data.get('removed', [])), postings
+
+    def _write_shards(self, writer: OutputWriter, written: List[str]):
+        """
+        Fold the deltas and the pending changes into the shards.
+        """
+        segments = [self._read_delta(delta) for delta, _ in self.deltas]
+        removed, added = _combine(segments + [(self._removed, {})])
+        by_shard: Dict[int, Dict[str, List[int]]] = {}
+        for term, ids in added.items():
+            by_shard.setdefault(shard_of(term, self.shards), {})[term] = ids
+        self.postings = 0
+        for shard in range(self.shards):
+            path = self._shard_path(shard)
+            postings: Dict[str, List[int]] = {}
+            previous = {} if self._rebuild else self._read(path, {})
+            for term, deltas in previous.items():
+                postings[term] = [doc_id for doc_id in _decode(deltas) if doc_id not in removed]
+            for added in itertools.chain(
+                [by_shard.get(shard, {})], self._runs(shard), [self._added.get(shard, {})],
+            ):
+                for term, ids in added.items():
+                    if term in postings:
+                        postings[term].extend(ids)
+                    else:
+                        postings[term] = ids
+            encoded = {}
+            for term, ids in postings.items():
+                if ids:
+                    encoded[term] = _encode(ids)
+                    self.postings += len(encoded[term])
+            writer.write(path, self._dump(encoded))
+            written.append(path)
+        self.deltas = []
+
+    def _write_delta(self, writer: OutputWriter, written: List[str]):
+        """
+        Write the pending changes as a new delta, merged with the live deltas
+        when there are MAX_DELTAS of them.
+        """
+        removed = self._removed
+        postings = {
+            term: ids for added in self._added.values() for term, ids in added.items()
+        }
+        if len(self.deltas) >= MAX_DELTAS:
+            segments = [self._read_delta(delta) for delta, _ in self.deltas]
+            removed, postings = _combine(segments + [(removed, postings)])
+            self.deltas = []
+        encoded = {term: _encode(ids) for term, ids in postings.items()}
+        delta = self._next_delta
+        self._next_delta += 1
+        path = self._delta_path(delta)
+        writer.write(path, self._dump({'removed': sorted(removed), 'postings': encoded}))
+        written.append(path)
+        self.deltas.append([delta, sum(map(len, encoded.values()))])
+
+    def save(self, writer: Optional[OutputWriter] = None) -> List[str]:
+        """
+        Write the pending changes (a delta, or the shards when the deltas are
+        folded into them) and the changed document chunks, the runtime and the
+        state. Returns the list of written index files.
+        """
+        if writer is None:
+            writer = OutputWriter()
+        written: List[str] = []
+        changed = self._rebuild or bool(self._entries)
+        live = {delta for delta, _ in self.deltas}
+        if (
+            self._rebuild
+            or self._spilled
+            or sum(postings for _, postings in self.deltas) + self._pending
+            > self.postings * DELTA_RATIO
+        ):
+            self._write_shards(writer, written)
+        elif self._removed or self._added:
+            self._write_delta(writer, written)
+
+        chunks: Dict[int, List[int]] = {}
+        for doc_id in self._entries:
+            chunks.setdefault(doc_id // DOCS_PER_CHUNK, []).append(doc_id)
+        for chunk, doc_ids in sorted(chunks.items()):
+            path = self._docs_path(chunk)
+            entries = self._read(path, []) if not self._rebuild else []
+            for doc_id in doc_ids:
+                offset = doc_id - chunk * DOCS_PER_CHUNK
+                entries.extend([None] * (offset + 1 - len(entries)))
+                entries[offset] = self._entries[doc_id]
+            while entries and entries[-1] is None:
+                entries.pop()
+            writer.write(path, self._dump(entries))
+            written.append(path)
+
+        with open(_RUNTIME, 'rb') as file:
+            runtime = file.read()
+        deltas = [delta for delta, _ in self.deltas]
+        config = (
+            f'var NEMULOW_SEARCH_SHARDS={self.shards},NEMULOW_SEARCH_CHUNK={DOCS_PER_CHUNK},'
+            f'NEMULOW_SEARCH_DELTAS={json.dumps(deltas, separators=(",", ":"))};\n'
+        )
+        writer.write(os.path.join(self.directory, 'search.js'), config.encode('utf-8') + runtime)
+
+        if self._rebuild:
+            # files of a previous index with another layout
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith('.json') and path not in written:
+                    writer.remove(path)
+        else:
+            # deltas merged or folded into the shards
+            for delta in sorted(live - set(deltas)):
+                writer.remove(self._delta_path(delta))
+        self._removed, self._added, self._entries = set(), {}, {}
+        self._pending = 0
+        self._spilled = set()
+        self._rebuild = False
+        if not changed:
+            return written
+        # written entry by entry: the state has a line for every article
+        with open_if_changed(self.state_path, []) as file:
+            file.write(
+                f'{{"version":{self.VERSION},"shards":{self.shards},"postings":{self.postings},'
+                f'"next":{self._next_delta},"deltas":{json.dumps(self.deltas)},"docs":{{\n'
+            )
+            separator = ''
+            for source, doc_id in self.docs.items():
+                file.write(f'{separator}{json.dumps(source, ensure_ascii=False)}:{doc_id}')
+                separator = ',\n'
+            file.write('\n}}\n')
+        return written
@@ -0,0 +1,269 @@
+"""
+Sharded builds.
+
+A large archive can be built by several machines (or processes) at once.
+Each of them builds one shard, `nemulow build --shard I/N`, into its own
+OUTPUT_DIR and CACHE_DIR: only the article pages of the articles in shard I
+are rendered, and their records are written to `shard.jsonl` in the output
+directory. `nemulow merge DIR...` then copies the article pages of all shards
+to its OUTPUT_DIR and builds the list pages, label and date archives, feeds,
+sitemap and search index from the records, as a build of the whole archive
+would. The result does not depend on the order of the shard directories.
+
+Articles are assigned to the shards by a stable key (SHARD_KEY):
+
+- year: the year of the YYYYMMDD filename prefix, so the articles of a year
+  are built by the same shard (articles without a date go by hash),
+- hash: a hash of the filename, which spreads the articles evenly.
+
+Every shard computes the related articles over all sources, so the pages
+are the same as in a single build.
+
+The records file has a header line, then one line per article:
+[filename, summary record, excerpt, text summary, search terms], in the order
+of the filenames, so the merge reads the shards side by side. The lines of
+unchanged articles are copied from the records of the last build.
+"""
+
+import heapq
+import json
+import os
+import re
+import zlib
+from contextlib import ExitStack
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from article import ArticleSummary
+from compress import ENCODINGS
+from fragments import BODY, EXCERPT, SUMMARY, FragmentCache
+from manifest import BuildManifest
+from output import open_if_changed
+from search import document_terms
+from utils import get_article_sources
+
+RECORDS = 'shard.jsonl'
+VERSION = 1
+
+SHARD_KEYS = ('year', 'hash')
+
+_YEAR = re.compile(r'^(\d{4})\d{4}')
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parse a shard given as "I/N" (shard I of N, counted from 0).
+    Raises ValueError if it is not valid.
+    """
+    match = re.match(r'^(\d+)/(\d+)$', value.strip())
+    if not match or not int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f'shard must be I/N with 0 <= I < N: {value!r}')
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_of(article: str, count: int, key: str = 'year') -> int:
+    """
+    Return the shard of an article filename among `count` shards.
+    """
+    if key not in SHARD_KEYS:
+        raise ValueError(f'unknown shard key: {key}')
+    match = _YEAR.match(article)
+    if key == 'year' and match:
+        return int(match.group(1)) % count
+    return zlib.crc32(article.encode('utf-8')) % count
+
+
+def built_articles(
+    articles: List[str], src_dir: str, manifest: BuildManifest,
+) -> Iterator[Tuple[str, ArticleSummary]]:
+    """
+    Yield the (filename, summary) of the Nemulow articles among `articles`,
+    from the records of the build in `manifest`.
+    """
+    for name, source in zip(articles, get_article_sources(articles, src_dir)):
+        record = manifest.get_record(source)
+        if record is not None and record['summary']:
+            yield name, ArticleSummary.from_record(record['summary'])
+
+
+def write_records(
+    path: str,
+    shard: Tuple[int, int],
+    key: str,
+    articles: Iterable[Tuple[str, ArticleSummary]],
+    fragments: FragmentCache,
+) -> bool:
+    """
+    Write the records of the (filename, summary) of the articles of a shard.
+    The fragments and terms of new or changed articles are taken from `fragments`.
+    Returns True if the file changed.
+    """
+    previous = _offsets(path)
+    changed: List[bool] = []
+    with ExitStack() as stack:
+        file = stack.enter_context(open_if_changed(path, changed))
+        # closed first: the new file replaces it when the stack is left
+        old = stack.enter_context(open(path, 'rb')) if previous else None
+        file.write(_dump({'version': VERSION, 'shard': list(shard), 'key': key}))
+        for name, summary in articles:
+            entry = previous.get(name)
+            if entry is not None and entry[0] == summary.key:
+                old.seek(entry[1])
+                file.write(old.readline().decode('utf-8'))
+                continue
+            file.write(_dump([
+                name,
+                list(summary),
+                fragments.get(summary.key, EXCERPT),
+                fragments.get(summary.key, SUMMARY),
+                document_terms(summary, fragments.get(summary.key, BODY)),
+            ]))
+    return changed[0]
+
+
+def _offsets(path: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Return the content key and the offset of the line of each article in a records file.
+    """
+    offsets = {}
+    try:
+        with open(path, 'rb') as file:
+            header = json.loads(file.readline())
+            if header.get('version') != VERSION:
+                return {}
+            offset = file.tell()
+            for line in file:
+                name, summary = json.loads(line)[:2]
+                offsets[name] = (ArticleSummary.from_record(summary).key, offset)
+                offset += len(line)
+    except (OSError, ValueError, TypeError, AttributeError):
+        return {}
+    return offsets
+
+
+def _dump(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class ShardRecord(NamedTuple):
+    """
+    The record of one article of a shard.
+    """
+    name: str
+    summary: ArticleSummary
+    fragments: Dict[str, str]
+    terms: List[str]
+
+
+class ShardSet:
+    """
+    The outputs of the shards of a sharded build, read side by side.
+    Use it as a context manager: the records files are kept open.
+    """
+
+    def __init__(self, directories: Iterable[str]):
+        """
+        Initialize the set of shard output directories.
+        """
+        self.directories = list(directories)
+        self.key = ''
+        self._paths: List[str] = []
+        self._files: List[Optional[BinaryIO]] = []
+        # content key -> (shard, offset of the line), to load evicted fragments
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def __enter__(self) -> 'ShardSet':
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        """
+        Read the headers of the records and put the shards in order.
+        Raises ValueError unless the directories are all shards of the same build.
+        """
+        shards: Dict[int, str] = {}
+        counts, keys = set(), set()
+        for directory in self.directories:
+            path = os.path.join(directory, RECORDS)
+            try:
+                with open(path, 'rb') as file:
+                    header = json.loads(file.readline())
+                index, count = header['shard']
+                key = header['key']
+            except (OSError, ValueError, KeyError, TypeError):
+                raise ValueError(f'{directory} is not the output of a shard') from None
+            if header.get('version') != VERSION or index in shards:
+                raise ValueError(f'{directory}: shard {index}/{count} is not expected')
+            shards[index] = path
+            counts.add(count)
+            keys.add(key)
+        if len(counts) != 1 or len(keys) != 1 or sorted(shards) != list(range(counts.pop())):
+            raise ValueError('the directories are not all the shards of one build')
+        self.key = keys.pop()
+        self.directories = [os.path.dirname(shards[index]) for index in sorted(shards)]
+        self._paths = [shards[index] for index in sorted(shards)]
+        self._files = [None] * len(self._paths)
+
+    def close(self):
+        """
+        Close the records files.
+        """
+        for file in self._files:
+            if file is not None:
+                file.close()
+        self._files = [None] * len(self._paths)
+
+    def pages(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yield the article pages of the shards: (file, path relative to the output).
+        Precompressed sidecars are left out; they are made again after the merge.
+        """
+        for directory in self.directories:
+            root = os.path.join(directory, 'article')
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if os.path.splitext(name)[1] in ENCODINGS or name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    yield path, os.path.relpath(path, directory)
+
+    def records(self) -> Iterator[ShardRecord]:
+        """
+        Yield the records of all shards in the order of the article filenames.
+        """
+        return heapq.merge(
+            *(self._read(shard) for shard in range(len(self._paths))),
+            key=lambda record: record.name,
+        )
+
+    def _read(self, shard: int) -> Iterator[ShardRecord]:
+        with open(self._paths[shard], 'rb') as file:
+            offset = len(file.readline())
+            for line in file:
+                record = self._record(line)
+                self._offsets[record.summary.key] = (shard, offset)
+                offset += len(line)
+                yield record
+
+    @staticmethod
+    def _record(line: bytes) -> ShardRecord:
+        name, summary, excerpt, text, terms = json.loads(line)
+        return ShardRecord(
+            name, ArticleSummary.from_record(summary), {EXCERPT: excerpt, SUMMARY: text}, terms,
+        )
+
+    def fragments(self, key: str) -> Dict[str, str]:
+        """
+        Return the fragments (excerpt and text summary) of the content `key`
+        from the records, for the fragment cache.
+        Raises KeyError if no record read so far has the key.
+        """
+        shard, offset = self._offsets[key]
+        file = self._files[shard]
+        if file is None:
+            file = self._files[shard] = open(self._paths[shard], 'rb')
+        file.seek(offset)
+        return self._record(file.readline()).fragments
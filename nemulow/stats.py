@@ -0,0 +1,146 @@
+"""
+Build instrumentation.
+
+Collects per-stage timers, counters and per-article times of a build.
+Collection is off by default; while it is off, `stage()` returns a shared
+no-op context manager, so the instrumented code costs next to nothing.
+
+Each process has its own collector (`current`). Worker processes send their
+numbers back with the results, and the parent merges them.
+"""
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_NULL = nullcontext()
+
+
+class BuildStats:
+    """
+    Timers and counters of a build.
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        Initialize empty timers. Nothing is collected unless `enabled`.
+        """
+        self.enabled = enabled
+        # stage -> [calls, seconds]
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        # article source -> seconds
+        self.articles: Dict[str, float] = {}
+
+    def stage(self, name: str):
+        """
+        Context manager timing one run of the stage `name`.
+        """
+        if not self.enabled:
+            return _NULL
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        """
+        Add time to the stage `name`.
+        """
+        if not self.enabled:
+            return
+        entry = self.stages.setdefault(name, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+    def count(self, name: str, value: int = 1):
+        """
+        Increment the counter `name`.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def article(self, src_filename: str, seconds: float):
+        """
+        Record the time spent on one article.
+        """
+        if self.enabled:
+            self.articles[src_filename] = self.articles.get(src_filename, 0.0) + seconds
+
+    def take(self) -> Optional[dict]:
+        """
+        Return the collected numbers and reset them (sent from worker processes).
+        """
+        if not self.enabled:
+            return None
+        data = {'stages': self.stages, 'counters': self.counters, 'articles': self.articles}
+        self.stages, self.counters, self.articles = {}, {}, {}
+        return data
+
+    def merge(self, data: Optional[dict]):
+        """
+        Add numbers returned by `take` in another process.
+        """
+        if not self.enabled or not data:
+            return
+        for name, (calls, seconds) in data['stages'].items():
+            self.add(name, seconds, calls)
+        for name, value in data['counters'].items():
+            self.count(name, value)
+        for src_filename, seconds in data['articles'].items():
+            self.article(src_filename, seconds)
+
+    def slowest(self, top: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return the `top` slowest articles as (source, seconds).
+        """
+        return sorted(self.articles.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def report(self, top: int = 10) -> dict:
+        """
+        Return a machine-readable report.
+        """
+        return {
+            'stages': {
+                name: {'calls': int(calls), 'seconds': round(seconds, 6)}
+                for name, (calls, seconds) in sorted(self.stages.items())
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'slowest_articles': [
+                {'source': source, 'seconds': round(seconds, 6)}
+                for source, seconds in self.slowest(top)
+            ],
+        }
+
+    def write_report(self, path: str, top: int = 10):
+        """
+        Write the report as JSON.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(top), file, ensure_ascii=False, indent=2)
+
+    def format(self, top: int = 10) -> str:
+        """
+        Return the report as text for the console.
+        Nested stages (e.g. decorate within paragraphize) are included in their parent.
+        """
+        lines = ['stage                     calls     seconds']
+        for name, (calls, seconds) in sorted(self.stages.items()):
+            lines.append(f'{name:<24}{int(calls):>7}{seconds:>12.4f}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<24}{value:>7}')
+        if self.articles:
+            lines.append(f'slowest {min(top, len(self.articles))} articles:')
+            for source, seconds in self.slowest(top):
+                lines.append(f'  {seconds:>9.4f}  {source}')
+        return '\n'.join(lines)
+
+
+# collector of this process
+current = BuildStats()
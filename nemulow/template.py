@@ -1,27 +1,164 @@
-# class Template:
-#     """
-#     Class for managing blog templates.
-#     """
-#     template_path: str
-#     template_name: str = ''
-#     template_body: str = ''
-
-#     def __init__(self, template_path: str = 'templates'):
-#         self.template_path = template_path
-
-#     def load_template(self, template_name: str):
-#         """
-#         Load a template file.
-#         """
-#         template_file = os.path.join(self.template_path, template_name)
-#         if not os.path.exists(template_file):
-#             raise FileNotFoundError(f"Template file '{template_file}' not found.")
-#         with open(template_file, 'r', encoding='utf-8') as file:
-#             self.template_body = file.read()
-
-#     def render_template(self, context: dict):
-#         """
-#         Render a template with the given context.
-#         """
-#         template = jinja2.Template(self.template_body)
-#         return template.render(context)
+"""
+Template registry.
+
+All pages of a build are rendered through one Jinja2 environment, so each
+template and partial is compiled once. Compiled templates are also stored in a
+bytecode cache on disk and reused by later builds and by worker processes.
+
+Importing Jinja2 takes a noticeable part of a no-op build, so the environment
+is only set up when a template is used.
+
+The pages of a template depend on the assets it looks up with `asset()`;
+`asset_inputs` finds them in the template sources.
+"""
+
+import os
+import re
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    import jinja2
+
+_ASSET_CALL = re.compile(r'''\basset\(\s*(?:(["'])([^"']*)\1\s*\))?''')
+_TEMPLATE_REFERENCE = re.compile(
+    r'''\{%-?\s*(?:include|extends|import|from)\s+(?:(["'])([^"']+)\1)?''',
+)
+
+
+def asset_inputs(template_path: str) -> List[str]:
+    """
+    Return the build manifest inputs of the assets which a template (with the
+    templates it includes, extends or imports) looks up with `asset()`:
+    "asset:<name>" for each name (see AssetPipeline.build), or "asset:*", the
+    whole asset manifest, if a name or an included template is not a literal.
+    """
+    template_dir = os.path.dirname(template_path) or '.'
+    names: Set[str] = set()
+    queue, seen = [template_path], set()
+    while queue:
+        path = queue.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                source = file.read()
+        except OSError:
+            continue
+        for match in _ASSET_CALL.finditer(source):
+            if match.group(2) is None:
+                return ['asset:*']
+            names.add(match.group(2).lstrip('/'))
+        for match in _TEMPLATE_REFERENCE.finditer(source):
+            if match.group(2) is None:
+                # any template may be included
+                queue.extend(
+                    os.path.join(template_dir, name) for name in os.listdir(template_dir)
+                )
+            else:
+                queue.append(os.path.join(template_dir, match.group(2)))
+    return [f'asset:{name}' for name in sorted(names)]
+
+
+class TemplateRegistry:
+    """
+    Class for managing blog templates.
+    """
+
+    template_dir: str
+    cache_dir: Optional[str]
+
+    def __init__(
+        self,
+        template_dir: str = 'templates',
+        cache_dir: Optional[str] = None,
+        globals: Optional[Dict[str, str]] = None,
+        assets: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Initialize the registry for the templates in `template_dir`.
+        With `cache_dir`, compiled templates are cached in that directory.
+        `globals` are the variables available in every template (blog_name, ...).
+        `assets` is the asset manifest looked up by `asset()` (see assets.py).
+        """
+        self.template_dir = template_dir
+        self.cache_dir = cache_dir
+        self.globals = dict(globals or {})
+        self.assets = dict(assets or {})
+        self._setup()
+
+    def _setup(self):
+        self._environment: Optional['jinja2.Environment'] = None
+        self.templates: Dict[str, 'jinja2.Template'] = {}
+
+    @property
+    def environment(self) -> 'jinja2.Environment':
+        """
+        The Jinja2 environment, created on first use.
+        """
+        if self._environment is None:
+            import jinja2
+
+            bytecode_cache = None
+            if self.cache_dir:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(self.cache_dir)
+            # auto_reload: a changed template file is compiled again on next use;
+            # the bytecode cache is keyed by the template source, so stale entries are not used.
+            # article fragments are already HTML, so they must not be escaped.
+            self._environment = jinja2.Environment(  # nosec B701
+                loader=jinja2.FileSystemLoader(self.template_dir),
+                bytecode_cache=bytecode_cache,
+                auto_reload=True,
+                autoescape=False,
+            )
+            self._environment.globals.update(self.globals)
+            self._environment.globals['asset'] = self.asset
+        return self._environment
+
+    def asset(self, name: str) -> str:
+        """
+        Return the fingerprinted name of the asset `name` ("/css/main.css" ->
+        "/css/main.1a2b3c4d5e.css"), or `name` if it is not an asset.
+        """
+        output = self.assets.get(name.lstrip('/'))
+        if output is None:
+            return name
+        return '/' + output if name.startswith('/') else output
+
+    def __getstate__(self) -> dict:
+        # jinja2 environments cannot be pickled; worker processes build their own,
+        # which load the compiled templates from the bytecode cache.
+        return {
+            'template_dir': self.template_dir,
+            'cache_dir': self.cache_dir,
+            'globals': self.globals,
+            'assets': self.assets,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._setup()
+
+    def get(self, name: str) -> 'jinja2.Template':
+        """
+        Return the compiled template `name`.
+        """
+        template = self.templates.get(name)
+        if template is None or not template.is_up_to_date:
+            template = self.environment.get_template(name)
+            self.templates[name] = template
+        return template
+
+    def load_all(self):
+        """
+        Compile all templates and partials in the template directory.
+        """
+        for name in self.environment.list_templates(extensions=['j2', 'html']):
+            self.get(name)
+
+    def render(self, name: str, **context) -> str:
+        """
+        Render the template `name` with `context`.
+        """
+        return self.get(name).render(**context)
@@ -1,13 +1,30 @@
+import json
 import os
+import sys
+import time
+from contextlib import ExitStack
 from pathlib import Path
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Iterable, Optional, Set, Tuple
 
-import markdown
-from jinja2 import Environment, FileSystemLoader
+import stats
+from article import Article, ArticleSummary
+from article_list import ArticleList
+from cache import ArticleCache
+from fragments import BODY, EXCERPT, SUMMARY, FragmentCache, render_fragments
+from manifest import BuildManifest, hash_bytes, template_dependencies
+from output import OutputWriter, write_if_changed
+from related import RelatedIndex
+from search import SearchIndex, document_terms
+from template import TemplateRegistry, asset_inputs
+
+if TYPE_CHECKING:
+    from bluesky import BlueskyThreads
 
 
 def convert_markdown_to_html(content: str) -> Dict[str, str]:
     """Convert markdown text to HTML."""
+    import markdown
+
     html = markdown.markdown(content)
     return {"content": html}
 
@@ -20,38 +37,370 @@ def sanitize_filename(filename: str) -> str:
 def get_article_list(src_dir: str, html_dir: str) -> List[str]:
     """Return list of article filenames to process."""
     articles = []
-    for entry in os.listdir(src_dir):
+    for entry in sorted(os.listdir(src_dir)):
         if entry.lower().endswith(".md"):
             sanitized = sanitize_filename(entry)
             articles.append(sanitized)
     return articles
 
 
-def generate_article_html(articles: List[str], src_dir: str, html_dir: str, template_path: str) -> None:
-    """Generate HTML files for each article."""
-    env = Environment(loader=FileSystemLoader(Path(template_path).parent))
-    tmpl = env.get_template(Path(template_path).name)
-    os.makedirs(html_dir, exist_ok=True)
+def get_article_sources(articles: List[str], src_dir: str) -> List[str]:
+    """Return the source file of each article filename.
 
+    The paths are interned: the indexes which are keyed by source share them.
+    """
+    # the paths of Path(src_dir) / article, without making the objects
+    base = str(Path(src_dir))
+    prefix = "" if base == "." else os.path.join(base, "")
+    sources = []
     for article in articles:
-        src_file = Path(src_dir) / article
+        src_file = prefix + article
         # In case sanitize_filename changed the name
-        if not src_file.exists():
-            src_file = Path(src_dir) / article.replace("_", " ")
+        if not os.path.exists(src_file):
+            src_file = prefix + article.replace("_", " ")
+        sources.append(sys.intern(src_file))
+    return sources
+
+
+def generate_article_html(
+    articles: List[str],
+    src_dir: str,
+    html_dir: str,
+    template_path: str,
+    manifest: Optional[BuildManifest] = None,
+    jobs: int = 1,
+    site: Optional[Dict[str, str]] = None,
+    cache: Optional[ArticleCache] = None,
+    templates: Optional[TemplateRegistry] = None,
+    writer: Optional[OutputWriter] = None,
+    fragments: Optional[FragmentCache] = None,
+    search: Optional[SearchIndex] = None,
+    related: Optional[RelatedIndex] = None,
+    threads: Optional["BlueskyThreads"] = None,
+    dest_path: str = ".",
+    changed: Optional[Set[str]] = None,
+) -> Tuple[List[str], List[ArticleSummary]]:
+    """Generate HTML files for each article.
+
+    Nemulow language sources are converted with `Article`; other files are
+    treated as plain markdown. With `jobs` > 1, articles are parsed, decorated
+    and rendered in a process pool; the output is the same as the serial path.
+
+    When a build manifest is given, articles whose source, templates and
+    configuration are unchanged since the last build are skipped, and their
+    summary records are taken from the manifest.
+    `site` holds the global template variables (blog_name, blog_url, ...).
+    With a template registry, its compiled templates are used instead of
+    loading `template_path` again.
+    With an article cache, articles whose source is unchanged are not parsed
+    and decorated again even if their page has to be re-rendered.
+    Pages are only written when their content changed; `writer` counts them.
+    The excerpts rendered here (and the sources of skipped articles) are kept
+    in `fragments`, from which the list pages are assembled.
+    The terms of the rendered articles (and of skipped articles which are
+    not indexed yet) are updated in the `search` index, and removed articles
+    are dropped from it.
+    With a `related` index (computed before), the related articles are given
+    to the template, and the pages whose related articles changed are
+    rendered again. The same goes for the Bluesky `threads` (fetched before).
+    `dest_path` is the DEST_PATH of the configuration (see Article.dst_filename).
+    `changed` is the set of sources known to have changed since the last
+    build with the same `manifest` instance, when no other input changed
+    (e.g. in watch mode); the pages of the other sources are not checked.
+    Returns the list of rendered files and the summary records of all
+    Nemulow articles, in the order of `articles`.
+    """
+    os.makedirs(html_dir, exist_ok=True)
+    dependencies = _page_dependencies(template_path, manifest)
+    if templates is None:
+        templates = TemplateRegistry(str(Path(template_path).parent), globals=site)
+    template_name = Path(template_path).name
+    results: List[Optional[Tuple[str, Optional[ArticleSummary]]]] = []
+    tasks = []
+    sources = get_article_sources(articles, src_dir)
+    unindexed = []
+
+    for src_file in sources:
+        inputs = [src_file] + dependencies
+        record = manifest.get_record(src_file) if manifest is not None else None
+        if (
+            record is not None
+            and (
+                (changed is not None and src_file not in changed)
+                or not manifest.is_stale(record["output"], inputs)
+            )
+            and (related is None or src_file not in related.changed)
+            and (threads is None or src_file not in threads.changed)
+        ):
+            summary = ArticleSummary.from_record(record["summary"]) if record["summary"] else None
+            if summary is not None and fragments is not None:
+                fragments.add_source(summary.key, src_file)
+            if summary is not None and search is not None and src_file not in search.docs:
+                unindexed.append((src_file, summary))
+            results.append((None, summary))
+            stats.current.count("articles.skipped")
+            continue
+        results.append(None)
+        digest = manifest.digest(src_file) if manifest is not None else None
+        tasks.append((src_file, html_dir, digest))
+
+    # the related articles and threads are looked up as the tasks are handed
+    # out, and the results are consumed as they come, so the excerpts and
+    # search terms of all articles are never held at the same time
+    queued = (
+        task + (
+            related.links(task[0]) if related is not None else [],
+            threads.get(task[0]) if threads is not None else None,
+        )
+        for task in tasks
+    )
+    with ExitStack() as stack:
+        if jobs > 1 and len(tasks) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(templates, template_name, cache, stats.current.enabled,
+                          search is not None, dest_path),
+            ))
+            rendered = executor.map(_render_article, queued, chunksize=chunksize)
+        else:
+            if tasks:
+                _init_worker(templates, template_name, cache, stats.current.enabled,
+                             search is not None, dest_path)
+            rendered = map(_render_article, queued)
+        written = []
+        done = iter(zip(tasks, rendered))
+        for i, result in enumerate(results):
+            if result is not None:
+                continue
+            (src_file, _, _), rendered_article = next(done)
+            out_file, summary, page_changed, excerpt, terms, worker_stats = rendered_article
+            stats.current.merge(worker_stats)
+            if summary is not None and fragments is not None:
+                fragments.put(summary.key, excerpt, src_file)
+            if summary is not None and search is not None:
+                search.update(src_file, summary, terms)
+            results[i] = (out_file, summary)
+            written.append(out_file)
+            if writer is not None:
+                writer.record(out_file, page_changed)
+            if manifest is not None:
+                manifest.set_record(src_file, out_file, summary)
+                manifest.record(out_file, [src_file] + dependencies)
+
+    if search is not None:
+        with stats.current.stage("index"):
+            for src_file, summary in unindexed:
+                if fragments is not None:
+                    body = fragments.get(summary.key, BODY)
+                else:
+                    article = Article(src_file)
+                    article.read()
+                    body = render_fragments(article)[BODY]
+                search.update(src_file, summary, document_terms(summary, body))
+            search.retain(src for src, (_, summary) in zip(sources, results) if summary is not None)
+
+    summaries = [summary for _, summary in results if summary is not None]
+    return written, summaries
+
+
+# template and article cache of the current (worker) process, see _init_worker
+_template = None
+_cache: Optional[ArticleCache] = None
+_index_terms = False
+_dest_path = "."
+
+
+def _init_worker(
+    templates: TemplateRegistry,
+    template_name: str,
+    cache: Optional[ArticleCache],
+    collect_stats: bool = False,
+    index_terms: bool = False,
+    dest_path: str = ".",
+) -> None:
+    """Load the article template once per process."""
+    global _template, _cache, _index_terms, _dest_path
+    _template = templates.get(template_name)
+    _cache = cache
+    _index_terms = index_terms
+    _dest_path = dest_path
+    stats.current.enabled = collect_stats
+
+
+def _load_article(src_file: str, digest: Optional[str]) -> Tuple[Optional[Article], str]:
+    """Return the parsed article, from the cache if possible, or None if it is not
+    a Nemulow language source, and the content key of the source.
+
+    The page needs the whole article, so the source is read in one pass (and
+    only once when it has to be hashed here)."""
+    text = None
+    if digest is None:
+        with open(src_file, "rb") as f:
+            data = f.read()
+        digest = hash_bytes(data)
+        text = data.decode("utf-8")
+    key = ArticleCache.key(digest)
+    if _cache is None:
+        article = Article(src_file, _dest_path)
+        return (article if article.read(text=text) else None), key
+    data = _cache.get(key)
+    if data is not None:
+        stats.current.count("cache.hits")
+        return Article.from_cache(src_file, data, _dest_path), key
+    stats.current.count("cache.misses")
+    article = Article(src_file, _dest_path)
+    if not article.read(text=text):
+        return None, key
+    _cache.put(key, article.to_cache())
+    return article, key
+
+
+def _render_article(
+    task: Tuple[str, str, Optional[str], List[Dict[str, str]], Optional[dict]]
+) -> Tuple[
+    str, Optional[ArticleSummary], bool, Dict[str, str], Optional[List[str]], Optional[dict]
+]:
+    """Convert, render and write one article. Runs in worker processes.
+
+    The excerpt is returned with the result for the list pages, and so are
+    the search terms and the timings collected while doing so.
+    `task` also holds the related articles and the Bluesky thread of the page.
+    """
+    start = time.perf_counter()
+    terms = None
+    src_file, html_dir, digest, related, thread = task
+    with stats.current.stage("read"):
+        article, key = _load_article(src_file, digest)
+    if article is not None:
+        fragments = render_fragments(article)
+        summary = article.summary(key)
+        context = summary.as_dict()
+        context["summary"] = fragments[SUMMARY]
+        context["content"] = fragments[BODY]
+        context["related"] = related
+        context["bluesky"] = thread
+        out_file = os.path.join(html_dir, article.dst_path)
+        if _index_terms:
+            with stats.current.stage("index"):
+                terms = document_terms(summary, fragments[BODY])
+        fragments = {EXCERPT: fragments[EXCERPT]}
+    else:
         with open(src_file, "r", encoding="utf-8") as f:
             content = f.read()
-        html_body = convert_markdown_to_html(content)["content"]
-        rendered = tmpl.render(article={"content": html_body})
-        out_file = Path(html_dir) / (Path(article).stem + ".html")
-        with open(out_file, "w", encoding="utf-8") as f:
-            f.write(rendered)
+        summary = None
+        fragments = {}
+        context = {"content": convert_markdown_to_html(content)["content"]}
+        out_file = os.path.join(html_dir, sanitize_filename(Path(src_file).stem) + ".html")
+    with stats.current.stage("template"):
+        rendered = _template.render(article=context)
+    changed = write_if_changed(out_file, rendered)
+    stats.current.count("articles.rendered")
+    stats.current.article(src_file, time.perf_counter() - start)
+    return out_file, summary, changed, fragments, terms, stats.current.take()
 
 
-def generate_index_html(html_dir: str, template_path: str) -> None:
-    """Generate index.html."""
-    env = Environment(loader=FileSystemLoader(Path(template_path).parent))
-    tmpl = env.get_template(Path(template_path).name)
-    os.makedirs(html_dir, exist_ok=True)
-    out_path = Path(html_dir) / "index.html"
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(tmpl.render())
+def generate_index_html(
+    html_dir: str,
+    template_path: str,
+    manifest: Optional[BuildManifest] = None,
+    sources: Iterable[str] = (),
+    summaries: Iterable[ArticleSummary] = (),
+    site: Optional[Dict[str, str]] = None,
+    templates: Optional[TemplateRegistry] = None,
+    writer: Optional[OutputWriter] = None,
+    fragments: Optional[FragmentCache] = None,
+) -> bool:
+    """Generate index.html from the article summary records, newest first.
+
+    When a build manifest is given, index.html is only regenerated if the
+    templates, the configuration or one of the listed article `sources` changed.
+    The excerpts are taken from `fragments` (see generate_article_html).
+    Returns True if index.html was rendered.
+    """
+    out_path = os.path.join(html_dir, "index.html")
+    inputs = sorted(sources) + _page_dependencies(template_path, manifest)
+    if manifest is not None and not manifest.is_stale(out_path, inputs):
+        return False
+    if templates is None:
+        templates = TemplateRegistry(str(Path(template_path).parent), globals=site)
+    tmpl = templates.get(Path(template_path).name)
+    if fragments is None:
+        fragments = FragmentCache()
+    rendered = tmpl.render(articles=[
+        fragments.view(a) for a in sorted(summaries, key=lambda a: a.day, reverse=True)
+    ])
+    if writer is None:
+        writer = OutputWriter()
+    writer.write(out_path, rendered)
+    if manifest is not None:
+        manifest.record(out_path, inputs)
+    return True
+
+
+def generate_list_html(
+    html_dir: str,
+    template_path: str,
+    article_list: ArticleList,
+    per_page: int = 10,
+    manifest: Optional[BuildManifest] = None,
+    templates: Optional[TemplateRegistry] = None,
+    writer: Optional[OutputWriter] = None,
+    fragments: Optional[FragmentCache] = None,
+    changed: Optional[Set[str]] = None,
+) -> List[str]:
+    """Generate the list pages (top page, label and date archives) of an ArticleList.
+
+    With a build manifest, a page is only re-rendered if the articles on it
+    (or its pagination, the templates or the configuration) changed.
+    With `changed` (see generate_article_html), the pages whose articles are
+    the same as in the last build with the same `manifest` instance are not
+    checked.
+    The excerpts are taken from `fragments` (see generate_article_html).
+    Returns the list of rendered files.
+    """
+    if templates is None:
+        templates = TemplateRegistry(str(Path(template_path).parent))
+    if writer is None:
+        writer = OutputWriter()
+    if fragments is None:
+        fragments = FragmentCache()
+    dependencies = _page_dependencies(template_path, manifest)
+    written = []
+    for page in article_list.pages(per_page):
+        out_path = os.path.join(html_dir, page.path)
+        inputs = [f"page:{page.path}"] + dependencies
+        if manifest is not None:
+            fingerprint = json.dumps(
+                [page.title, page.number, page.total, [list(a) for a in page.articles]],
+                ensure_ascii=False,
+            )
+            same = not manifest.set_digest(inputs[0], fingerprint.encode("utf-8"))
+            if (same and changed is not None) or not manifest.is_stale(out_path, inputs):
+                stats.current.count("pages.skipped")
+                continue
+        with stats.current.stage("template"):
+            rendered = templates.render(
+                Path(template_path).name,
+                articles=[fragments.view(a) for a in page.articles],
+                page=page,
+                root=page.root,
+            )
+        stats.current.count("pages.rendered")
+        writer.write(out_path, rendered)
+        if manifest is not None:
+            manifest.record(out_path, inputs)
+        written.append(out_path)
+    return written
+
+
+def _page_dependencies(template_path: str, manifest: Optional[BuildManifest]) -> List[str]:
+    """Return the inputs shared by every page of a template: templates, partials,
+    configuration and the assets the template refers to."""
+    dependencies = template_dependencies(str(Path(template_path).parent))
+    if manifest is not None:
+        dependencies += manifest.config_inputs() + asset_inputs(template_path)
+    return dependencies
@@ -0,0 +1,337 @@
+"""
+Watch mode.
+
+Keeps one `Nemulow` instance (manifest, article cache and compiled templates)
+resident, rebuilds the affected pages when an article, a template, an asset or
+the configuration file changes, and serves the output on a local preview server.
+Pages open in the browser reload themselves after each rebuild. A rebuild
+which fails (a bad configuration value, a template error, ...) is reported,
+and the next change is built again.
+"""
+
+import ctypes
+import ctypes.util
+import mimetypes
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import parse_qs, unquote, urlparse
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+_EVENT = struct.Struct('iIII')
+
+
+class Watcher:
+    """
+    Reports changed files in a set of directories.
+    Uses inotify on Linux and falls back to polling the mtimes elsewhere.
+    """
+
+    def __init__(
+        self, directories: Iterable[str], interval: float = 0.2, trees: Iterable[str] = (),
+    ):
+        """
+        Watch the files directly in `directories`, and the files in `trees`
+        with their subdirectories (also the ones created later).
+        `interval` is the polling interval when inotify is not available.
+        """
+        self.directories = [os.path.normpath(d) for d in directories if os.path.isdir(d)]
+        self.trees = [os.path.normpath(d) for d in trees if os.path.isdir(d)]
+        self.interval = interval
+        self._fd: Optional[int] = None
+        self._libc = None
+        self._dirs: Dict[int, str] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._setup_inotify()
+        if self._fd is None:
+            self._mtimes = self._scan()
+
+    def _setup_inotify(self):
+        name = ctypes.util.find_library('c')
+        if not name:
+            return
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            return
+        fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if fd < 0:
+            return
+        self._fd = fd
+        self._libc = libc
+        for directory in self.directories:
+            self._add_watch(directory)
+        for tree in self.trees:
+            for directory in _subdirectories(tree):
+                self._add_watch(directory)
+
+    def _add_watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = directory
+
+    def _in_tree(self, path: str) -> bool:
+        return any(_contains(tree, path) for tree in self.trees)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _scan(self) -> Dict[str, int]:
+        mtimes = {}
+        directories = list(self.directories)
+        for tree in self.trees:
+            directories.extend(_subdirectories(tree))
+        for directory in directories:
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    mtimes[os.path.join(directory, entry.name)] = entry.stat().st_mtime_ns
+        return mtimes
+
+    def _read_events(self, timeout: Optional[float]) -> Set[str]:
+        changed: Set[str] = set()
+        if self._fd is None:
+            time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+            mtimes = self._scan()
+            changed = {
+                path for path in set(mtimes) | set(self._mtimes)
+                if mtimes.get(path) != self._mtimes.get(path)
+            }
+            self._mtimes = mtimes
+            return changed
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd not in self._dirs or not name:
+                continue
+            path = os.path.join(self._dirs[wd], os.fsdecode(name))
+            if not mask & IN_ISDIR:
+                changed.add(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO) and self._in_tree(path):
+                # a new directory in a tree: watch it, and report the files
+                # which were already moved or written into it
+                for directory in _subdirectories(path):
+                    self._add_watch(directory)
+                    try:
+                        changed.update(
+                            entry.path for entry in os.scandir(directory) if entry.is_file()
+                        )
+                    except OSError:
+                        pass
+        return changed
+
+    def wait(self, debounce: float = 0.05) -> Set[str]:
+        """
+        Block until files change and return their paths.
+        Events are collected until nothing happened for `debounce` seconds,
+        so an editor saving several files triggers one rebuild.
+        """
+        changed: Set[str] = set()
+        while not changed:
+            changed = self._read_events(None)
+        while True:
+            more = self._read_events(debounce)
+            if not more:
+                return changed
+            changed |= more
+
+
+def _contains(directory: str, path: str) -> bool:
+    """
+    Check if `path` is `directory` or in it (both absolute or both relative).
+    """
+    return os.path.commonpath([directory, path]) == directory
+
+
+def _subdirectories(tree: str) -> List[str]:
+    """
+    Return `tree` and its subdirectories, without the hidden ones.
+    """
+    directories = []
+    for dirpath, dirnames, _ in os.walk(tree):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        directories.append(dirpath)
+    return directories
+
+
+# injected into previewed pages: waits for the next rebuild and reloads
+_RELOAD_SCRIPT = (
+    '<script>(function(v){function w(){fetch("/__nemulow/wait?v="+v)'
+    '.then(function(r){return r.text()}).then(function(t){if(+t!==v){location.reload()}else{w()}})'
+    '.catch(function(){setTimeout(w,1000)})}w()})(%d);</script>'
+)
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    Serves the output directory. Files are kept in memory after the first
+    request and dropped when a rebuild writes or removes them.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root: str, address=('127.0.0.1', 8000)):
+        super().__init__(address, _PreviewHandler)
+        self.root = os.path.abspath(root)
+        self.version = 0
+        self.files: Dict[str, bytes] = {}
+        self._changed = threading.Condition()
+
+    def invalidate(self, paths: Iterable[str]):
+        """
+        Drop rebuilt or removed files from memory and tell the browsers to reload.
+        """
+        for path in paths:
+            self.files.pop(os.path.abspath(path), None)
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_version(self, version: int, timeout: float = 30.0) -> int:
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def load(self, path: str) -> Optional[bytes]:
+        data = self.files.get(path)
+        if data is None:
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except OSError:
+                return None
+            self.files[path] = data
+        return data
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    server: PreviewServer
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/__nemulow/wait':
+            version = int(parse_qs(url.query).get('v', ['0'])[0])
+            self._send(str(self.server.wait_version(version)).encode(), 'text/plain')
+            return
+
+        path = os.path.abspath(os.path.join(self.server.root, unquote(url.path).lstrip('/')))
+        if not _contains(self.server.root, path):
+            self.send_error(HTTPStatus.FORBIDDEN)
+            return
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        data = self.server.load(path)
+        if data is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        content_type = self.guess_type(path)
+        if content_type == 'text/html':
+            data = data.replace(
+                b'</body>', (_RELOAD_SCRIPT % self.server.version).encode() + b'</body>', 1
+            )
+        self._send(data, content_type)
+
+    def guess_type(self, path: str) -> str:
+        return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def _send(self, data: bytes, content_type: str):
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _rebuild(nemulow, jobs: int, changed: Optional[Set[str]] = None, reload: bool = False):
+    """
+    Build once (after reading the configuration file again with `reload`).
+    Returns the writer, or None if the build failed; the error is reported.
+    """
+    start = time.perf_counter()
+    try:
+        if reload:
+            nemulow.reload_config(nemulow.config_file, override=True)
+        writer = nemulow.build(jobs=jobs, changed=changed)
+    except Exception as error:
+        # a bad configuration value or a broken template ends this build only
+        print(f'Build failed: {type(error).__name__}: {error}', file=sys.stderr)
+        return None
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f'{writer.report()} ({elapsed:.0f} ms)')
+    return writer
+
+
+def watch(nemulow, host: str = '127.0.0.1', port: int = 8000, jobs: int = 1):
+    """
+    Build, serve the output and rebuild on changes until interrupted.
+    """
+    writer = _rebuild(nemulow, jobs)
+    # after a failed build, the next one checks all inputs again
+    failed = writer is None
+
+    server = PreviewServer(nemulow.config.output_dir, (host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'Preview: http://{host}:{port}/')
+
+    config_file = os.path.normpath(os.path.abspath(nemulow.config_file))
+    directories: List[str] = [
+        nemulow.config.article_dir,
+        nemulow.config.template_dir,
+        os.path.dirname(config_file),
+    ]
+    sources = {os.path.abspath(d) for d in directories[:2]}
+    trees = [os.path.abspath(nemulow.config.asset_dir)] if nemulow.config.asset_dir else []
+    watcher = Watcher(directories, trees=trees)
+    try:
+        while True:
+            changed = {
+                path for path in watcher.wait()
+                if os.path.abspath(path) == config_file
+                or os.path.dirname(os.path.abspath(path)) in sources
+                or any(_contains(tree, os.path.abspath(path)) for tree in trees)
+            }
+            if not changed:
+                continue
+            reload = config_file in {os.path.abspath(path) for path in changed}
+            writer = _rebuild(
+                nemulow, jobs, None if reload or failed else changed, reload,
+            )
+            failed = writer is None
+            if writer is not None:
+                server.invalidate(writer.written + writer.removed)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        server.shutdown()
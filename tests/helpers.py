@@ -0,0 +1,70 @@
+"""
+Helpers shared by the tests: article sources, files and output trees.
+"""
+
+import os
+import sys
+from typing import Dict, Optional
+
+NEMULOW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow'))
+sys.path.insert(0, NEMULOW_DIR)
+
+
+def article(name: str, body: str, see_more: Optional[str] = None, **metadata: str) -> str:
+    """
+    Return the source of a Nemulow article with the "filename" `name`, the
+    other `metadata` and one paragraph per line of `body` (and `see_more`).
+    """
+    lines = ['# nemulow v1', '', f'* filename: {name}']
+    lines += [f'* {key}: {value}' for key, value in metadata.items()]
+    lines += ['', '## article', '']
+    lines += ['　' + line for line in body.split('\n')]
+    if see_more is not None:
+        lines += ['', '## see more', '']
+        lines += ['　' + line for line in see_more.split('\n')]
+    return '\n'.join(lines) + '\n'
+
+
+def write(path, content: str) -> str:
+    """
+    Write a text file, with its directory. Returns the path as a string.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return str(path)
+
+
+def write_article(
+    src_dir, n: int, body: str, see_more: Optional[str] = None, date: str = '',
+    **metadata: str,
+) -> str:
+    """
+    Write the n-th test article ("article-<n>", dated 2025-01-<n + 1> unless
+    `date` is given) to `src_dir`. Returns its path.
+    """
+    date = date or f'202501{n + 1:02d}'
+    return write(os.path.join(src_dir, f'{date}_記事{n}.md'),
+                 article(f'article-{n}', body, see_more, **metadata))
+
+
+def read_tree(root) -> Dict[str, bytes]:
+    """
+    Return the files under `root` as {relative path: content}.
+    """
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+def main_command(tmp_path, *args: str) -> list:
+    """
+    Return the command line of main.py with `args`, which reads its
+    configuration from the environment only.
+    """
+    return [sys.executable, os.path.join(NEMULOW_DIR, 'main.py'),
+            '--config', str(tmp_path / 'missing.env')] + list(args)
@@ -0,0 +1,120 @@
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from article import Article, ArticleSummary  # noqa: E402
+from blocks import BodyParser  # noqa: E402
+from helpers import article, write  # noqa: E402
+
+ARTICLE = article('lazy-article', '本文の1行目。\n本文の2行目。', '続きの文章。',
+                  labels='雑記', summary='遅延読み込みのテスト')
+
+
+def _write(tmp_path, content=ARTICLE):
+    return write(tmp_path / '20250102_遅延読み込み.md', content)
+
+
+def test_lazy_read_stops_at_article(tmp_path):
+    """lazy のときはメタデータだけ読むことをテスト"""
+    article = Article(_write(tmp_path))
+    assert article.read(lazy=True)
+    assert article.metadata['labels'] == '雑記'
+    assert article.dst_path == '2025/0102-lazy-article.html'
+    assert article.title == '遅延読み込み'
+    assert article.article == []
+    assert article.see_more == []
+
+
+def test_lazy_read_renders_same_as_eager(tmp_path):
+    """lazy で読んだ記事も本文を読んで同じ HTML になることをテスト"""
+    path = _write(tmp_path)
+    eager = Article(path)
+    lazy = Article(path)
+    assert eager.read()
+    assert lazy.read(lazy=True)
+    assert lazy.render() == eager.render()
+    assert lazy.article == eager.article
+    assert lazy.see_more == [('p', '　続きの文章。')]
+    given = Article(path)
+    assert given.read(text=ARTICLE.replace('\n', '\r\n'))
+    assert given.render() == eager.render()
+
+
+def test_destination(tmp_path, monkeypatch):
+    """出力先は環境変数ではなく渡された DEST_PATH から決まることをテスト"""
+    monkeypatch.setenv('DEST_PATH', '/from/environ')
+    article = Article(_write(tmp_path), '/srv/www')
+    assert article.read(lazy=True)
+    assert article.dst_filename == '/srv/www/2025/0102-lazy-article.html'
+    restored = Article.from_cache(article.src_filename, article.to_cache(), '/srv/www')
+    assert restored.dst_filename == article.dst_filename
+    assert Article.from_cache(article.src_filename, article.to_cache()).dst_filename == (
+        './2025/0102-lazy-article.html'
+    )
+
+
+def test_read_rejects_missing_signature(tmp_path):
+    """署名のないファイルは Nemulow の記事として扱わないことをテスト"""
+    article = Article(_write(tmp_path, '# Test Article\n\nThis is a test article.'))
+    assert not article.read()
+
+
+def test_body_parser_blocks():
+    """本文を1回の走査でブロックに分け、複数行のコメントを取り除くことをテスト"""
+    metadata = {}
+    article, see_more = BodyParser(metadata).parse([
+        '　前半<!-- コメント\n',
+        '\n',
+        'まだコメント -->後半\n',
+        '\n',
+        '### 見出し\n',
+        '>><<中央\n',
+        '\n',
+        '---\n',
+        '## see more\n',
+        '"""\n',
+        '引用\n',
+        '"""\n',
+        '\n',
+        '<!-- 閉じないコメント\n',
+        '# metadata\n',
+        '* labels: 追記\n',
+    ])
+    assert article == [
+        ('p', '　前半後半'),
+        ('heading', '### 見出し\n>><<中央'),
+        ('hr', ''),
+    ]
+    assert see_more == [('quote', '引用'), ('html', '<!-- 閉じないコメント')]
+    assert metadata == {'labels': '追記'}
+
+
+def test_blocks_are_cached(tmp_path):
+    """キャッシュから戻した記事がブロックも HTML も同じになることをテスト"""
+    article = Article(_write(tmp_path))
+    assert article.read()
+    restored = Article.from_cache(article.src_filename, article.to_cache())
+    assert restored.article == article.article
+    assert restored.see_more == article.see_more
+    assert restored.render() == article.render()
+
+
+def test_summary_record(tmp_path):
+    """要約レコードが小さく (日付は整数、ラベルは共有)、保存形式と相互に変換できることをテスト"""
+    article = Article(_write(tmp_path))
+    article.read()
+    summary = article.summary('key')
+    assert not hasattr(summary, '__dict__')
+    assert summary.day == 20250102
+    assert summary.date == '20250102'
+    assert summary.labels is ArticleSummary('20250101', 'a', 'a.html', ''.join(['雑', '記'])).labels
+
+    record = list(summary)
+    assert record == ['20250102', '遅延読み込み', '2025/0102-lazy-article.html', '雑記', '', '',
+                      'key', True]
+    assert ArticleSummary.from_record(record) == summary
+    assert ArticleSummary.from_record(summary) is summary
+    assert summary.as_dict()['path'] == '2025/0102-lazy-article.html'
+    assert pickle.loads(pickle.dumps(summary)) == summary
@@ -0,0 +1,89 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from article import ArticleSummary  # noqa: E402
+from article_list import ArticleList  # noqa: E402
+from fragments import EXCERPT, FragmentCache  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from utils import generate_list_html  # noqa: E402
+
+
+def _summary(n, labels='', key=''):
+    date = f'2025{n // 28 + 1:02d}{n % 28 + 1:02d}'
+    return ArticleSummary(
+        date=date, title=f'記事{n}', path=f'2025/{date[4:]}-a{n}.html', labels=labels,
+        card_image='', updated_at='', key=key or f'key{n}', has_more=False,
+    )
+
+
+def test_pages():
+    """ページ分割とラベル・年月別の一覧をテスト"""
+    summaries = [_summary(n, labels='雑記, 食べ物' if n % 2 else '雑記') for n in range(25)]
+    pages = {page.path: page for page in ArticleList(reversed(summaries)).pages(per_page=10)}
+
+    assert [a.title for a in pages['index.html'].articles][:2] == ['記事24', '記事23']
+    assert pages['page/3.html'].articles[-1].title == '記事0'
+    assert pages['page/2.html'].prev_path == 'index.html'
+    assert pages['page/2.html'].root == '../'
+    assert pages['page/3.html'].next_path is None
+    assert len(pages['label/食べ物/page/2.html'].articles) == 2
+    assert pages['label/雑記/index.html'].total == 3
+    assert len(pages['archive/2025/01/index.html'].articles) == 10
+    assert pages['archive/2025/01/index.html'].title == '2025年1月'
+    assert 'archive/2025/index.html' in pages
+
+
+def test_label_paths():
+    """ラベルの一覧のパスがラベルのディレクトリの外を指さないことをテスト"""
+    summaries = [_summary(n, labels=labels) for n, labels in enumerate(['..', '., a/b', 'v1.0'])]
+    paths = {page.path for page in ArticleList(summaries).pages(per_page=10)}
+    assert {'label/--/index.html', 'label/-/index.html', 'label/a-b/index.html',
+            'label/v1.0/index.html'} <= paths
+
+
+def test_only_affected_pages_are_rendered(tmp_path):
+    """記事の変更で、その記事を含むページだけ再生成することをテスト"""
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    with open(template_dir / 'index.j2', 'w', encoding='utf-8') as f:
+        f.write('{% for a in articles %}{{ a.excerpt }}{% endfor %}')
+    summaries = [_summary(n) for n in range(30)]
+    fragments = FragmentCache()
+    for n in range(30):
+        fragments.put(f'key{n}', {EXCERPT: f'本文{n}'})
+
+    def build():
+        manifest = BuildManifest(str(tmp_path / 'manifest.json'))
+        manifest.load()
+        written = generate_list_html(
+            str(tmp_path / 'html'), str(template_dir / 'index.j2'),
+            ArticleList(summaries), per_page=10, manifest=manifest, fragments=fragments,
+        )
+        manifest.save()
+        return sorted(os.path.relpath(path, tmp_path / 'html') for path in written)
+
+    assert len(build()) == 10
+    assert build() == []
+    summaries[0] = _summary(0, key='edited')
+    fragments.put('edited', {EXCERPT: '編集した本文'})
+    assert build() == [
+        'archive/2025/01/page/3.html', 'archive/2025/page/3.html', 'page/3.html'
+    ]
+
+
+def test_fragments_are_rendered_once(tmp_path):
+    """一覧ページの抜粋はキャッシュから取り出し、追い出されたら元の記事から作り直すことをテスト"""
+    src = tmp_path / '20250101_記事.md'
+    with open(src, 'w', encoding='utf-8') as f:
+        f.write('# nemulow v1\n## article\n　**本文**\n## see more\n続き\n')
+    fragments = FragmentCache(max_bytes=0)
+    fragments.put('a', {EXCERPT: '<p>抜粋A</p>'})
+    fragments.put('b', {EXCERPT: '<p>抜粋B</p>'}, str(src))
+    # only the most recently used fragment is kept
+    assert len(fragments) == 1
+    view = fragments.view(_summary(1, key='b'))
+    assert view.excerpt == '<p>抜粋B</p>'
+    assert view.title == '記事1'
+    assert view.body == '<p>　<strong>本文</strong></p>\n<p>続き</p>'
@@ -0,0 +1,219 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+import assets  # noqa: E402
+from assets import (  # noqa: E402
+    AssetPipeline, cache_control, css_references, minify_css, minify_js, rewrite_css,
+)
+from helpers import article, main_command, write  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from output import OutputWriter  # noqa: E402
+
+CSS = """/* theme */
+:root {
+    --text-color : #202020;
+}
+a:hover , nav > li {
+    color: var(--text-color);
+    content: "a  ;}";
+    width: calc(100% - 2em) !important;
+}
+"""
+
+JS = """// scroll to top
+const pattern = /\\/\\*[^/]*/g;  /* start of a comment */
+const half = width / 2 / scale;
+const text = 'a // b';
+if (half)
+    return - -half
+"""
+
+
+def test_minify():
+    """コメントと余分な空白を除き、文字列や正規表現はそのまま残すことをテスト"""
+    assert minify_css(CSS) == (
+        ':root{--text-color :#202020}a:hover,nav>li{color:var(--text-color);'
+        'content:"a  ;}";width:calc(100% - 2em) !important}'
+    )
+    assert minify_js(JS) == (
+        'const pattern=/\\/\\*[^/]*/g;\n'
+        'const half=width/2/scale;\n'
+        "const text='a // b';\n"
+        'if(half)\n'
+        'return- -half\n'
+    )
+    assert minify_js('') == ''
+
+
+def test_pipeline(tmp_path, monkeypatch):
+    """ハッシュ付きの名前で書き出し、変わっていないアセットは処理しないことをテスト"""
+    asset_dir, www, cache_dir = tmp_path / 'assets', tmp_path / 'www', tmp_path / 'cache'
+    write(asset_dir / 'css' / 'main.css', CSS)
+    write(asset_dir / 'js' / 'top.js', JS)
+    write(asset_dir / 'image' / 'icon.svg', '<svg/>')
+    manifest = BuildManifest(str(tmp_path / 'manifest.db'))
+
+    def build():
+        # as in a new build: the files are hashed again
+        manifest.forget()
+        pipeline = AssetPipeline(str(asset_dir), str(www), str(cache_dir))
+        pipeline.load()
+        writer = OutputWriter()
+        pipeline.build(manifest, writer)
+        pipeline.save()
+        return pipeline.urls(), writer
+
+    urls, writer = build()
+    assert sorted(urls) == ['css/main.css', 'image/icon.svg', 'js/top.js']
+    css = urls['css/main.css']
+    assert css.startswith('css/main.') and css.endswith('.css')
+    with open(www / css, encoding='utf-8') as f:
+        assert f.read() == minify_css(CSS)
+    with open(www / urls['image/icon.svg'], encoding='utf-8') as f:
+        assert f.read() == '<svg/>'
+    assert len(writer.written) == 3
+
+    # unchanged assets are not processed again, even when an output was removed
+    monkeypatch.setattr(assets, 'process', None)
+    os.remove(www / css)
+    assert build()[0] == urls
+    assert os.path.exists(www / css)
+
+    # a new version of the minifiers processes them again
+    processed = []
+    monkeypatch.setattr(assets, 'MINIFY_VERSION', 'next')
+    monkeypatch.setattr(assets, 'process', lambda path, data: processed.append(path) or data)
+    build()
+    assert len(processed) == 3
+    assert len(os.listdir(cache_dir / 'assets')) == 3
+
+    monkeypatch.undo()
+    write(asset_dir / 'css' / 'main.css', CSS + 'p { margin: 0 }\n')
+    os.remove(asset_dir / 'js' / 'top.js')
+    changed, writer = build()
+    assert changed['css/main.css'] != css and 'js/top.js' not in changed
+    assert not os.path.exists(www / css)
+    assert not os.path.exists(www / urls['js/top.js'])
+    assert writer.written == [str(www / changed['css/main.css'])]
+    assert len(os.listdir(cache_dir / 'assets')) == 2
+
+    assert cache_control(changed['css/main.css']) == assets.IMMUTABLE
+    assert cache_control(changed['css/main.css'] + '.gz') == assets.IMMUTABLE
+    assert cache_control('index.html') is None
+
+
+def test_stylesheet_references(tmp_path):
+    """CSS の url() と @import をハッシュ付きの名前に書き換え、参照先が変わると CSS の名前も変わることをテスト"""
+    css = (
+        '@import "base.css";\n'
+        '@import url(https://fonts.example/a.css);\n'
+        'h1 { background: url(../image/logo.svg) }\n'
+        "h2 { background: url( '/image/logo.svg?v=1#top' ) }\n"
+        'h3 { background: url(data:image/png;base64,AAAA) }\n'
+        'h4 { background: url(missing.png) }\n'
+    )
+    assert css_references('css/main.css', css) == [
+        'css/base.css', 'image/logo.svg', 'image/logo.svg', 'css/missing.png',
+    ]
+    urls = {'css/base.css': 'css/base.1.css', 'image/logo.svg': 'image/logo.2.svg'}
+    assert rewrite_css('css/main.css', css, urls) == css.replace(
+        '"base.css"', '"base.1.css"',
+    ).replace('../image/logo.svg', '../image/logo.2.svg').replace(
+        "'/image/logo.svg?v=1#top'", "'/image/logo.2.svg?v=1#top'",
+    )
+
+    asset_dir, www = tmp_path / 'assets', tmp_path / 'www'
+    write(asset_dir / 'css' / 'main.css', css)
+    write(asset_dir / 'css' / 'base.css', 'body { background: url(../image/logo.svg) }')
+    write(asset_dir / 'image' / 'logo.svg', '<svg/>')
+    manifest = BuildManifest(str(tmp_path / 'manifest.db'))
+
+    def build():
+        manifest.forget()
+        pipeline = AssetPipeline(str(asset_dir), str(www), str(tmp_path / 'cache'))
+        pipeline.load()
+        pipeline.build(manifest)
+        pipeline.save()
+        urls = pipeline.urls()
+        with open(www / urls['css/main.css'], encoding='utf-8') as f:
+            return urls, f.read()
+
+    urls, main = build()
+    logo, base = os.path.basename(urls['image/logo.svg']), os.path.basename(urls['css/base.css'])
+    assert f'@import "{base}"' in main
+    assert f'url(../image/{logo})' in main and f"url('/image/{logo}?v=1#top')" in main
+    assert 'url(missing.png)' in main
+    with open(www / urls['css/base.css'], encoding='utf-8') as f:
+        assert f.read() == f'body{{background:url(../image/{logo})}}'
+
+    write(asset_dir / 'image' / 'logo.svg', '<svg></svg>')
+    changed, main = build()
+    assert changed['css/main.css'] != urls['css/main.css']
+    assert changed['css/base.css'] != urls['css/base.css']
+    assert os.path.basename(changed['image/logo.svg']) in main
+    assert not os.path.exists(www / urls['css/main.css'])
+
+
+def test_asset_in_output_dir(tmp_path):
+    """アセットのディレクトリが出力ディレクトリと重なるときはエラーになることをテスト"""
+    for asset_dir in (tmp_path / 'www' / 'css', tmp_path):
+        try:
+            AssetPipeline(str(asset_dir), str(tmp_path / 'www'), str(tmp_path / 'cache'))
+        except ValueError:
+            continue
+        assert False, asset_dir
+
+
+def test_pages_refer_to_assets(tmp_path):
+    """テンプレートの asset() がハッシュ付きの名前になり、使っているアセットが変わったページだけ作り直すことをテスト"""
+    src_dir, template_dir, asset_dir = tmp_path / 'src', tmp_path / 'templates', tmp_path / 'a'
+    write(src_dir / '20250101_記事.md', article('a', '本文'))
+    write(template_dir / '_head.j2', '<link href="{{ asset(\'/css/main.css\') }}">')
+    write(template_dir / 'article.j2',
+          '{% include "_head.j2" %}<img src="{{ asset(\'logo.png\') }}">')
+    write(template_dir / 'index.j2',
+          '{%- include "_head.j2" %}<img src="{{ asset("/image/top.svg") }}">')
+    write(asset_dir / 'css' / 'main.css', CSS)
+    write(asset_dir / 'image' / 'top.svg', '<svg/>')
+    write(asset_dir / 'image' / 'other.svg', '<svg/>')
+    env = dict(
+        os.environ,
+        ARTICLE_DIR=str(src_dir),
+        TEMPLATE_DIR=str(template_dir),
+        OUTPUT_DIR=str(tmp_path / 'www'),
+        CACHE_DIR=str(tmp_path / 'cache'),
+        ASSET_DIR=str(asset_dir),
+        BLOG_URL='https://example.com/',
+    )
+    command = main_command(tmp_path, 'stats', '-j', '2', '--json', str(tmp_path / 'stats.json'))
+
+    def build():
+        subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE)  # nosec B603
+        with open(tmp_path / 'stats.json', encoding='utf-8') as f:
+            counters = json.load(f)['counters']
+        rendered = (counters.get('articles.rendered', 0), counters.get('pages.rendered', 0))
+        css = os.listdir(tmp_path / 'www' / 'css')
+        with open(tmp_path / 'www' / 'article' / '2025' / '0101-a.html', encoding='utf-8') as f:
+            return f.read(), sorted(name for name in css if name.endswith('.css')), rendered
+
+    page, css, rendered = build()
+    assert len(css) == 1 and rendered == (1, 3)
+    assert page == f'<link href="/css/{css[0]}"><img src="logo.png">'
+    with open(tmp_path / 'www' / 'index.html', encoding='utf-8') as f:
+        assert f.read().startswith(f'<link href="/css/{css[0]}"><img src="/image/top.')
+
+    # an asset which no template uses changes no page
+    write(asset_dir / 'image' / 'other.svg', '<svg></svg>')
+    assert build()[2] == (0, 0)
+    # one used by the list pages only changes them
+    write(asset_dir / 'image' / 'top.svg', '<svg></svg>')
+    assert build()[2] == (0, 3)
+
+    write(asset_dir / 'css' / 'main.css', CSS + 'p { margin: 0 }\n')
+    changed_page, changed_css, rendered = build()
+    assert len(changed_css) == 1 and changed_css != css and rendered == (1, 3)
+    assert changed_page == f'<link href="/css/{changed_css[0]}"><img src="logo.png">'
@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from bluesky import BlueskyThreads, post_uri, thread_view  # noqa: E402
+from helpers import write, write_article  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from utils import generate_article_html  # noqa: E402
+
+
+def _thread(uri, likes):
+    handle = uri.split('/')[2]
+    return {'thread': {
+        'post': {'uri': uri, 'author': {'handle': handle}, 'likeCount': likes,
+                 'repostCount': 1, 'replyCount': 1, 'quoteCount': 0},
+        'replies': [{'post': {
+            'uri': f'at://reader.example/app.bsky.feed.post/r{likes}',
+            'author': {'handle': 'reader.example', 'displayName': '読者'},
+            'record': {'text': '<b>猫</b>かわいい', 'createdAt': '2025-01-02T03:04:05Z'},
+            'likeCount': 2,
+        }}, {'$type': 'app.bsky.feed.defs#notFoundPost'}],
+    }}
+
+
+class StandIn(ThreadingHTTPServer):
+    """
+    A stand-in for the Bluesky API, which counts the requests and connections.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.likes = {}
+        self.requests = []
+        self.clients = set()
+        self.running = 0
+        self.busiest = 0
+        # send a 304 without its validators
+        self.bare_304 = False
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def endpoint(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.running += 1
+            server.busiest = max(server.busiest, server.running)
+            server.clients.add(self.client_address)
+            server.requests.append(self.headers.get('If-None-Match'))
+        time.sleep(0.02)
+        parts = urlsplit(self.path)
+        uri = parse_qs(parts.query)['uri'][0]
+        etag = f'"{server.likes.get(uri)}"'
+        if parts.path != '/xrpc/app.bsky.feed.getPostThread' or uri not in server.likes:
+            status, body = 400, b'{"error":"NotFound"}'
+        elif self.headers.get('If-None-Match') == etag:
+            status, body = 304, b''
+        else:
+            status, body = 200, json.dumps(_thread(uri, server.likes[uri])).encode('utf-8')
+        with server.lock:
+            server.running -= 1
+        self.send_response(status)
+        if status != 304 or not server.bare_304:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _setup(tmp_path, server):
+    src_dir = tmp_path / 'src'
+    sources = []
+    for n in range(7):
+        metadata = {}
+        if n < 6:
+            metadata['bluesky'] = f'https://bsky.app/profile/author.example/post/p{n}'
+            server.likes[post_uri(metadata['bluesky'])] = n
+        sources.append(write_article(src_dir, n, f'{n} 番目の記事です。', **metadata))
+    return src_dir, sources
+
+
+def test_thread_view():
+    """ポストの URL を AT URI にし、スレッドから直接の返信とその数を取り出すことをテスト"""
+    uri = post_uri('https://bsky.app/profile/author.example/post/abc')
+    assert uri == 'at://author.example/app.bsky.feed.post/abc'
+    assert post_uri(uri) == uri
+    assert post_uri('https://example.com/post/abc') is None
+    view = thread_view(_thread(uri, 3))
+    assert view['url'] == 'https://bsky.app/profile/author.example/post/abc'
+    assert view['likes'] == 3
+    assert view['comments'] == [{
+        'author': '読者', 'handle': 'reader.example', 'text': '<b>猫</b>かわいい',
+        'date': '2025-01-02', 'url': 'https://bsky.app/profile/reader.example/post/r3',
+        'likes': 2,
+    }]
+    assert thread_view({'thread': {'$type': 'app.bsky.feed.defs#notFoundPost'}}) is None
+
+
+def test_cache_and_revalidation(tmp_path):
+    """並行数を抑えて取得し、TTL の間は再取得せず、期限後は条件付きで確認することをテスト"""
+    server = StandIn()
+    _, sources = _setup(tmp_path, server)
+    keys = [(source, 'key') for source in sources]
+    state = str(tmp_path / 'bluesky.json')
+    threads = BlueskyThreads(state, server.endpoint, ttl=100, jobs=2)
+    assert not threads.load()
+    threads.refresh(keys, now=1000)
+    assert len(server.requests) == 6 and server.busiest <= 2
+    # the connections are kept and used again
+    assert len(server.clients) <= 2
+    assert threads.changed == set(sources[:6])
+    assert threads.get(sources[3])['likes'] == 3
+    assert threads.get(sources[6]) is None
+    threads.save()
+
+    # fresh threads are used without a request
+    threads = BlueskyThreads(state, server.endpoint, ttl=100, jobs=2)
+    assert threads.load()
+    threads.refresh(keys, now=1050)
+    assert len(server.requests) == 6 and threads.changed == set()
+
+    # stale ones are revalidated; only the changed thread changes its page
+    server.likes[post_uri('https://bsky.app/profile/author.example/post/p2')] = 10
+    threads.refresh(keys, now=1200)
+    assert len(server.requests) == 12 and all(server.requests[6:])
+    assert threads.changed == {sources[2]}
+    assert threads.get(sources[2])['likes'] == 10
+
+    # a 304 without an ETag keeps the one of the cached thread
+    server.bare_304 = True
+    threads.refresh(keys, now=1300)
+    threads.refresh(keys, now=1400)
+    assert all(server.requests[-6:])
+    assert sorted(server.requests[-6:]) == sorted(server.requests[-12:-6])
+    assert threads.changed == set()
+    server.bare_304 = False
+
+    # a deleted post has no thread
+    del server.likes[post_uri('https://bsky.app/profile/author.example/post/p5')]
+    threads.refresh(keys, now=1600)
+    assert threads.changed == {sources[5]} and threads.get(sources[5]) is None
+    server.shutdown()
+    server.server_close()
+
+
+def test_stale_when_unavailable(tmp_path):
+    """API に接続できないときは保存してあるスレッドを使い続けることをテスト"""
+    server = StandIn()
+    _, sources = _setup(tmp_path, server)
+    keys = [(source, 'key') for source in sources]
+    threads = BlueskyThreads(str(tmp_path / 'bluesky.json'), server.endpoint, ttl=100, jobs=4)
+    threads.refresh(keys, now=1000)
+    server.shutdown()
+    server.server_close()
+
+    threads.refresh(keys, now=2000)
+    assert len(threads.failed) == 6
+    assert threads.changed == set()
+    assert threads.get(sources[1])['likes'] == 1
+    # fetched again by the next refresh
+    assert threads.threads[threads.sources[sources[1]][1]]['fetched'] == 1000
+
+
+def test_article_pages(tmp_path):
+    """スレッドをテンプレートに渡し、スレッドが変わったページだけを再生成することをテスト"""
+    server = StandIn()
+    src_dir, sources = _setup(tmp_path, server)
+    template = write(
+        tmp_path / 'templates' / 'article.j2',
+        '{% if article.bluesky %}{{ article.bluesky.likes }}'
+        '{% for c in article.bluesky.comments %}{{ c.text|e }}{% endfor %}{% endif %}',
+    )
+    threads = BlueskyThreads(str(tmp_path / 'bluesky.json'), server.endpoint, ttl=0, jobs=4)
+
+    def build():
+        manifest = BuildManifest(str(tmp_path / 'manifest.db'))
+        manifest.load()
+        threads.refresh((source, manifest.digest(source)) for source in sources)
+        written, _ = generate_article_html(
+            sorted(os.listdir(src_dir)), str(src_dir), str(tmp_path / 'html'), str(template),
+            manifest=manifest, threads=threads,
+        )
+        manifest.save()
+        return {os.path.basename(path) for path in written}
+
+    assert len(build()) == 7
+    with open(tmp_path / 'html' / '2025' / '0104-article-3.html', encoding='utf-8') as f:
+        assert f.read() == '3&lt;b&gt;猫&lt;/b&gt;かわいい'
+    assert build() == set()
+    server.likes[post_uri('https://bsky.app/profile/author.example/post/p4')] = 20
+    assert build() == {'0105-article-4.html'}
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,166 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from fragments import FragmentCache  # noqa: E402
+from helpers import read_tree, write, write_article  # noqa: E402
+from main import Nemulow  # noqa: E402
+import stats  # noqa: E402
+from utils import generate_article_html, generate_index_html  # noqa: E402
+
+
+def _setup(tmp_path, count=8):
+    src_dir = tmp_path / 'src'
+    template_dir = tmp_path / 'templates'
+    for n in range(count):
+        write_article(src_dir, n, f'これは **{n} 番目** の記事です。', '続きの文章。',
+                      labels='雑記', summary=f'{n} 番目の記事')
+    write(template_dir / 'article.j2',
+          '{{ blog_name }}<h2>{{ article.title }}</h2>{{ article.content }}')
+    write(template_dir / 'index.j2',
+          '{% for a in articles %}<a href="{{ a.path }}">{{ a.excerpt }}</a>{% endfor %}')
+    return src_dir, template_dir
+
+
+def test_parallel_build_matches_serial(tmp_path):
+    """並列ビルドの出力が逐次ビルドと同じになることをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    articles = sorted(os.listdir(src_dir))
+    site = {'blog_name': 'テスト'}
+    results = []
+    for jobs in (1, 3):
+        html_dir = tmp_path / f'html{jobs}'
+        fragments = FragmentCache()
+        written, summaries = generate_article_html(
+            articles, str(src_dir), str(html_dir), str(template_dir / 'article.j2'),
+            jobs=jobs, site=site, fragments=fragments,
+        )
+        generate_index_html(
+            str(html_dir), str(template_dir / 'index.j2'), summaries=summaries, site=site,
+            fragments=fragments,
+        )
+        assert len(written) == len(articles)
+        results.append((read_tree(html_dir), summaries))
+
+    assert results[0] == results[1]
+    tree, summaries = results[0]
+    assert '2025/0101-article-0.html' in tree
+    assert [summary.path for summary in summaries][:2] == [
+        '2025/0101-article-0.html', '2025/0102-article-1.html'
+    ]
+    assert '<strong>0 番目</strong>' in tree['2025/0101-article-0.html'].decode('utf-8')
+
+
+def test_changed_files(tmp_path, monkeypatch):
+    """変更されたファイルを渡したビルドが、最初からのビルドと同じページを書くことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    for key in ('ASSET_DIR', 'BLUESKY_API'):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv('ARTICLE_DIR', str(src_dir))
+    monkeypatch.setenv('TEMPLATE_DIR', str(template_dir))
+    monkeypatch.setenv('BLOG_URL', 'https://example.com/')
+    monkeypatch.setenv('ARTICLES_PER_PAGE', '3')
+
+    def fresh(name):
+        monkeypatch.setenv('OUTPUT_DIR', str(tmp_path / name))
+        monkeypatch.setenv('CACHE_DIR', str(tmp_path / f'{name}-cache'))
+        return Nemulow(str(tmp_path / 'missing.env'))
+
+    def pages(name):
+        return {path: data for path, data in read_tree(tmp_path / name).items()
+                if not path.startswith('search')}
+
+    nemulow = fresh('www')
+    nemulow.build()
+    path = write_article(src_dir, 3, '猫の記事に書き換えました。', labels='動物')
+    writer = nemulow.build(changed={path})
+    assert str(tmp_path / 'www' / 'article' / '2025' / '0104-article-3.html') in writer.written
+    fresh('full').build()
+    assert pages('www') == pages('full')
+
+    # a template changes every page
+    write(template_dir / 'article.j2', '<h1>{{ article.title }}</h1>{{ article.content }}')
+    writer = nemulow.build(changed={str(template_dir / 'article.j2')})
+    assert len([path for path in writer.written if path.endswith('.html')]) == 8
+
+
+def test_unchanged_build(tmp_path, monkeypatch):
+    """入力が前回のビルドと同じならページを調べず、記事や設定、索引の状態が変わると調べることをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    for key in ('ASSET_DIR', 'BLUESKY_API'):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv('ARTICLE_DIR', str(src_dir))
+    monkeypatch.setenv('TEMPLATE_DIR', str(template_dir))
+    monkeypatch.setenv('OUTPUT_DIR', str(tmp_path / 'www'))
+    monkeypatch.setenv('CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('BLOG_URL', 'https://example.com/')
+
+    def build():
+        # a new process each time
+        monkeypatch.setattr(stats, 'current', stats.BuildStats(enabled=True))
+        writer = Nemulow(str(tmp_path / 'missing.env')).build()
+        return stats.current.counters.get('builds.unchanged', 0), len(writer.written)
+
+    unchanged, written = build()
+    assert unchanged == 0 and written > 0
+    assert build() == (1, 0)
+
+    write_article(src_dir, 3, '書き換えた記事です。')
+    unchanged, written = build()
+    assert unchanged == 0 and written > 0
+    assert build() == (1, 0)
+
+    monkeypatch.setenv('FEED_SIZE', '3')
+    assert build()[0] == 0
+    assert build()[0] == 1
+
+    # 索引の状態が失われると記事を読み直す
+    os.remove(tmp_path / 'cache' / 'related.jsonl')
+    assert build()[0] == 0
+    assert os.path.exists(tmp_path / 'cache' / 'related.jsonl')
+    assert build()[0] == 1
+
+
+def test_parallel_sidecars(tmp_path, monkeypatch):
+    """並列ビルドでも、最初のビルドで各サイドカーを一度だけ書くことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    write(template_dir / 'article.j2',
+          '<p>' + '本文の前の文章。' * 40 + '</p><h2>{{ article.title }}</h2>{{ article.content }}')
+    for key in ('ASSET_DIR', 'BLUESKY_API'):
+        monkeypatch.delenv(key, raising=False)
+    # relative directories, as in the example configuration
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('ARTICLE_DIR', './src')
+    monkeypatch.setenv('TEMPLATE_DIR', './templates')
+    monkeypatch.setenv('OUTPUT_DIR', './www')
+    monkeypatch.setenv('CACHE_DIR', './cache')
+    monkeypatch.setenv('BLOG_URL', 'https://example.com/')
+    monkeypatch.setenv('COMPRESS', 'gz')
+
+    writer = Nemulow(str(tmp_path / 'missing.env')).build(jobs=2)
+    sidecars = [os.path.normpath(path) for path in writer.written if path.endswith('.gz')]
+    assert len(sidecars) == len(set(sidecars))
+    assert os.path.join('www', 'article', '2025', '0101-article-0.html.gz') in sidecars
+    assert writer.unchanged == []
+
+
+def test_search_global(tmp_path, monkeypatch):
+    """検索の索引を書き出すときだけテンプレートの search が真になることをテスト"""
+    src_dir, template_dir = _setup(tmp_path, count=1)
+    write(template_dir / 'article.j2', '{% if search %}<script src="/search/search.js">{% endif %}')
+    for key in ('ASSET_DIR', 'BLUESKY_API'):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv('ARTICLE_DIR', str(src_dir))
+    monkeypatch.setenv('TEMPLATE_DIR', str(template_dir))
+    monkeypatch.setenv('OUTPUT_DIR', str(tmp_path / 'www'))
+    monkeypatch.setenv('CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('BLOG_URL', 'https://example.com/')
+    page = tmp_path / 'www' / 'article' / '2025' / '0101-article-0.html'
+
+    Nemulow(str(tmp_path / 'missing.env')).build()
+    assert page.read_text(encoding='utf-8') == '<script src="/search/search.js">'
+    assert os.path.exists(tmp_path / 'www' / 'search' / 'search.js')
+    monkeypatch.setenv('SEARCH_SHARDS', '0')
+    Nemulow(str(tmp_path / 'missing.env')).build()
+    assert page.read_text(encoding='utf-8') == ''
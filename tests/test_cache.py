@@ -0,0 +1,124 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from article import Article  # noqa: E402
+from cache import ArticleCache  # noqa: E402
+from helpers import article, write  # noqa: E402
+from utils import generate_article_html  # noqa: E402
+
+ARTICLE = article('cached-article', '**本文**です。', '続き。', summary='キャッシュのテスト')
+
+
+def _setup(tmp_path):
+    src_dir = tmp_path / 'src'
+    template_dir = tmp_path / 'templates'
+    write(src_dir / '20250101_キャッシュ.md', ARTICLE)
+    write(template_dir / 'article.j2', '{{ article.title }}:{{ article.content }}')
+    return src_dir, template_dir
+
+
+def test_cache_skips_parsing(tmp_path, monkeypatch):
+    """キャッシュがあれば記事を読み直さないことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    cache = ArticleCache(str(tmp_path / 'cache'))
+    args = (['20250101_キャッシュ.md'], str(src_dir), str(tmp_path / 'html'),
+            str(template_dir / 'article.j2'))
+
+    written, summaries = generate_article_html(*args, cache=cache)
+    with open(written[0], encoding='utf-8') as f:
+        first = f.read()
+
+    def fail(self):
+        raise AssertionError('Article.read must not be called')
+
+    monkeypatch.setattr(Article, 'read', fail)
+    written, cached_summaries = generate_article_html(*args, cache=cache)
+    with open(written[0], encoding='utf-8') as f:
+        assert f.read() == first
+    assert cached_summaries == summaries
+    assert summaries[0].has_more
+
+
+def test_source_read_once(tmp_path, monkeypatch):
+    """ページを作るときは記事のファイルを一度だけ開くことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    source = str(src_dir / '20250101_キャッシュ.md')
+    opened = []
+    real_open = open
+
+    def counting_open(file, *args, **kwargs):
+        if str(file) == source:
+            opened.append(file)
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', counting_open)
+    args = (['20250101_キャッシュ.md'], str(src_dir), str(tmp_path / 'html'),
+            str(template_dir / 'article.j2'))
+    written, summaries = generate_article_html(*args, cache=ArticleCache(str(tmp_path / 'cache')))
+    assert len(opened) == 1
+    generate_article_html(*args)
+    assert len(opened) == 2
+    monkeypatch.undo()
+    with open(written[0], encoding='utf-8') as f:
+        assert f.read() == 'キャッシュ:<p>　<strong>本文</strong>です。</p>\n<p>　続き。</p>'
+    assert summaries[0].has_more
+
+
+def test_renamed_source(tmp_path):
+    """内容が同じでも、名前を変えた記事は新しいファイル名の日付と題名になることをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    cache = ArticleCache(str(tmp_path / 'cache'))
+    args = (str(src_dir), str(tmp_path / 'html'), str(template_dir / 'article.j2'))
+    generate_article_html(['20250101_キャッシュ.md'], *args, cache=cache)
+    os.rename(src_dir / '20250101_キャッシュ.md', src_dir / '20250901_パン.md')
+    written, summaries = generate_article_html(['20250901_パン.md'], *args, cache=cache)
+    assert written == [str(tmp_path / 'html' / '2025' / '0901-cached-article.html')]
+    assert (summaries[0].date, summaries[0].title) == ('20250901', 'パン')
+    with open(written[0], encoding='utf-8') as f:
+        assert f.read().startswith('パン:')
+
+
+def test_cache_key_covers_versions(monkeypatch):
+    """キャッシュのキーにパーサのバージョンが含まれることをテスト"""
+    key = ArticleCache.key('0' * 64)
+    monkeypatch.setattr(Article, 'VERSION', 'next')
+    assert ArticleCache.key('0' * 64) != key
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """サイズ上限を超えたら古いものから削除することをテスト"""
+    cache = ArticleCache(str(tmp_path / 'cache'), max_bytes=0)
+    for n, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, {'body': 'x' * 100, 'n': n})
+        os.utime(cache._path(key), ns=(n * 10**9, n * 10**9))
+    size = os.path.getsize(cache._path('aa01'))
+    cache.max_bytes = size * 2
+    assert cache.get('aa01') is not None  # refreshes the access time
+    assert cache.evict() == 1
+    assert cache.get('bb02') is None
+    assert cache.get('aa01') is not None
+    assert cache.get('cc03') is not None
+
+
+def test_cache_size_is_kept(tmp_path, monkeypatch):
+    """キャッシュの合計サイズを記録しておき、上限を超えるまでは一覧を作らないことをテスト"""
+    cache = ArticleCache(str(tmp_path / 'cache'), max_bytes=10**6)
+    cache.put('aa01', {'body': 'x' * 100})
+    # the first eviction lists the entries to learn the total
+    assert cache.evict() == 0
+    size = os.path.getsize(cache._path('aa01'))
+    assert cache._size() == size
+
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', None)
+    cache.put('bb02', {'body': 'y' * 100})
+    assert cache.evict() == 0
+    assert cache._size() == size * 2
+
+    # past the cap, they are listed again
+    monkeypatch.setattr(cache, '_entries', entries)
+    cache.max_bytes = size
+    assert cache.evict() == 1
+    assert cache._size() == size
@@ -0,0 +1,88 @@
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from compress import (  # noqa: E402
+    PendingSidecars, available_encodings, compress_tree, content_headers,
+)
+from helpers import write  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from output import OutputWriter  # noqa: E402
+
+
+def test_sidecars_are_incremental(tmp_path):
+    """変更のないファイルは圧縮し直さず、元のないサイドカーは削除することをテスト"""
+    root = tmp_path / 'www'
+    page = '<p>本文</p>\n' * 100
+    write(str(root / 'index.html'), page)
+    write(str(root / 'article' / 'a.html'), page)
+    write(str(root / 'style.css'), 'p { color: red; }\n' * 50)
+    write(str(root / 'small.html'), '<p>短い</p>')
+    write(str(root / 'image.png'), 'x' * 1000)
+    write(str(root / 'gone.html.gz'), 'stale')
+
+    def build(jobs=1, paths=None):
+        manifest = BuildManifest(str(tmp_path / 'manifest.json'))
+        manifest.load()
+        writer = OutputWriter()
+        compressed = compress_tree(str(root), ['.gz'], manifest, jobs, writer, paths)
+        manifest.save()
+        return sorted(os.path.relpath(p, root) for p in compressed), writer
+
+    compressed, writer = build(jobs=2)
+    assert compressed == ['article/a.html', 'index.html', 'style.css']
+    assert len(writer.written) == 3
+    with gzip.open(root / 'index.html.gz', 'rt', encoding='utf-8') as f:
+        assert f.read() == page
+    assert not os.path.exists(root / 'gone.html.gz')
+    assert not os.path.exists(root / 'small.html.gz')
+    assert not os.path.exists(root / 'image.png.gz')
+
+    assert build()[0] == []
+    write(str(root / 'index.html'), page + '<p>追記</p>')
+    os.remove(root / 'article' / 'a.html')
+    assert build()[0] == ['index.html']
+    assert not os.path.exists(root / 'article' / 'a.html.gz')
+
+    # 指定したファイルだけを確かめる
+    write(str(root / 'index.html'), page)
+    os.remove(root / 'style.css')
+    assert build(paths=[str(root / 'index.html'), str(root / 'style.css')])[0] == ['index.html']
+    assert not os.path.exists(root / 'style.css.gz')
+    write(str(root / 'article' / 'b.html'), page)
+    assert build(paths=[])[0] == []
+    assert not os.path.exists(root / 'article' / 'b.html.gz')
+
+
+def test_content_headers():
+    """サイドカーには元のファイルの Content-Type と圧縮形式を付けることをテスト"""
+    assert content_headers('index.html.gz') == ('text/html', 'gzip')
+    assert content_headers('css/style.css.br') == ('text/css', 'br')
+    assert content_headers('index.html') == ('text/html', None)
+    assert content_headers('archive.tar.gz')[1] is None
+    assert available_encodings(['gz'])[0] == ['.gz']
+
+
+def test_pending_sidecars(tmp_path):
+    """先に圧縮を始めたファイルは記録した後で圧縮し直さないことをテスト"""
+    root = tmp_path / 'www'
+    page = '<p>本文</p>\n' * 100
+    write(str(root / 'index.html'), page)
+    write(str(root / 'article' / 'a.html'), page)
+    manifest = BuildManifest(str(tmp_path / 'manifest.db'))
+    manifest.load()
+    writer = OutputWriter()
+    pending = PendingSidecars([str(root / 'article' / 'a.html')], ['.gz'], manifest, 2)
+    try:
+        assert pending.collect(manifest, writer) == [str(root / 'article' / 'a.html')]
+        compressed = compress_tree(str(root), ['.gz'], manifest, 2, writer,
+                                   executor=pending.executor)
+    finally:
+        pending.close()
+    assert compressed == [str(root / 'index.html')]
+    assert len(writer.written) == 2
+    with gzip.open(root / 'article' / 'a.html.gz', 'rt', encoding='utf-8') as f:
+        assert f.read() == page
+    assert PendingSidecars([], ['.gz'], manifest, 2).executor is None
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+NEMULOW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow'))
+sys.path.insert(0, NEMULOW_DIR)
+
+from config import Config  # noqa: E402
+
+
+def test_parse():
+    """環境変数の形式の値を型のある設定に変換することをテスト"""
+    config = Config.parse({
+        'OUTPUT_DIR': '/srv/www',
+        'FEED_SIZE': '5',
+        'COMPRESS': 'gz, br,',
+        'BLOG_NAME': 'ブログ',
+        'HOME': '/root',
+    })
+    assert config.output_dir == '/srv/www'
+    assert config.feed_size == 5
+    assert config.compress == ('gz', 'br')
+    assert config.article_dir == './article'
+    assert config.site()['blog_name'] == 'ブログ'
+    assert config.environ()['COMPRESS'] == 'gz,br'
+    assert Config.parse(config.environ()) == config
+    assert Config.parse({'COMPRESS': ''}).compress == ()
+
+
+def test_parse_invalid():
+    """不正な値はビルドの前にエラーになることをテスト"""
+    with pytest.raises(ValueError, match='FEED_SIZE'):
+        Config.parse({'FEED_SIZE': 'many'})
+    with pytest.raises(ValueError, match='ARTICLES_PER_PAGE'):
+        Config.parse({'ARTICLES_PER_PAGE': '0'})
+    with pytest.raises(ValueError, match='SHARD_KEY'):
+        Config.parse({'SHARD_KEY': 'month'})
+
+
+def test_load(tmp_path, monkeypatch):
+    """環境変数が設定ファイルより優先され、override で逆になることをテスト"""
+    config_file = tmp_path / '.env'
+    config_file.write_text('OUTPUT_DIR=./file\nBLOG_NAME=ファイル\n', encoding='utf-8')
+    monkeypatch.setenv('OUTPUT_DIR', './env')
+    config = Config.load(str(config_file))
+    assert config.output_dir == './env'
+    assert config.blog_name == 'ファイル'
+    assert Config.load(str(config_file), override=True).output_dir == './file'
+    assert Config.load(str(tmp_path / 'missing.env')).output_dir == './env'
+
+
+def test_lazy_imports():
+    """起動時に Jinja2・Markdown・dotenv を読み込まないことをテスト"""
+    code = (
+        f'import sys; sys.path.insert(0, {NEMULOW_DIR!r}); import main; '
+        "print(' '.join(sorted({'jinja2', 'markdown', 'dotenv'} & set(sys.modules))))"
+    )
+    result = subprocess.run(  # nosec B603
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.strip() == ''
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bench')))
+
+from article import Article  # noqa: E402
+from corpus import generate  # noqa: E402
+
+
+def test_generated_corpus(tmp_path):
+    """同じシードなら同じ記事が生成され、すべて Nemulow 言語として読めることをテスト"""
+    paths = generate(str(tmp_path / 'a'), 30, seed=1)
+    again = generate(str(tmp_path / 'b'), 30, seed=1)
+    assert [os.path.basename(p) for p in paths] == [os.path.basename(p) for p in again]
+    for path, other in zip(paths, again):
+        with open(path, encoding='utf-8') as f, open(other, encoding='utf-8') as g:
+            assert f.read() == g.read()
+
+    for path in paths:
+        article = Article(path)
+        assert article.read()
+        excerpt, _ = article.render()
+        assert excerpt
+        assert '<!--' not in excerpt
+    # reused without writing again
+    assert generate(str(tmp_path / 'a'), 30, seed=1) == paths
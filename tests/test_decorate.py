@@ -0,0 +1,71 @@
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from decorate import Decorate  # noqa: E402
+
+
+def legacy_decorate(content: str) -> str:
+    """以前の re.sub の連鎖による実装"""
+    content = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content)
+    content = re.sub(r'\*(.*?)\*', r'<em>\1</em>', content)
+    content = re.sub(r'`(.*?)`', r'<code>\1</code>', content)
+    content = re.sub(r'~~(.*?)~~', r'<del>\1</del>', content)
+    content = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', content)
+    content = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', r'<img src="\2" alt="\1">', content)
+    content = re.sub(r'^#### +(.*?)$', r'<h4>\1</h4>', content, flags=re.MULTILINE)
+    content = re.sub(r'^### +(.*?)$', r'<h3>\1</h3>', content, flags=re.MULTILINE)
+    return content
+
+
+@pytest.mark.parametrize('content', [
+    'プレーンな文章。',
+    'This is **bold** text.',
+    'これは*強調*です。',
+    '次の `hoge` は固定幅になる。',
+    '~~取り消し~~',
+    '[リンク](https://example.com/)',
+    '![](image/sample.jpg)',
+    '### 見出し\n本文\n#### 小見出し',
+    '### **太字の見出し**',
+    '*a **b** c*',
+    '**a *b* c**',
+    '`**code**`',
+    '[**bold link**](https://example.com/)',
+    '1行目 **太字**\n2行目 *強調*\n3行目 `code` と ~~del~~',
+    '見出しは `### 見出し` と書く。',
+    '**### 太字**',
+    '[### link](https://example.com/)',
+    '### ### 見出し',
+    '#### ### 小見出し\n`#### code`',
+])
+def test_decorate_matches_legacy(content):
+    """単一パスの装飾が以前の実装と同じ出力になることをテスト"""
+    assert Decorate().decorate(content) == legacy_decorate(content)
+
+
+def test_decorate_image():
+    """画像はリンクより先に処理されることをテスト"""
+    result = Decorate().decorate('![代替テキスト](image/sample.jpg)')
+    assert result == '<img src="image/sample.jpg" alt="代替テキスト">'
+
+
+def test_decorate_extensions():
+    """SPEC.md の独自書式をテスト"""
+    decorator = Decorate()
+    assert decorator.decorate('***傍点***') == '<span class="boten">傍点</span>'
+    assert (
+        decorator.decorate('<color green>緑色</color>')
+        == '<span style="color: green;">緑色</span>'
+    )
+    assert (
+        decorator.decorate('<color #FFFFFF>白</color>')
+        == '<span style="color: #FFFFFF;">白</span>'
+    )
+    assert decorator.decorate('<mark pink>蛍光</mark>') == '<mark class="pink">蛍光</mark>'
+    # マーカーの色は決められたものだけ
+    assert decorator.decorate('<mark #FFFFFF>白</mark>') == '<mark #FFFFFF>白</mark>'
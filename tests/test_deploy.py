@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from deploy import LocalBackend, deploy  # noqa: E402
+from helpers import write  # noqa: E402
+
+
+def test_incremental_deploy(tmp_path):
+    """前回のデプロイからの差分だけ転送することをテスト"""
+    www = tmp_path / 'www'
+    remote = tmp_path / 'remote'
+    state = str(tmp_path / 'deployed.json')
+    backend = LocalBackend(str(remote))
+    write(www / 'index.html', 'index')
+    write(www / 'css' / 'sample.css', 'body {}')
+    write(www / 'article' / '2025' / '0824-a.html', 'a')
+
+    changes = deploy(str(www), backend, state)
+    assert changes.uploads == ['article/2025/0824-a.html', 'css/sample.css', 'index.html']
+    assert changes.deletions == []
+
+    # touching a file does not upload it again
+    os.utime(www / 'index.html', ns=(0, 0))
+    assert deploy(str(www), backend, state) == ([], [])
+
+    write(www / 'css' / 'sample.css', 'body { color: red; }')
+    os.remove(www / 'article' / '2025' / '0824-a.html')
+    assert deploy(str(www), backend, state, dry_run=True) == (
+        ['css/sample.css'], ['article/2025/0824-a.html']
+    )
+    changes = deploy(str(www), backend, state)
+    assert changes == (['css/sample.css'], ['article/2025/0824-a.html'])
+    assert not os.path.exists(remote / 'article' / '2025' / '0824-a.html')
+    with open(remote / 'css' / 'sample.css', encoding='utf-8') as f:
+        assert f.read() == 'body { color: red; }'
+
+
+def test_assets_before_pages(tmp_path):
+    """ハッシュ付きのアセットを、それを参照するページより先に転送することをテスト"""
+    www = tmp_path / 'www'
+    uploads = []
+
+    class RecordingBackend(LocalBackend):
+        def upload(self, root, path):
+            uploads.append(path)
+            super().upload(root, path)
+
+    write(www / 'index.html', 'index')
+    write(www / 'css' / 'main.0123456789.css', 'body{}')
+    write(www / 'css' / 'main.0123456789.css.gz', 'gz')
+    deploy(str(www), RecordingBackend(str(tmp_path / 'remote')), str(tmp_path / 'deployed.json'))
+    assert uploads[-1] == 'index.html'
+    assert sorted(uploads[:2]) == ['css/main.0123456789.css', 'css/main.0123456789.css.gz']
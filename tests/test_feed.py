@@ -0,0 +1,100 @@
+import os
+import sys
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from article import ArticleSummary  # noqa: E402
+from feed import generate_feeds, generate_sitemap, parse_date  # noqa: E402
+from fragments import FragmentCache  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from output import OutputWriter  # noqa: E402
+
+SITE = {'blog_name': '眠れない夜 & <ブログ>', 'blog_url': 'https://example.com/'}
+
+
+def _articles(count, updated=None):
+    """新しい順の記事と、その抜粋を入れたフラグメントキャッシュ"""
+    fragments = FragmentCache()
+    articles = []
+    for i in range(count, 0, -1):
+        key = f'key{i}'
+        fragments.put(key, {'excerpt': f'<p>本文{i}</p>', 'summary': f'要約{i}'})
+        articles.append(ArticleSummary(
+            f'2025{(i - 1) // 28 % 12 + 1:02d}{(i - 1) % 28 + 1:02d}', f'記事{i}',
+            f'2025/{i:04d}-a.html', '雑記, 食べ物', '', (updated or {}).get(i, ''), key, False,
+        ))
+    return articles, fragments
+
+
+def _build(tmp_path, articles, fragments, max_urls=50000):
+    manifest = BuildManifest(str(tmp_path / 'manifest.json'))
+    manifest.load()
+    writer = OutputWriter()
+    root = str(tmp_path / 'www')
+    os.makedirs(root, exist_ok=True)
+    generated = generate_feeds(root, articles, SITE, fragments, 2, manifest, writer)
+    generated += generate_sitemap(root, articles, SITE['blog_url'], manifest, writer, max_urls)
+    manifest.save()
+    return sorted(os.path.relpath(path, root) for path in generated)
+
+
+def test_parse_date():
+    """記事の日付と updated_at の書式を読めることをテスト"""
+    assert parse_date('20250824').isoformat() == '2025-08-24T00:00:00+09:00'
+    assert parse_date('2025/08/24 21:30').isoformat() == '2025-08-24T21:30:00+09:00'
+    assert parse_date('2025-08-24T10:00:00+09:00').isoformat() == '2025-08-24T10:00:00+09:00'
+    assert parse_date('') is None
+    assert parse_date('2025-13-01') is None
+
+
+def test_feeds(tmp_path):
+    """新しい記事の範囲が変わったときだけフィードを作り直すことをテスト"""
+    articles, fragments = _articles(3)
+    assert _build(tmp_path, articles, fragments) == ['atom.xml', 'rss.xml', 'sitemap.xml']
+    for name in ('atom.xml', 'rss.xml', 'sitemap.xml'):
+        xml.dom.minidom.parse(str(tmp_path / 'www' / name))
+    rss = (tmp_path / 'www' / 'rss.xml').read_text(encoding='utf-8')
+    assert '<title>眠れない夜 &amp; &lt;ブログ&gt;</title>' in rss
+    assert rss.count('<item>') == 2
+    assert '<category>食べ物</category>' in rss
+    assert '<description>要約3</description>' in rss
+    atom = (tmp_path / 'www' / 'atom.xml').read_text(encoding='utf-8')
+    assert '<content type="html">&lt;p&gt;本文3&lt;/p&gt;</content>' in atom
+
+    assert _build(tmp_path, articles, fragments) == []
+
+    # 範囲外の記事の更新はサイトマップだけを変える
+    articles, fragments = _articles(3, {1: '2025-09-01'})
+    assert _build(tmp_path, articles, fragments) == ['sitemap.xml']
+    articles, fragments = _articles(3, {3: '2025-09-01'})
+    assert _build(tmp_path, articles, fragments) == ['atom.xml', 'rss.xml', 'sitemap.xml']
+    atom = (tmp_path / 'www' / 'atom.xml').read_text(encoding='utf-8')
+    assert '<updated>2025-09-01T00:00:00+09:00</updated>' in atom
+    rss = (tmp_path / 'www' / 'rss.xml').read_text(encoding='utf-8')
+    assert '00:00:00 +0900</pubDate>' in rss
+
+
+def test_sitemap_index(tmp_path):
+    """URL 数が上限を超えるとサイトマップインデックスに分割することをテスト"""
+    articles, fragments = _articles(9)
+    # トップページ + 9 記事 = 10 URL
+    assert _build(tmp_path, articles, fragments, max_urls=4) == [
+        'atom.xml', 'rss.xml', 'sitemap-1.xml', 'sitemap-2.xml', 'sitemap-3.xml', 'sitemap.xml',
+    ]
+    index = (tmp_path / 'www' / 'sitemap.xml').read_text(encoding='utf-8')
+    assert '<sitemapindex' in index
+    assert '<loc>https://example.com/sitemap-3.xml</loc>' in index
+
+    # 新しい記事は最後のファイルだけを変える
+    articles, fragments = _articles(10)
+    assert _build(tmp_path, articles, fragments, max_urls=4) == [
+        'atom.xml', 'rss.xml', 'sitemap-3.xml', 'sitemap.xml',
+    ]
+
+    articles, fragments = _articles(2)
+    _build(tmp_path, articles, fragments, max_urls=4)
+    assert sorted(name for name in os.listdir(tmp_path / 'www') if name.startswith('sitemap')) == [
+        'sitemap.xml',
+    ]
+    assert '<urlset' in (tmp_path / 'www' / 'sitemap.xml').read_text(encoding='utf-8')
@@ -4,6 +4,7 @@ import pytest
 
 # Ensure the project package can be imported when running tests directly
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
 
 from nemulow.utils import (
     convert_markdown_to_html,
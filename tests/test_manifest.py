@@ -0,0 +1,73 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from helpers import write  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+from utils import generate_article_html, generate_index_html  # noqa: E402
+
+
+def _setup(tmp_path):
+    src_dir = tmp_path / 'src'
+    template_dir = tmp_path / 'templates'
+    src_dir.mkdir()
+    template_dir.mkdir()
+    write(src_dir / '20250101_first.md', '# first')
+    write(src_dir / '20250102_second.md', '# second')
+    write(template_dir / 'article.j2', '{% include "_head.j2" %}{{ article.content }}')
+    write(template_dir / 'index.j2', '{% include "_head.j2" %}index')
+    write(template_dir / '_head.j2', '<head></head>')
+    return src_dir, template_dir
+
+
+def _build(tmp_path, src_dir, template_dir, config=None):
+    manifest = BuildManifest(str(tmp_path / 'cache' / 'manifest.json'))
+    manifest.load()
+    manifest.set_config(config or {})
+    articles = sorted(os.listdir(src_dir))
+    html_dir = str(tmp_path / 'html')
+    written, _ = generate_article_html(
+        articles, str(src_dir), html_dir, str(template_dir / 'article.j2'), manifest=manifest
+    )
+    if generate_index_html(
+        html_dir,
+        str(template_dir / 'index.j2'),
+        manifest=manifest,
+        sources=[str(src_dir / article) for article in articles],
+    ):
+        written.append('index.html')
+    manifest.save()
+    return [os.path.basename(path) for path in written]
+
+
+def test_noop_build(tmp_path):
+    """変更がなければ何も生成しないことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    assert len(_build(tmp_path, src_dir, template_dir)) == 3
+    assert _build(tmp_path, src_dir, template_dir) == []
+
+
+def test_touch_does_not_rebuild(tmp_path):
+    """タイムスタンプだけの変更では再生成しないことをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    _build(tmp_path, src_dir, template_dir)
+    os.utime(src_dir / '20250101_first.md', ns=(0, 0))
+    assert _build(tmp_path, src_dir, template_dir) == []
+
+
+def test_source_edit_rebuilds_affected_pages(tmp_path):
+    """記事の変更でその記事とインデックスだけ再生成することをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    _build(tmp_path, src_dir, template_dir)
+    write(src_dir / '20250102_second.md', '# second (edited)')
+    assert _build(tmp_path, src_dir, template_dir) == ['20250102_second.html', 'index.html']
+
+
+def test_partial_and_config_edit_rebuild_all(tmp_path):
+    """部分テンプレートや設定の変更ですべて再生成することをテスト"""
+    src_dir, template_dir = _setup(tmp_path)
+    _build(tmp_path, src_dir, template_dir, {'BLOG_NAME': 'a'})
+    write(template_dir / '_head.j2', '<head><title></title></head>')
+    assert len(_build(tmp_path, src_dir, template_dir, {'BLOG_NAME': 'a'})) == 3
+    assert len(_build(tmp_path, src_dir, template_dir, {'BLOG_NAME': 'b'})) == 3
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from output import OutputWriter  # noqa: E402
+
+
+def test_write_if_changed(tmp_path):
+    """内容が同じなら書き込まないことをテスト"""
+    path = str(tmp_path / 'a' / 'index.html')
+    writer = OutputWriter()
+    assert writer.write(path, '<p>本文</p>')
+    os.utime(path, ns=(0, 0))
+
+    assert not writer.write(path, '<p>本文</p>')
+    assert os.stat(path).st_mtime_ns == 0
+
+    assert writer.write(path, '<p>本文!</p>')
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == '<p>本文!</p>'
+    assert writer.written == [path, path]
+    assert writer.skipped == 1
+    assert writer.report() == '2 files written, 1 unchanged.'
+    # no temporary files are left behind
+    assert os.listdir(tmp_path / 'a') == ['index.html']
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from cache import ArticleCache  # noqa: E402
+from helpers import write_article  # noqa: E402
+from manifest import BuildManifest  # noqa: E402
+import related  # noqa: E402
+from related import BINS, EMPTY, RelatedIndex, features, signature  # noqa: E402
+from utils import generate_article_html  # noqa: E402
+
+TOPICS = {
+    '猫': '猫の毛並みと肉球、爪研ぎ、猫舌、猫背、子猫の鳴き声、毛玉、猫缶、猫草、猫砂、キャットタワー',
+    'パン': 'パンの厚み、食パン、六枚切り、八枚切り、トースト、バター、小麦粉、酵母、焼き色、朝食',
+    '睡眠': '睡眠の質、寝不足、夜更かし、昼寝、枕、布団、寝返り、目覚まし、夢見、入眠儀式、深夜',
+}
+
+
+def _write(src_dir, n, topic, labels, extra=''):
+    return write_article(src_dir, n, f'{TOPICS[topic]}{extra}。', labels=labels)
+
+
+def _setup(tmp_path):
+    src_dir = tmp_path / 'src'
+    sources = []
+    for n, topic in enumerate(['猫', 'パン', '睡眠', '猫', 'パン', '睡眠', '猫', 'パン']):
+        labels = {'猫': '動物, 雑記', 'パン': '食べ物, 雑記', '睡眠': '睡眠'}[topic]
+        sources.append(_write(src_dir, n, topic, labels))
+    return src_dir, sources
+
+
+def _keys(sources):
+    keys = []
+    for source in sources:
+        with open(source, 'rb') as f:
+            keys.append((source, hashlib.sha256(f.read()).hexdigest()))
+    return keys
+
+
+def _lists(index):
+    return {
+        os.path.basename(source): [link['path'] for link in index.links(source)]
+        for source in index.docs
+    }
+
+
+def test_signature():
+    """同じ語の集合は同じシグネチャになり、語のないビンは空になることをテスト"""
+    assert signature(['猫舌', '毛並']) == signature(['毛並', '猫舌'])
+    assert signature([]) == bytes([0xff, 0xff]) * BINS
+    values = memoryview(signature(['猫舌'])).cast('H')
+    assert sorted(values)[1:] == [EMPTY] * (BINS - 1)
+
+
+def test_features(tmp_path):
+    """ラベルと本文の語から特徴を作り、Nemulow 以外の記事は除くことをテスト"""
+    src_dir, sources = _setup(tmp_path)
+    _, _, found, value = features((sources[0], 'key'))
+    assert found.labels == ('動物', '雑記')
+    assert found.path == '2025/0101-article-0.html'
+    assert value != signature([])
+    other = src_dir / 'plain.md'
+    other.write_text('# markdown\n', encoding='utf-8')
+    assert features((str(other), 'key'))[2] is None
+
+
+def test_related_articles(tmp_path, monkeypatch):
+    """同じ話題の記事が関連記事になり、NumPy の有無や LSH でも結果が揃うことをテスト"""
+    _, sources = _setup(tmp_path)
+    index = RelatedIndex(str(tmp_path / 'related.jsonl'), size=2)
+    index.refresh(_keys(sources))
+    lists = _lists(index)
+    assert sorted(lists['20250101_記事0.md']) == [
+        '2025/0104-article-3.html', '2025/0107-article-6.html',
+    ]
+    assert sorted(lists['20250102_記事1.md']) == [
+        '2025/0105-article-4.html', '2025/0108-article-7.html',
+    ]
+    assert {
+        'title': '記事3', 'path': '2025/0104-article-3.html', 'date': '20250104',
+    } in index.links(sources[0])
+    assert index.changed == set(sources)
+
+    # without NumPy, the postings find the same pairs
+    numpy = related._numpy
+    monkeypatch.setattr(related, '_numpy', lambda: None)
+    index = RelatedIndex(str(tmp_path / 'python.jsonl'), size=2)
+    index.refresh(_keys(sources))
+    assert _lists(index) == lists
+
+    # past EXACT_MAX, the candidates come from the bands and the labels
+    monkeypatch.setattr(related, 'EXACT_MAX', 0)
+    index = RelatedIndex(str(tmp_path / 'lsh.jsonl'), size=2)
+    index.refresh(_keys(sources))
+    assert _lists(index)['20250101_記事0.md'] == lists['20250101_記事0.md']
+
+    # with NumPy, the bands of a few articles are looked up in the signatures
+    monkeypatch.setattr(related, '_numpy', numpy)
+    scanned = RelatedIndex(str(tmp_path / 'scan.jsonl'), size=2)
+    scanned.refresh(_keys(sources))
+    assert _lists(scanned) == _lists(index)
+
+
+def test_article_cache(tmp_path, monkeypatch):
+    """記事キャッシュを通して読み、キャッシュにある記事は解析し直さないことをテスト"""
+    _, sources = _setup(tmp_path)
+    cache = ArticleCache(str(tmp_path / 'articles'))
+    index = RelatedIndex(str(tmp_path / 'related.jsonl'), size=2)
+    index.refresh(_keys(sources), cache=cache)
+    lists = _lists(index)
+    assert all(cache.get(key) is not None for _, key in _keys(sources))
+
+    monkeypatch.setattr(related.Article, 'read', None)
+    index = RelatedIndex(str(tmp_path / 'cached.jsonl'), size=2)
+    index.refresh(_keys(sources), jobs=2, cache=cache)
+    assert _lists(index) == lists
+
+
+def test_incremental_update(tmp_path, monkeypatch):
+    """変更した記事の分だけを計算し直し、最初から計算した結果と同じになることをテスト"""
+    src_dir, sources = _setup(tmp_path)
+    state = str(tmp_path / 'related.jsonl')
+    index = RelatedIndex(state, size=2)
+    assert not index.load()
+    index.refresh(_keys(sources))
+    index.save()
+
+    index = RelatedIndex(state, size=2)
+    assert index.load()
+    with monkeypatch.context() as patch:
+        # unchanged articles are not read again
+        patch.setattr(related, 'features', None)
+        index.refresh(_keys(sources))
+    assert index.changed == set()
+
+    # an article about bread becomes one about cats
+    sources[7] = _write(src_dir, 7, '猫', '動物, 雑記', extra='、猫の毛並み')
+    index.refresh(_keys(sources))
+    fresh = RelatedIndex(str(tmp_path / 'fresh.jsonl'), size=2)
+    fresh.refresh(_keys(sources))
+    assert _lists(index) == _lists(fresh)
+    assert sources[7] in index.changed
+    assert sources[2] not in index.changed
+    index.save()
+
+    # removed articles are dropped from the lists and their ids are used again
+    index = RelatedIndex(state, size=2)
+    assert index.load()
+    path = index.links(sources[0])[0]['path']
+    n = int(path[-6])
+    doc_id = index.docs[sources[n]]
+    os.remove(sources[n])
+    index.refresh(_keys(sources[:n] + sources[n + 1:]))
+    assert sources[0] in index.changed
+    assert path not in _lists(index)['20250101_記事0.md']
+    sources[n] = _write(src_dir, 8, 'パン', '食べ物')
+    index.refresh(_keys(sources))
+    assert index.docs[sources[n]] == doc_id
+    fresh = RelatedIndex(str(tmp_path / 'fresh2.jsonl'), size=2)
+    fresh.refresh(_keys(sources))
+    assert _lists(index) == _lists(fresh)
+
+    # another size starts again
+    assert not RelatedIndex(state, size=3).load()
+
+
+def test_article_pages(tmp_path):
+    """関連記事をテンプレートに渡し、一覧が変わったページだけを再生成することをテスト"""
+    src_dir, sources = _setup(tmp_path)
+    (tmp_path / 'templates').mkdir()
+    template = tmp_path / 'templates' / 'article.j2'
+    template.write_text(
+        '{% for r in article.related %}<a href="{{ r.path }}">{{ r.title }}</a>{% endfor %}',
+        encoding='utf-8',
+    )
+    index = RelatedIndex(str(tmp_path / 'related.jsonl'), size=2)
+
+    def build():
+        manifest = BuildManifest(str(tmp_path / 'manifest.db'))
+        manifest.load()
+        index.refresh((source, manifest.digest(source)) for source in sources)
+        written, _ = generate_article_html(
+            sorted(os.listdir(src_dir)), str(src_dir), str(tmp_path / 'html'), str(template),
+            manifest=manifest, related=index,
+        )
+        manifest.save()
+        return {os.path.basename(path) for path in written}
+
+    assert len(build()) == 8
+    with open(tmp_path / 'html' / '2025' / '0101-article-0.html', encoding='utf-8') as f:
+        assert '<a href="2025/0104-article-3.html">記事3</a>' in f.read()
+    assert build() == set()
+    sources[7] = _write(src_dir, 7, '猫', '動物, 雑記', extra='、猫の毛並み')
+    written = build()
+    assert '0108-article-7.html' in written and len(written) > 1
+    assert '0103-article-2.html' not in written
+    pages = {source: f'01{n + 1:02d}-article-{n}.html' for n, source in enumerate(sources)}
+    assert written == {'0108-article-7.html'} | {pages[source] for source in index.changed}
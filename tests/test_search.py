@@ -0,0 +1,160 @@
+import itertools
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from article import ArticleSummary  # noqa: E402
+from output import OutputWriter  # noqa: E402
+import search  # noqa: E402
+from search import DOCS_PER_CHUNK, SearchIndex, shard_of, tokenize  # noqa: E402
+
+
+def _summary(title, path, date='20250101'):
+    return ArticleSummary(date, title, path, key='key-' + path)
+
+
+def _search(directory, query):
+    """search.js と同じ手順でインデックスを引く"""
+    shards = len([name for name in os.listdir(directory) if name.startswith('shard-')])
+    with open(os.path.join(directory, 'search.js'), encoding='utf-8') as f:
+        config = f.readline()
+    deltas = []
+    for delta in json.loads(config.split('NEMULOW_SEARCH_DELTAS=')[1].rstrip(';\n')):
+        with open(os.path.join(directory, f'delta-{delta}.json'), encoding='utf-8') as f:
+            deltas.append(json.load(f))
+    # 後の差分で削除された番号
+    later, removed = [], set()
+    for delta in reversed(deltas):
+        later.insert(0, set(removed))
+        removed |= set(delta['removed'])
+    found = None
+    for term in tokenize(query):
+        if len(term) == 1 and len(query) > 1:
+            continue
+        with open(os.path.join(directory, f'shard-{shard_of(term, shards)}.json'),
+                  encoding='utf-8') as f:
+            ids = set(itertools.accumulate(json.load(f).get(term, []))) - removed
+        for delta, dropped in zip(deltas, later):
+            ids |= set(itertools.accumulate(delta['postings'].get(term, []))) - dropped
+        found = ids if found is None else found & ids
+    paths = []
+    for doc_id in sorted(found or ()):
+        with open(os.path.join(directory, f'docs-{doc_id // DOCS_PER_CHUNK}.json'),
+                  encoding='utf-8') as f:
+            paths.append(json.load(f)[doc_id % DOCS_PER_CHUNK][1])
+    return sorted(paths)
+
+
+def test_tokenize():
+    """NFKC で正規化した 1-gram と 2-gram に分割することをテスト"""
+    assert tokenize('ＡＢ 猫') == {'a', 'b', 'ab', '猫'}
+    assert tokenize('眠ろう。') == {'眠', 'ろ', 'う', '眠ろ', 'ろう'}
+    # marks are word characters, as in search.js
+    assert tokenize('กิน') == {'ก', 'ิ', 'น', 'กิ', 'ิน'}
+
+
+def test_shard_of():
+    """search.js と同じ FNV-1a (UTF-16) でシャードを決めることをテスト"""
+    assert shard_of('a', 2 ** 32) == 0xe40c292c
+    # サロゲートペアは 2 つのコード単位として扱う
+    assert shard_of('𠮷', 2 ** 32) != shard_of('吉', 2 ** 32)
+
+
+def test_incremental_update(tmp_path, monkeypatch):
+    """変更した記事は差分のファイルだけに書き、削除した記事を除くことをテスト"""
+    monkeypatch.setattr(search, 'DELTA_RATIO', 10)
+    state = str(tmp_path / 'search.json')
+    output = str(tmp_path / 'www')
+
+    index = SearchIndex(state, output, shards=8)
+    assert not index.load()
+    index.update('a.md', _summary('寝る前の読書', 'a.html'), tokenize('寝る前の読書'))
+    index.update('b.md', _summary('夜の散歩', 'b.html'), tokenize('夜の散歩'))
+    index.retain(['a.md', 'b.md'])
+    written = index.save(OutputWriter())
+    assert len(written) == 8 + 1
+    directory = os.path.join(output, 'search')
+    assert _search(directory, '読書') == ['a.html']
+    assert _search(directory, 'の') == ['a.html', 'b.html']
+    with open(os.path.join(directory, 'search.js'), encoding='utf-8') as f:
+        assert f.readline().startswith('var NEMULOW_SEARCH_SHARDS=8,')
+
+    index = SearchIndex(state, output, shards=8)
+    assert index.load()
+    index.update('b.md', _summary('夜の読書', 'b.html'), tokenize('夜の読書'))
+    index.retain(['a.md', 'b.md'])
+    written = index.save(OutputWriter())
+    # シャードは書き直さない
+    assert [os.path.basename(path) for path in written] == ['delta-0.json', 'docs-0.json']
+    assert _search(directory, '読書') == ['a.html', 'b.html']
+    assert _search(directory, '散歩') == []
+
+    index = SearchIndex(state, output, shards=8)
+    assert index.load()
+    index.retain(['b.md'])
+    index.update('c.md', _summary('昼寝', 'c.html'), tokenize('昼寝'))
+    index.save(OutputWriter())
+    assert _search(directory, '読書') == ['b.html']
+    # 削除した記事の番号を使い回す
+    assert _search(directory, '昼寝') == ['c.html']
+    assert index.docs['c.md'] == 0
+
+    # シャード数を変えると作り直す
+    index = SearchIndex(state, output, shards=4)
+    assert not index.load()
+
+
+def test_spill(tmp_path, monkeypatch):
+    """未書き込みの索引が上限を超えると一時ファイルに書き出し、保存時にまとめることをテスト"""
+    monkeypatch.setattr(search, 'SPILL_POSTINGS', 10)
+    output = str(tmp_path / 'www')
+    index = SearchIndex(str(tmp_path / 'search.json'), output, shards=4)
+    titles = ['寝る前の読書', '夜の散歩', '朝の読書', '昼寝の時間']
+    for i, title in enumerate(titles):
+        index.update(f'{i}.md', _summary(title, f'{i}.html'), tokenize(title))
+    assert index._spilled
+    index.save(OutputWriter())
+    directory = os.path.join(output, 'search')
+    assert _search(directory, '読書') == ['0.html', '2.html']
+    assert _search(directory, 'の') == ['0.html', '1.html', '2.html', '3.html']
+    assert not os.path.exists(tmp_path / 'search-runs')
+
+
+def test_deltas(tmp_path, monkeypatch):
+    """差分が増えると 1 つにまとめ、シャードの一定の割合を超えるとシャードに畳み込むことをテスト"""
+    monkeypatch.setattr(search, 'MAX_DELTAS', 2)
+    monkeypatch.setattr(search, 'DELTA_RATIO', 10)
+    state = str(tmp_path / 'search.json')
+    output = str(tmp_path / 'www')
+    directory = os.path.join(output, 'search')
+    titles = ['寝る前の読書', '夜の散歩', '朝の読書', '昼寝の時間']
+
+    def build(changes, retain=None):
+        index = SearchIndex(state, output, shards=4)
+        index.load()
+        for i, title in changes:
+            index.update(f'{i}.md', _summary(title, f'{i}.html'), tokenize(title))
+        index.retain(retain if retain is not None else index.docs)
+        index.save(OutputWriter())
+        return index, sorted(name for name in os.listdir(directory) if name.startswith('delta-'))
+
+    build(enumerate(titles))
+    assert build([(1, '夜の読書')])[1] == ['delta-0.json']
+    assert build([(2, '朝の散歩')], ['0.md', '1.md', '2.md'])[1] == ['delta-0.json', 'delta-1.json']
+    # 3 つ目の差分で前の 2 つとまとめる
+    index, deltas = build([(3, '昼の読書')])
+    assert deltas == ['delta-2.json'] and index.deltas[0][0] == 2
+    assert _search(directory, '読書') == ['0.html', '1.html', '3.html']
+    assert _search(directory, '散歩') == ['2.html']
+    assert _search(directory, '時間') == []
+
+    # 差分がシャードの索引の DELTA_RATIO を超えるとシャードに畳み込む
+    monkeypatch.setattr(search, 'DELTA_RATIO', 0.1)
+    index, deltas = build([(0, '朝の散歩と読書'), (2, '寝る前の散歩')])
+    assert deltas == [] and index.deltas == []
+    assert _search(directory, '読書') == ['0.html', '1.html', '3.html']
+    assert _search(directory, '散歩') == ['0.html', '2.html']
+    with open(os.path.join(directory, 'search.js'), encoding='utf-8') as f:
+        assert f.readline().endswith('NEMULOW_SEARCH_DELTAS=[];\n')
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from helpers import main_command, read_tree, write, write_article  # noqa: E402
+from shard import ShardSet, parse_shard, shard_of  # noqa: E402
+
+BODIES = ['猫の毛並みと肉球。', 'パンの厚みとトースト。', '睡眠の質と昼寝。']
+
+
+def _setup(tmp_path):
+    src_dir = tmp_path / 'src'
+    template_dir = tmp_path / 'templates'
+    for n in range(9):
+        _write(src_dir, n)
+    write(template_dir / 'article.j2',
+          '<h2>{{ article.title }}</h2>{{ article.content }}'
+          '{% for r in article.related %}<a href="/article/{{ r.path }}">{{ r.title }}</a>'
+          '{% endfor %}')
+    write(template_dir / 'index.j2',
+          '{{ page.title }}{% for a in articles %}<a href="{{ a.path }}">{{ a.excerpt }}</a>'
+          '{% endfor %}')
+    return src_dir, template_dir
+
+
+def _write(src_dir, n, extra=''):
+    labels = ['雑記', '食べ物, 雑記', '睡眠'][n % 3]
+    write_article(src_dir, n, f'{n} 番目の記事です。{BODIES[n % 3]}{extra}', '続きの文章。',
+                  date=f'{2022 + n % 3}{n + 1:02d}01', labels=labels)
+
+
+def _run(tmp_path, name, *args):
+    src_dir, template_dir = tmp_path / 'src', tmp_path / 'templates'
+    env = dict(
+        os.environ,
+        ARTICLE_DIR=str(src_dir),
+        TEMPLATE_DIR=str(template_dir),
+        OUTPUT_DIR=str(tmp_path / name),
+        CACHE_DIR=str(tmp_path / f'{name}-cache'),
+        BLOG_URL='https://example.com/',
+        SEARCH_SHARDS='4',
+        RELATED_SIZE='2',
+        COMPRESS='gz',
+    )
+    return subprocess.Popen(  # nosec B603
+        main_command(tmp_path, *args), env=env, stdout=subprocess.PIPE,
+    )
+
+
+def _wait(*processes):
+    for process in processes:
+        process.communicate()
+        assert process.returncode == 0
+
+
+def test_shard_of():
+    """記事は年またはハッシュで決まったシャードに割り当てられることをテスト"""
+    assert parse_shard('1/4') == (1, 4)
+    for value in ('4/4', '1', 'a/b'):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+    assert shard_of('20250101_記事.md', 4) == 2025 % 4
+    assert shard_of('20250101_記事.md', 4, 'hash') == shard_of('20250101_記事.md', 4, 'hash')
+    assert shard_of('記事.md', 4) == shard_of('記事.md', 4, 'hash')
+    with pytest.raises(ValueError):
+        shard_of('記事.md', 4, 'month')
+
+
+def test_merge_matches_full_build(tmp_path):
+    """別プロセスでビルドしたシャードをマージすると、全体のビルドと同じ出力になることをテスト"""
+    src_dir, _ = _setup(tmp_path)
+    _wait(_run(tmp_path, 'full', 'build'))
+    _wait(*[_run(tmp_path, f'shard-{n}', 'build', '--shard', f'{n}/3') for n in range(3)])
+    assert sorted(os.listdir(tmp_path / 'shard-0' / 'article')) == ['2022']
+    # the order of the directories does not matter
+    _wait(_run(tmp_path, 'merged', 'merge', *[str(tmp_path / f'shard-{n}') for n in (2, 0, 1)]))
+    merged = read_tree(tmp_path / 'merged')
+    assert merged == read_tree(tmp_path / 'full')
+    assert 'label/雑記/index.html' in merged and 'search/shard-0.json' in merged
+
+    # one article changes: only its shard writes files
+    _write(src_dir, 4, extra='猫の毛並み。')
+    _wait(_run(tmp_path, 'full', 'build'))
+    processes = [_run(tmp_path, f'shard-{n}', 'build', '--shard', f'{n}/3') for n in range(3)]
+    reports = [process.communicate()[0].decode('utf-8') for process in processes]
+    assert [report.startswith('0 files written') for report in reports] == [True, False, True]
+    process = _run(tmp_path, 'merged', 'merge', *[str(tmp_path / f'shard-{n}') for n in range(3)])
+    _wait(process)
+    assert read_tree(tmp_path / 'merged') == read_tree(tmp_path / 'full')
+
+    process = _run(tmp_path, 'merged', 'merge', *[str(tmp_path / f'shard-{n}') for n in range(3)])
+    output, _ = process.communicate()
+    assert output.decode('utf-8').strip().startswith('0 files written')
+
+
+def test_incomplete_shards(tmp_path):
+    """シャードが揃っていないときはマージしないことをテスト"""
+    _setup(tmp_path)
+    _wait(*[_run(tmp_path, f'shard-{n}', 'build', '--shard', f'{n}/2') for n in range(2)])
+    with pytest.raises(ValueError, match='not all the shards'):
+        ShardSet([str(tmp_path / 'shard-0')]).open()
+    with pytest.raises(ValueError, match='not the output of a shard'):
+        ShardSet([str(tmp_path / 'shard-0'), str(tmp_path / 'src')]).open()
+    with ShardSet([str(tmp_path / 'shard-1'), str(tmp_path / 'shard-0')]) as shards:
+        names = [record.name for record in shards.records()]
+        assert names == sorted(os.listdir(tmp_path / 'src'))
+        key = next(shards.records()).summary.key
+        assert '番目の記事です' in shards.fragments(key)['excerpt']
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+import stats  # noqa: E402
+from stats import BuildStats  # noqa: E402
+from utils import generate_article_html  # noqa: E402
+from test_build import _setup  # noqa: E402
+
+
+def test_disabled_stats_collect_nothing():
+    """無効なときは何も記録しないことをテスト"""
+    collector = BuildStats()
+    with collector.stage('read'):
+        pass
+    collector.count('articles.rendered')
+    collector.article('a.md', 1.0)
+    assert collector.take() is None
+    assert collector.report() == {'stages': {}, 'counters': {}, 'slowest_articles': []}
+
+
+def test_merge_and_report(tmp_path):
+    """ワーカーの計測結果をまとめ、遅い記事の順に報告することをテスト"""
+    worker = BuildStats(enabled=True)
+    worker.add('decorate', 0.5, calls=3)
+    worker.article('slow.md', 2.0)
+    worker.article('fast.md', 0.1)
+    collector = BuildStats(enabled=True)
+    collector.add('decorate', 0.25)
+    collector.merge(worker.take())
+    assert worker.take() == {'stages': {}, 'counters': {}, 'articles': {}}
+
+    collector.write_report(str(tmp_path / 'stats.json'), top=1)
+    with open(tmp_path / 'stats.json', encoding='utf-8') as f:
+        report = json.load(f)
+    assert report['stages']['decorate'] == {'calls': 4, 'seconds': 0.75}
+    assert report['slowest_articles'] == [{'source': 'slow.md', 'seconds': 2.0}]
+
+
+def test_build_stats(tmp_path, monkeypatch):
+    """並列ビルドでも各段階の時間と記事ごとの時間が集計されることをテスト"""
+    monkeypatch.setattr(stats, 'current', BuildStats(enabled=True))
+    src_dir, template_dir = _setup(tmp_path, count=4)
+    generate_article_html(
+        sorted(os.listdir(src_dir)), str(src_dir), str(tmp_path / 'out'),
+        str(template_dir / 'article.j2'), jobs=2,
+    )
+    report = stats.current.report()
+    for stage in ('read', 'paragraphize', 'decorate', 'template', 'write'):
+        assert report['stages'][stage]['calls'] > 0
+    assert report['counters']['articles.rendered'] == 4
+    assert len(report['slowest_articles']) == 4
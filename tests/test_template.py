@@ -0,0 +1,49 @@
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from helpers import write  # noqa: E402
+from template import TemplateRegistry  # noqa: E402
+
+
+def _setup(tmp_path):
+    template_dir = tmp_path / 'templates'
+    write(template_dir / 'article.j2', '{% include "_head.j2" %}{{ article.title }}')
+    write(template_dir / '_head.j2', '{{ blog_name }}:')
+    return template_dir
+
+
+def test_registry_compiles_once(tmp_path):
+    """テンプレートが一度だけコンパイルされることをテスト"""
+    template_dir = _setup(tmp_path)
+    registry = TemplateRegistry(str(template_dir), globals={'blog_name': 'ブログ'})
+    template = registry.get('article.j2')
+    assert registry.get('article.j2') is template
+    assert registry.render('article.j2', article={'title': '題名'}) == 'ブログ:題名'
+
+
+def test_registry_bytecode_cache(tmp_path):
+    """バイトコードキャッシュが保存されることをテスト"""
+    template_dir = _setup(tmp_path)
+    cache_dir = tmp_path / 'cache'
+    registry = TemplateRegistry(str(template_dir), str(cache_dir))
+    registry.load_all()
+    assert len(os.listdir(cache_dir)) == 2
+
+    # worker processes receive a copy which shares the bytecode cache
+    copy = pickle.loads(pickle.dumps(registry))
+    assert copy.render('article.j2', article={'title': 'a'}) == ':a'
+
+
+def test_registry_reloads_changed_template(tmp_path):
+    """テンプレートの変更が反映されることをテスト"""
+    template_dir = _setup(tmp_path)
+    registry = TemplateRegistry(str(template_dir), str(tmp_path / 'cache'))
+    assert registry.render('article.j2', article={'title': 'a'}) == ':a'
+    with open(template_dir / 'article.j2', 'w', encoding='utf-8') as f:
+        f.write('<h2>{{ article.title }}</h2>')
+    stat = os.stat(template_dir / 'article.j2')
+    os.utime(template_dir / 'article.j2', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert registry.render('article.j2', article={'title': 'a'}) == '<h2>a</h2>'
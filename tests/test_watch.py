@@ -0,0 +1,101 @@
+import http.client
+import os
+import sys
+import threading
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'nemulow')))
+
+from watch import PreviewServer, Watcher, _rebuild  # noqa: E402
+
+
+def test_watcher_reports_changed_files(tmp_path):
+    """変更されたファイルを検知することをテスト"""
+    watcher = Watcher([str(tmp_path)], interval=0.01)
+    try:
+        with open(tmp_path / 'a.md', 'w', encoding='utf-8') as f:
+            f.write('# nemulow v1')
+        assert watcher.wait(debounce=0.05) == {os.path.join(str(tmp_path), 'a.md')}
+    finally:
+        watcher.close()
+
+
+def test_watcher_reports_files_in_trees(tmp_path):
+    """ツリーとして監視するディレクトリでは、後から作ったサブディレクトリの変更も検知することをテスト"""
+    (tmp_path / 'css').mkdir()
+    watcher = Watcher([], interval=0.01, trees=[str(tmp_path)])
+    try:
+        (tmp_path / 'css' / 'main.css').write_text('a{}', encoding='utf-8')
+        assert watcher.wait(debounce=0.05) == {os.path.join(str(tmp_path), 'css', 'main.css')}
+        (tmp_path / 'image').mkdir()
+        (tmp_path / 'image' / 'logo.svg').write_text('<svg/>', encoding='utf-8')
+        path = os.path.join(str(tmp_path), 'image', 'logo.svg')
+        changed = watcher.wait(debounce=0.05)
+        while path not in changed:
+            changed = watcher.wait(debounce=0.05)
+        (tmp_path / 'image' / 'logo.svg').write_text('<svg></svg>', encoding='utf-8')
+        assert watcher.wait(debounce=0.05) == {path}
+    finally:
+        watcher.close()
+
+
+def test_rebuild_reports_errors(capsys):
+    """再ビルドが失敗してもエラーを表示して監視を続けることをテスト"""
+
+    class Failing:
+        config_file = '.env'
+
+        def reload_config(self, config_file, override=False):
+            raise ValueError('FEED_SIZE must be an integer')
+
+        def build(self, jobs=1, changed=None):
+            raise OSError('disk full')
+
+    assert _rebuild(Failing(), 1, reload=True) is None
+    assert _rebuild(Failing(), 1, {'a.md'}) is None
+    assert capsys.readouterr().err.splitlines() == [
+        'Build failed: ValueError: FEED_SIZE must be an integer',
+        'Build failed: OSError: disk full',
+    ]
+
+
+def test_preview_server_serves_from_memory(tmp_path):
+    """プレビューサーバがメモリから配信し、再ビルドで更新されることをテスト"""
+    with open(tmp_path / 'index.html', 'w', encoding='utf-8') as f:
+        f.write('<body>古い</body>')
+    server = PreviewServer(str(tmp_path), ('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    try:
+        assert '古い' in urllib.request.urlopen(url).read().decode('utf-8')
+        with open(tmp_path / 'index.html', 'w', encoding='utf-8') as f:
+            f.write('<body>新しい</body>')
+        # still served from memory until the rebuild reports the file
+        assert '古い' in urllib.request.urlopen(url).read().decode('utf-8')
+        server.invalidate([str(tmp_path / 'index.html')])
+        body = urllib.request.urlopen(url).read().decode('utf-8')
+        assert '新しい' in body
+        assert '/__nemulow/wait' in body
+        assert urllib.request.urlopen(url + '__nemulow/wait?v=0').read() == b'1'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_preview_server_stays_in_root(tmp_path):
+    """出力ディレクトリと名前の始まりが同じ隣のディレクトリは配信しないことをテスト"""
+    (tmp_path / 'www').mkdir()
+    (tmp_path / 'www-private').mkdir()
+    (tmp_path / 'www-private' / 'secret.txt').write_text('secret', encoding='utf-8')
+    server = PreviewServer(str(tmp_path / 'www'), ('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+        connection.request('GET', '/../www-private/secret.txt')
+        response = connection.getresponse()
+        assert response.status == 403
+        assert b'secret' not in response.read()
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()